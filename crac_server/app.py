@@ -12,13 +12,23 @@ if Device.pin_factory is not None:
 Device.pin_factory = MockFactory()
 
 
-from signal import signal, SIGTERM
+from signal import signal, SIGHUP, SIGTERM, SIGUSR1
 from concurrent import futures
+import asyncio
+from crac_server import log
 from crac_server.config import Config
+from crac_server.metrics import METRICS, MetricsServer
 from crac_server.service.button_service import ButtonService
+from crac_server.service.interceptor import AsyncMetricsInterceptor, MetricsInterceptor
 from crac_server.service.curtains_service import CurtainsService
+from crac_server.service.curtain_motion_service import CurtainMotionService, add_CurtainMotionServicer_to_server
+from crac_server.service.operation_service import OperationService, add_OperationServicer_to_server
 from crac_server.service.roof_service import RoofService
+from crac_server.service.sampler import SAMPLER
+from crac_server.service.tracking import TRACKER
 from crac_server.service.telescope_service import TelescopeService
+from crac_server.service.aio import AsyncServicer
+from crac_server.service.watch_service import AsyncWatchService, WatchService, add_WatchServicer_to_server
 from crac_protobuf.button_pb2_grpc import add_ButtonServicer_to_server
 from crac_protobuf.curtains_pb2_grpc import add_CurtainServicer_to_server
 from crac_protobuf.roof_pb2_grpc import add_RoofServicer_to_server
@@ -27,36 +37,170 @@ import grpc
 
 
 
+log.start(Config.getValue("sampling", "logging"), Config.getInt("queue_size", "logging"))
 logger = logging.getLogger('crac_server.app')
 
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+def add_servicers(server, wrap=lambda servicer: servicer, watch_service=None):
     add_ButtonServicer_to_server(
-        ButtonService(), server
+        wrap(ButtonService()), server
     )
     add_CurtainServicer_to_server(
-        CurtainsService(), server
+        wrap(CurtainsService()), server
     )
     add_RoofServicer_to_server(
-        RoofService(), server
+        wrap(RoofService()), server
     )
     add_TelescopeServicer_to_server(
-        TelescopeService(), server
+        wrap(TelescopeService()), server
+    )
+    add_OperationServicer_to_server(
+        wrap(OperationService()), server
+    )
+    add_CurtainMotionServicer_to_server(
+        wrap(CurtainMotionService()), server
+    )
+    add_WatchServicer_to_server(
+        watch_service or WatchService(Config.getFloat("watch_interval", "server"), Config.getInt("max_watch_streams", "server")), server
     )
+
+
+def reload_config(*_):
+    logger.info("Received reload signal")
+    try:
+        Config.reload()
+    except Exception:
+        logger.exception("Configuration not reloaded, keeping the previous one")
+
+
+def start_metrics() -> MetricsServer | None:
+    port = Config.getInt("port", "metrics")
+    if not port:
+        return None
+    try:
+        metrics_server = MetricsServer(METRICS, Config.getValue("address", "metrics"), port)
+    except OSError as err:
+        logger.error("Metrics not served, port %s not available: %s", port, err)
+        return None
+    metrics_server.start()
+    return metrics_server
+
+
+def dump_metrics(*_):
+    path = Config.getValue("dump_file", "metrics")
+    if not path:
+        return
+    try:
+        METRICS.dump(path)
+    except OSError:
+        logger.exception("Metrics not written to %s", path)
+
+
+def server_options() -> list[tuple[str, int]]:
+    return [
+        ("grpc.keepalive_time_ms", Config.getInt("keepalive_time_ms", "server")),
+        ("grpc.keepalive_timeout_ms", Config.getInt("keepalive_timeout_ms", "server")),
+        ("grpc.keepalive_permit_without_calls", Config.getInt("keepalive_permit_without_calls", "server")),
+        ("grpc.http2.min_ping_interval_without_data_ms", Config.getInt("min_ping_interval_without_data_ms", "server")),
+        ("grpc.http2.max_ping_strikes", Config.getInt("max_ping_strikes", "server")),
+        ("grpc.max_receive_message_length", Config.getInt("max_receive_message_length", "server")),
+        ("grpc.max_send_message_length", Config.getInt("max_send_message_length", "server")),
+    ]
+
+
+def server_settings() -> dict:
+
+    """ Keyword arguments of grpc.server and grpc.aio.server from the [server] section """
+
+    return {
+        "options": server_options(),
+        "maximum_concurrent_rpcs": Config.getInt("maximum_concurrent_rpcs", "server") or None,
+        "compression": {
+            "none": grpc.Compression.NoCompression,
+            "gzip": grpc.Compression.Gzip,
+            "deflate": grpc.Compression.Deflate,
+        }[Config.getValue("compression", "server").lower()],
+    }
+
+
+def add_ports(server) -> None:
     server.add_insecure_port(f'{Config.getValue("loopback_ip", "server")}:{Config.getValue("port", "server")}')
+    unix_socket = Config.getValue("unix_socket", "server")
+    if unix_socket:
+        server.add_insecure_port(f"unix:{unix_socket}")
+        logger.info("Listening on %s", unix_socket)
+
+
+def serve():
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=Config.getInt("max_workers", "server")),
+        interceptors=(MetricsInterceptor(),),
+        **server_settings()
+    )
+    add_servicers(server)
+    add_ports(server)
     server.start()
-    logger.info(f'Server loaded on port {Config.getValue("port", "server")}')
+    SAMPLER.start()
+    TRACKER.start()
+    metrics_server = start_metrics()
+    logger.info('Server loaded on port %s', Config.getValue("port", "server"))
 
     def handle_sigterm(*_):
         logger.info("Received shutdown signal")
+        TRACKER.stop()
+        SAMPLER.stop()
         all_rpcs_done_event = server.stop(30)
         all_rpcs_done_event.wait(30)
+        dump_metrics()
+        if metrics_server:
+            metrics_server.stop()
         logger.info("Shut down gracefully")
 
     signal(SIGTERM, handle_sigterm)
+    signal(SIGHUP, reload_config)
+    signal(SIGUSR1, dump_metrics)
     server.wait_for_termination()
 
 
+async def serve_aio():
+
+    """
+        Same services on a grpc.aio server: the event loop only dispatches the calls,
+        the blocking device I/O of every service runs in a thread pool of its own
+    """
+
+    server = grpc.aio.server(interceptors=(AsyncMetricsInterceptor(),), **server_settings())
+    add_servicers(
+        server,
+        wrap=lambda servicer: AsyncServicer.offload(servicer, Config.getInt("aio_workers", "server")),
+        watch_service=AsyncWatchService(Config.getFloat("watch_interval", "server"))
+    )
+    add_ports(server)
+    await server.start()
+    SAMPLER.start()
+    TRACKER.start()
+    metrics_server = start_metrics()
+    logger.info('Asyncio server loaded on port %s', Config.getValue("port", "server"))
+
+    async def shutdown():
+        logger.info("Received shutdown signal")
+        TRACKER.stop()
+        SAMPLER.stop()
+        await server.stop(30)
+        dump_metrics()
+        if metrics_server:
+            metrics_server.stop()
+        logger.info("Shut down gracefully")
+
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(SIGTERM, lambda: asyncio.ensure_future(shutdown()))
+    loop.add_signal_handler(SIGHUP, reload_config)
+    loop.add_signal_handler(SIGUSR1, dump_metrics)
+    await server.wait_for_termination()
+
+
 if __name__ == "__main__":
-    serve()
+    if Config.getValue("mode", "server") == "aio":
+        asyncio.run(serve_aio())
+    else:
+        serve()
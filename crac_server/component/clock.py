@@ -0,0 +1,154 @@
+import heapq
+import itertools
+import logging
+import threading
+from time import monotonic, sleep, time
+from typing import Callable
+from crac_server.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+
+class Clock:
+
+    """
+        The time of the simulators, speed times faster than the wall clock:
+        sleep(10) waits 10 / speed seconds.
+        call_later runs a callback after a delay of simulated time,
+        in order of deadline, on the thread of the clock
+    """
+
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self.__origin__ = monotonic()
+        self.__unix__ = time()
+        self.__queue__: list[tuple[float, int, Callable, tuple]] = []
+        self.__sequence__ = itertools.count()
+        self.__condition__ = threading.Condition()
+        self.__thread__: threading.Thread = None
+
+    def now(self) -> float:
+        return (monotonic() - self.__origin__) * self.speed
+
+    def sleep(self, seconds: float) -> None:
+        sleep(seconds / self.speed)
+
+    def to_unix(self, instant: float) -> float:
+
+        """ The unix time at which the clock read instant """
+
+        return self.__unix__ + instant / self.speed
+
+    def call_later(self, delay: float, callback: Callable, *args) -> None:
+        with self.__condition__:
+            heapq.heappush(self.__queue__, (self.now() + delay, next(self.__sequence__), callback, args))
+            if self.__thread__ is None:
+                self.__thread__ = threading.Thread(target=self.__run__, name="clock", daemon=True)
+                self.__thread__.start()
+            self.__condition__.notify()
+
+    def __run__(self):
+        while True:
+            with self.__condition__:
+                while not self.__queue__ or self.__queue__[0][0] > self.now():
+                    timeout = (self.__queue__[0][0] - self.now()) / self.speed if self.__queue__ else None
+                    self.__condition__.wait(timeout)
+                _, _, callback, args = heapq.heappop(self.__queue__)
+            try:
+                callback(*args)
+            except Exception:
+                logger.exception("Error in the simulator callback %s", callback)
+
+
+class VirtualClock(Clock):
+
+    """
+        Simulated time that moves only when advance() or step() are called:
+        the callbacks due are run in order by the caller, with now() set to their deadline,
+        and the threads in sleep() wake up when the time reaches the end of their sleep.
+        A night of operations takes as long as its callbacks
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.__now__ = 0.0
+        self.__lock__ = threading.Condition()
+        self.__queue__: list[tuple[float, int, Callable, tuple]] = []
+        self.scheduled = 0
+
+    def now(self) -> float:
+        return self.__now__
+
+    def to_unix(self, instant: float) -> float:
+
+        """ The unix time of instant, as if the simulated time had started with the clock """
+
+        return self.__unix__ + instant
+
+    def sleep(self, seconds: float) -> None:
+        woken = threading.Event()
+        self.call_later(seconds, woken.set)
+        woken.wait()
+
+    def call_later(self, delay: float, callback: Callable, *args) -> None:
+        with self.__lock__:
+            heapq.heappush(self.__queue__, (self.__now__ + delay, next(self.__sequence__), callback, args))
+            self.scheduled += 1
+            self.__lock__.notify_all()
+
+    def wait_scheduled(self, since: int, timeout: float) -> bool:
+
+        """
+            Wait for a callback scheduled after the first since ones (see scheduled),
+            e.g. by a thread that is going to wait for the simulated hardware
+        """
+
+        with self.__lock__:
+            return self.__lock__.wait_for(lambda: self.scheduled > since, timeout)
+
+    @property
+    def pending(self) -> int:
+        return len(self.__queue__)
+
+    def next_deadline(self) -> float | None:
+        with self.__lock__:
+            return self.__queue__[0][0] if self.__queue__ else None
+
+    def step(self) -> bool:
+
+        """ Jump to the next deadline and run its callback, False if nothing is scheduled """
+
+        with self.__lock__:
+            if not self.__queue__:
+                return False
+            deadline, _, callback, args = heapq.heappop(self.__queue__)
+            self.__now__ = max(self.__now__, deadline)
+        callback(*args)
+        return True
+
+    def advance(self, seconds: float) -> None:
+
+        """ Run the callbacks due in the next seconds, then move the time to their end """
+
+        end = self.__now__ + seconds
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > end:
+                break
+            self.step()
+        self.__now__ = max(self.__now__, end)
+
+
+def from_config() -> Clock:
+
+    """ The clock of [simulator]: speed times the wall clock, or virtual when speed is 0 """
+
+    speed = Config.getFloat("clock_speed", "simulator")
+    if not speed:
+        logger.info("Simulators on a virtual clock")
+        return VirtualClock()
+    return Clock(speed)
+
+
+CLOCK = from_config()
@@ -1,11 +1,16 @@
 import logging
 import threading
+from time import monotonic, time
 from gpiozero import RotaryEncoder, DigitalInputDevice, Motor
-from config import Config
+from crac_server.component.curtains.journal import EncoderJournal
+from crac_server.config import Config
+from crac_server.metrics import METRICS
 from crac_protobuf.curtains_pb2 import CurtainStatus
 
 
 logger = logging.getLogger(__name__)
+# weight of the last edge in the estimate of the time between two edges
+EDGE_SMOOTHING = 0.3
 
 
 class Curtain:
@@ -19,13 +24,18 @@ class Curtain:
         self.__event_detect__()
         self.lock = threading.Lock()
         self.to_disable = False
+        self.__reset_aborted__ = threading.Event()
 
     def __base__(self):
         self.__sub_min_step__ = -5
         self.__min_step__ = 0
         self.__max_step__ = Config.getInt("n_step_corsa", "encoder_step")
         self.__security_step__ = Config.getInt("n_step_sicurezza", "encoder_step")
+        self.__stop_latency__ = Config.getFloat("stop_latency", "encoder_step")
+        self.__stall_timeout__ = Config.getFloat("stall_timeout", "encoder_step")
+        self.journal = EncoderJournal(Config.getInt("journal_size", "encoder_step"))
         self.target = None
+        self.__plan__(0, None)
 
     def __event_detect__(self):
         self.curtain_closed.when_activated = self.__reset_steps__
@@ -37,6 +47,18 @@ class Curtain:
         self.curtain_closed.when_activated = None
         self.curtain_open.when_activated = None
 
+    def __now__(self) -> float:
+
+        """ Seconds of the clock timing the encoder edges, the simulators use their own """
+
+        return monotonic()
+
+    def to_unix(self, instant: float) -> float:
+
+        """ The unix time of an instant of __now__(), e.g. of an edge of the journal """
+
+        return instant + time() - monotonic()
+
     def __open__(self):
         with self.lock:
             self.motor.forward()
@@ -49,29 +71,83 @@ class Curtain:
         with self.lock:
             self.motor.stop()
 
+    def __plan__(self, steps: int, target: int | None):
+
+        """
+            Precompute the stop thresholds of a movement from steps to target:
+            the motor is stopped when the projected position reaches upper or lower.
+            A target at an end of the travel isn't projected, the motor runs until
+            the limit switch stops it
+        """
+
+        if target is None:
+            self.__direction__ = 0
+            self.__upper__ = float("-inf")
+            self.__lower__ = float("inf")
+        elif target >= self.__max_step__ or target <= self.__min_step__:
+            self.__direction__ = 0
+            self.__upper__ = float("inf")
+            self.__lower__ = float("-inf")
+        elif target > steps:
+            self.__direction__ = 1
+            self.__upper__ = target
+            self.__lower__ = float("-inf")
+        else:
+            self.__direction__ = -1
+            self.__upper__ = float("inf")
+            self.__lower__ = target
+        self.__edge_interval__ = 0.0
+        self.__last_edge__ = self.__now__()
+        self.__started__ = (self.__last_edge__, steps)
+
     def __check_and_stop__(self):
-        logger.debug("Number of steps: %s", self.steps())
-        logger.debug("target: %s", self.target)
+
+        """
+            Called on every encoder edge.
+            The position is projected ahead of the steps the curtain still travels
+            after the stop command (stop_latency seconds at the current speed,
+            estimated from the time between the edges), so the motor is cut early
+            enough to land on an intermediate target instead of overshooting it.
+            The security steps are checked on the steps read from the encoder
+        """
+
+        steps = self.rotary_encoder.steps
+        now = self.__now__()
+        self.journal.record(now, steps)
+        interval = max(now - self.__last_edge__, 1e-6)
+        self.__last_edge__ = now
+        if self.__edge_interval__:
+            interval = self.__edge_interval__ + (interval - self.__edge_interval__) * EDGE_SMOOTHING
+        self.__edge_interval__ = interval
+        projected = steps + self.__direction__ * self.__stop_latency__ / interval
+        logger.debug("Number of steps: %s, target: %s", steps, self.target)
         if (
-            self.target is None or
-            self.steps() == self.target or
-            self.steps() >= self.__security_step__ or
-            self.steps() <= self.__sub_min_step__ or
+            projected >= self.__upper__ or
+            projected <= self.__lower__ or
+            steps >= self.__security_step__ or
+            steps <= self.__sub_min_step__ or
             not self.motor.enable_device.value
         ):
-            self.__stop__()
-            self.target = None
-            if self.to_disable:
-                self.disable_motor()
-                
+            self.__halt__(steps)
 
-    def __reset_steps__(self, open_or_closed):
+    def __halt__(self, steps: int):
         self.__stop__()
+        self.target = None
+        self.__plan__(steps, None)
+        if self.to_disable:
+            self.disable_motor()
+
+    def __record_edge__(self):
+        now = self.__now__()
+        self.journal.record(now, self.rotary_encoder.steps)
+        self.__last_edge__ = now
 
+    def __reset_steps__(self, open_or_closed):
         if open_or_closed == self.curtain_open:
             self.rotary_encoder.steps = self.__max_step__
         elif open_or_closed == self.curtain_closed:
             self.rotary_encoder.steps = self.__min_step__
+        self.__halt__(self.rotary_encoder.steps)
 
     def __is_danger__(self):
         return (
@@ -98,43 +174,107 @@ class Curtain:
     def __is_stopped__(self) -> bool:
         return not self.curtain_closed.is_active and not self.curtain_open.is_active and not self.motor.value
 
-    def manual_reset(self):
+    def manual_reset(self, timeout: float | None = None) -> bool | None:
 
-        """ Reset the steps counter with the help of the edge switchers """
+        """
+            Reset the steps counter with the help of the edge switchers.
+            Return True if the counter has been reset, False if the reset has been aborted
+            (see abort_reset()) and None if it has been skipped because the curtain
+            is disabled or not stopped.
+            Raise TimeoutError if the switch isn't reached within timeout seconds
+        """
 
         if not self.motor.enable_device.value:
-            return
+            return None
 
         status = self.get_status()
         if status != CurtainStatus.CURTAIN_STOPPED and status != CurtainStatus.CURTAIN_DANGER:
-            return
+            return None
+        self.__reset_aborted__.clear()
         self.__remove_event_detect__()
+        self.__last_edge__ = self.__now__()
+        self.rotary_encoder.when_rotated = self.__record_edge__
 
         distance_to_min_step = abs(self.steps() - self.__min_step__)
         distance_to_max_step = abs(self.__max_step__ - self.steps())
 
-        if distance_to_min_step <= distance_to_max_step:
-            if self.steps() > self.__min_step__:
-                self.__close__()
+        try:
+            if distance_to_min_step <= distance_to_max_step:
+                if self.steps() > self.__min_step__:
+                    self.__close__()
+                else:
+                    self.__open__()
+                reached = self.__wait_for_switch__(self.curtain_closed, timeout)
+                self.__stop__()
+                if reached:
+                    self.rotary_encoder.steps = self.__min_step__
             else:
-                self.__open__()
-            self.curtain_closed.wait_for_active()
+                if self.steps() > self.__max_step__:
+                    self.__close__()
+                else:
+                    self.__open__()
+                reached = self.__wait_for_switch__(self.curtain_open, timeout)
+                self.__stop__()
+                if reached:
+                    self.rotary_encoder.steps = self.__max_step__
+        except TimeoutError:
             self.__stop__()
-            self.rotary_encoder.steps = self.__min_step__
-        else:
-            if self.steps() > self.__max_step__:
-                self.__close__()
-            else:
-                self.__open__()
-            self.curtain_open.wait_for_active()
-            self.__stop__()
-            self.rotary_encoder.steps = self.__max_step__
-
-        self.__event_detect__()
+            raise
+        finally:
+            self.__event_detect__()
+        return reached
+
+    def abort_reset(self):
+
+        """ Stop a running manual_reset, the steps counter is left as it is """
+
+        self.__reset_aborted__.set()
+
+    def __wait_for_switch__(self, switch: DigitalInputDevice, timeout: float | None = None) -> bool:
+        name = "closed" if switch is self.curtain_closed else "open"
+        deadline = self.__now__() + timeout if timeout else float("inf")
+        with METRICS.timer("crac_gpio_wait_seconds", device="curtain", switch=name):
+            while not switch.wait_for_active(timeout=0.1):
+                if self.__reset_aborted__.is_set():
+                    logger.warning("Curtain reset aborted at step %s", self.steps())
+                    return False
+                if self.__now__() > deadline:
+                    logger.error("Curtain %s switch not reached in %s s, stopped at step %s", name, timeout, self.steps())
+                    raise TimeoutError(f"{name} switch not reached in {timeout} s")
+            return True
 
     def steps(self) -> int:
         return self.rotary_encoder.steps
 
+    def motion(self) -> dict:
+
+        """
+            The movement of the curtain estimated from the journal of the encoder:
+            velocity in steps per second (negative while closing), eta in seconds to the target
+            (0 when not moving to a target, -1 when not yet known) and stalled, True when the motor runs
+            but the encoder has had no edges for stall_timeout seconds
+        """
+
+        now = self.__now__()
+        steps = self.steps()
+        target = self.target
+        running = bool(self.motor.value)
+        start = self.__started__ if target is not None else None
+        velocity = self.journal.velocity(now, idle=self.__stall_timeout__, start=start) if running else 0.0
+        eta = 0.0
+        if running and target is not None:
+            eta = -1.0
+            last = self.journal.last()
+            if velocity and (target - steps) * velocity > 0 and last:
+                eta = max((target - steps) / velocity - (now - last[0]), 0.0)
+        return {
+            "steps": steps,
+            "target": target,
+            "velocity": velocity,
+            "eta": eta,
+            "stalled": running and now - self.__last_edge__ > self.__stall_timeout__,
+        }
+
     def get_status(self) -> CurtainStatus:
 
         """ Read the status of the curtain based on the pin of motor, encoder and switches """
@@ -174,11 +314,13 @@ class Curtain:
             return
 
         self.target = step
+        steps = self.steps()
+        self.__plan__(steps, step)
 
         # deciding the movement direction
-        if self.steps() < self.target:
+        if steps < self.target:
             self.__open__()
-        elif self.steps() > self.target:
+        elif steps > self.target:
             self.__close__()
 
     def open_up(self):
@@ -202,16 +344,16 @@ class Curtain:
             self.disable_motor()
 
     def disable(self):
-        logger.debug(f"self.to_disable is {self.to_disable}")
+        logger.debug("self.to_disable is %s", self.to_disable)
         if not self.__is_opening__() and not self.__is_closing__():
             self.to_disable = True
             self.bring_down()
-            logger.debug(f"self.to_disable after bring down is {self.to_disable}")
+            logger.debug("self.to_disable after bring down is %s", self.to_disable)
 
     def enable(self):
-        logger.debug(f"motor is {self.motor.enable_device.value}")
+        logger.debug("motor is %s", self.motor.enable_device.value)
         self.motor.enable_device.on()
-        logger.debug(f"motor after enabling is {self.motor.enable_device.value}")
+        logger.debug("motor after enabling is %s", self.motor.enable_device.value)
 
     def disable_motor(self):
 
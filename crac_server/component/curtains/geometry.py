@@ -0,0 +1,184 @@
+import logging
+import threading
+from bisect import bisect_right
+import numpy as np
+from crac_server.config import Config, ConfigSnapshot
+
+
+logger = logging.getLogger(__name__)
+
+
+class Profile:
+
+    """
+        Piecewise-linear calibration of a curtain: the steps at which the curtain covers
+        the telescope at each altitude of the knots, linearly interpolated between them.
+        Below the first knot and above the last one the steps of the nearest knot are used
+    """
+
+    def __init__(self, knots: list[tuple[float, int]]):
+        if len(knots) < 2:
+            raise ValueError(f"A curtain profile needs at least two knots: {knots}")
+        alts = [float(alt) for alt, _ in knots]
+        if any(low >= high for low, high in zip(alts, alts[1:])):
+            raise ValueError(f"The altitudes of a curtain profile must be increasing: {knots}")
+        self.alts = alts
+        self.steps = [float(step) for _, step in knots]
+        self.slopes = [
+            (self.steps[i + 1] - self.steps[i]) / (alts[i + 1] - alts[i]) for i in range(len(alts) - 1)
+        ]
+        self.__alts__ = np.array(self.alts)
+        self.__steps__ = np.array(self.steps)
+
+    def at(self, alt: float) -> int:
+        if alt <= self.alts[0]:
+            return round(self.steps[0])
+        if alt >= self.alts[-1]:
+            return round(self.steps[-1])
+        i = bisect_right(self.alts, alt) - 1
+        return round(self.steps[i] + self.slopes[i] * (alt - self.alts[i]))
+
+    def at_many(self, alt: np.ndarray) -> np.ndarray:
+        return np.rint(np.interp(alt, self.__alts__, self.__steps__)).astype(int)
+
+    @staticmethod
+    def parse(knots: str) -> list[tuple[float, int]]:
+
+        """ "alt:step, alt:step" to [(alt, step)] """
+
+        parsed = []
+        for item in knots.split(","):
+            if item.strip():
+                alt, _, step = item.strip().partition(":")
+                parsed.append((float(alt), int(step)))
+        return parsed
+
+
+class CurtainGeometry:
+
+    """
+        Map the altazimuthal position of the telescope to the (east, west) steps of the curtains.
+        It's built once: the limits of the curtains area and the profiles are precomputed,
+        a position costs a few comparisons and a bisection of the profile.
+        In front of a curtain (azimuth between azNE and azSE for the east one,
+        between azSW and azNW for the west one) that curtain follows its profile and the other
+        is fully open; below max_secure_alt both are closed, above the area (or out of the
+        azimuth of both the curtains) both are fully open
+    """
+
+    def __init__(
+        self,
+        n_step_corsa: int,
+        max_secure_alt: float,
+        max_est: float,
+        max_west: float,
+        az_ne: float,
+        az_se: float,
+        az_sw: float,
+        az_nw: float,
+        profile_est: Profile,
+        profile_west: Profile,
+    ):
+        self.n_step_corsa = n_step_corsa
+        self.max_secure_alt = max_secure_alt
+        self.max_alt = max(max_est, max_west)
+        self.az_ne = az_ne
+        self.az_se = az_se
+        self.az_sw = az_sw
+        self.az_nw = az_nw
+        self.profile_est = profile_est
+        self.profile_west = profile_west
+
+    def steps(self, alt: float, az: float) -> tuple[int, int]:
+        if alt <= self.max_secure_alt:
+            return 0, 0
+        if alt >= self.max_alt:
+            return self.n_step_corsa, self.n_step_corsa
+        if self.az_ne <= az <= self.az_se:
+            return self.profile_est.at(alt), self.n_step_corsa
+        if self.az_sw < az <= self.az_nw:
+            return self.n_step_corsa, self.profile_west.at(alt)
+        return self.n_step_corsa, self.n_step_corsa
+
+    def steps_many(self, alt: np.ndarray, az: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+
+        """ steps() of arrays of positions, e.g. of a planned path of the telescope """
+
+        alt = np.asarray(alt, dtype=float)
+        az = np.asarray(az, dtype=float)
+        east = np.full(alt.shape, self.n_step_corsa)
+        west = np.full(alt.shape, self.n_step_corsa)
+        within = (alt > self.max_secure_alt) & (alt < self.max_alt)
+        facing_east = within & (self.az_ne <= az) & (az <= self.az_se)
+        facing_west = within & (self.az_sw < az) & (az <= self.az_nw)
+        east[facing_east] = self.profile_est.at_many(alt[facing_east])
+        west[facing_west] = self.profile_west.at_many(alt[facing_west])
+        below = alt <= self.max_secure_alt
+        east[below] = 0
+        west[below] = 0
+        return east, west
+
+    @staticmethod
+    def from_config() -> "CurtainGeometry":
+
+        """
+            The geometry of config.ini. Without the profilo_est and profilo_west knots
+            a curtain opens linearly from park_est/park_west to max_est/max_west
+        """
+
+        n_step_corsa = Config.getInt("n_step_corsa", "encoder_step")
+        profiles = []
+        for side in ("est", "west"):
+            try:
+                knots = Profile.parse(Config.getValue(f"profilo_{side}", "tende"))
+            except KeyError:
+                knots = []
+            if not knots:
+                knots = [(Config.getFloat(f"park_{side}", "tende"), 0), (Config.getFloat(f"max_{side}", "tende"), n_step_corsa)]
+            profiles.append(Profile(knots))
+        geometry = CurtainGeometry(
+            n_step_corsa,
+            Config.getFloat("max_secure_alt", "telescope"),
+            Config.getFloat("max_est", "tende"),
+            Config.getFloat("max_west", "tende"),
+            Config.getFloat("azNE", "azimut"),
+            Config.getFloat("azSE", "azimut"),
+            Config.getFloat("azSW", "azimut"),
+            Config.getFloat("azNW", "azimut"),
+            *profiles,
+        )
+        logger.debug("Curtain profiles: east %s, west %s", profiles[0].alts, profiles[1].alts)
+        return geometry
+
+
+class ConfiguredGeometry:
+
+    """
+        The CurtainGeometry of the current configuration, built again from config.ini
+        the first time it's used after a Config.reload(). If the reloaded configuration
+        doesn't give a valid geometry the previous one is kept
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.__snapshot__: ConfigSnapshot = Config.snapshot
+        self.__geometry__ = CurtainGeometry.from_config()
+
+    def get(self) -> CurtainGeometry:
+        snapshot = Config.snapshot
+        if snapshot is self.__snapshot__:
+            return self.__geometry__
+        with self.lock:
+            if snapshot is not self.__snapshot__:
+                try:
+                    self.__geometry__ = CurtainGeometry.from_config()
+                except (KeyError, ValueError):
+                    logger.exception("Curtain geometry not reloaded, keeping the previous one")
+                self.__snapshot__ = snapshot
+        return self.__geometry__
+
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
+
+
+GEOMETRY = ConfiguredGeometry()
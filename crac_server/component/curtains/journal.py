@@ -0,0 +1,77 @@
+from array import array
+
+
+class EncoderJournal:
+
+    """
+        The last size edges of an encoder (monotonic time, steps, direction) in a ring
+        of preallocated arrays: recording an edge overwrites the oldest one in place,
+        without allocating anything in the callback of the encoder.
+        There is a single writer, the callback; the readers copy the edges they need
+        and may miss the one being written
+    """
+
+    def __init__(self, size: int = 1024):
+        self.size = max(size, 2)
+        self.times = array("d", bytes(8 * self.size))
+        self.steps = array("q", bytes(8 * self.size))
+        self.directions = array("b", bytes(self.size))
+        self.count = 0
+
+    def record(self, timestamp: float, steps: int) -> None:
+        index = self.count % self.size
+        previous = self.steps[(self.count - 1) % self.size] if self.count else steps
+        self.times[index] = timestamp
+        self.steps[index] = steps
+        self.directions[index] = (steps > previous) - (steps < previous)
+        self.count += 1
+
+    def __len__(self) -> int:
+        return min(self.count, self.size)
+
+    def last(self) -> tuple[float, int, int] | None:
+        if not self.count:
+            return None
+        index = (self.count - 1) % self.size
+        return self.times[index], self.steps[index], self.directions[index]
+
+    def entries(self, n: int | None = None) -> list[tuple[float, int, int]]:
+
+        """ The last n edges (all of them if n is None), the oldest first """
+
+        count = self.count
+        n = min(count, self.size) if n is None else min(n, count, self.size)
+        indexes = [(count - n + i) % self.size for i in range(n)]
+        return [(self.times[i], self.steps[i], self.directions[i]) for i in indexes]
+
+    def velocity(self, now: float, window: int = 8, idle: float = 1.0, start: tuple[float, int] | None = None) -> float:
+
+        """
+            Steps per second over the last window edges of the current movement,
+            0 if the last edge is older than idle seconds.
+            The edges before a pause longer than idle belong to a previous movement and are ignored;
+            start, the (time, steps) at which the current movement began, drops the older edges
+            and counts as its first edge, so the velocity is known from the first edge of a movement
+        """
+
+        edges = self.entries(window)
+        if start is not None:
+            edges = [start] + [edge[:2] for edge in edges if edge[0] > start[0]][-max(window - 1, 1):]
+        if len(edges) < 2 or now - edges[-1][0] > idle:
+            return 0.0
+        for index in range(len(edges) - 1, 0, -1):
+            if edges[index][0] - edges[index - 1][0] > idle:
+                edges = edges[index:]
+                break
+        elapsed = edges[-1][0] - edges[0][0]
+        return (edges[-1][1] - edges[0][1]) / elapsed if elapsed > 0 else 0.0
+
+    def downsample(self, points: int) -> list[tuple[float, int, int]]:
+
+        """ At most points edges evenly spread over the journal, the last one always included """
+
+        edges = self.entries()
+        if points <= 0 or len(edges) <= points:
+            return edges
+        stride = len(edges) / points
+        return [edges[int(len(edges) - 1 - i * stride)] for i in reversed(range(points))]
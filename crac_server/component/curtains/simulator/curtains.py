@@ -1,15 +1,26 @@
+from crac_server.component.clock import CLOCK, Clock
 from crac_server.component.curtains.curtains import Curtain
-from threading import Thread
-from time import sleep
+
+
+# simulated seconds between two steps of the encoder
+STEP_TIME = 0.2
 
 
 class MockCurtain(Curtain):
 
-    def __init__(self, rotary_encoder: dict[str, int], curtain_closed: dict[str, int], curtain_open: dict[str, int], motor: dict[str, int]):
+    def __init__(self, rotary_encoder: dict[str, int], curtain_closed: dict[str, int], curtain_open: dict[str, int], motor: dict[str, int], clock: Clock = CLOCK):
+        self.clock = clock
+        self.__movement__ = 0
         super().__init__(rotary_encoder, curtain_closed, curtain_open, motor)
         self.curtain_closed.pin.drive_low()
         self.curtain_open.pin.drive_high()
 
+    def __now__(self) -> float:
+        return self.clock.now()
+
+    def to_unix(self, instant: float) -> float:
+        return self.clock.to_unix(instant)
+
     def __rotate_cw__(self, *inputs):
         [input.pin.drive_low() for input in inputs if self.target is not None]
         [input.pin.drive_high() for input in inputs if self.target is not None]
@@ -30,22 +41,20 @@ class MockCurtain(Curtain):
 
     def __open__(self):
         super().__open__()
-        self.t = Thread(target=self.__fake_move_forward__, args=(self,))
-        self.t.start()
+        self.__movement__ += 1
+        self.clock.call_later(STEP_TIME, self.__fake_move__, self.__movement__, self.__rotate_cw__)
 
     def __close__(self):
         super().__close__()
-        self.t = Thread(target=self.__fake_move_backward__, args=(self,))
-        self.t.start()
-
-    def __fake_move_forward__(self, curtain):
-        while curtain.motor.is_active and curtain.motor.value:
-            sleep(0.2)
-            curtain.__rotate_cw__(curtain.rotary_encoder.a, curtain.rotary_encoder.b)
-            curtain.__check_curtains_limit__()
-
-    def __fake_move_backward__(self, curtain):
-        while curtain.motor.is_active and curtain.motor.value:
-            sleep(0.2)
-            curtain.__rotate_ccw__(curtain.rotary_encoder.a, curtain.rotary_encoder.b)
-            curtain.__check_curtains_limit__()
+        self.__movement__ += 1
+        self.clock.call_later(STEP_TIME, self.__fake_move__, self.__movement__, self.__rotate_ccw__)
+
+    def __fake_move__(self, movement, rotate):
+
+        """ One step of the encoder every STEP_TIME while the motor of this movement runs """
+
+        if movement != self.__movement__ or not (self.motor.is_active and self.motor.value):
+            return
+        rotate(self.rotary_encoder.a, self.rotary_encoder.b)
+        self.__check_curtains_limit__()
+        self.clock.call_later(STEP_TIME, self.__fake_move__, movement, rotate)
@@ -0,0 +1,151 @@
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from time import time
+from typing import Callable
+
+
+logger = logging.getLogger(__name__)
+
+
+class OperationState(str, Enum):
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+
+
+class Operation:
+
+    """
+        A long running action (roof movement, park, calibration...) executed in background.
+        The target receives the operation itself, so it can update the progress (0 to 1)
+        and check if it has been cancelled.
+        results collects the outcome of each part of an operation made of independent parts
+        (e.g. each curtain of the calibration).
+        on_cancel, when given, is called on cancellation to stop the hardware,
+        an operation without it can't be cancelled
+    """
+
+    def __init__(self, name: str, on_cancel: Callable[[], None] | None = None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.state = OperationState.RUNNING
+        self.progress = 0.0
+        self.message = ""
+        self.results: dict[str, dict] = {}
+        self.started = time()
+        self.finished: float | None = None
+        self.on_cancel = on_cancel
+        self.cancel_event = threading.Event()
+        self.done_event = threading.Event()
+
+    @property
+    def cancellable(self) -> bool:
+        return self.on_cancel is not None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    @property
+    def running(self) -> bool:
+        return self.state is OperationState.RUNNING
+
+    def cancel(self) -> bool:
+        if not self.cancellable or not self.running:
+            return False
+        logger.info("Cancelling operation %s %s", self.name, self.id)
+        self.cancel_event.set()
+        self.on_cancel()
+        return True
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self.done_event.wait(timeout)
+
+    def finish(self, state: OperationState, message: str = "") -> None:
+        self.state = state
+        self.message = message
+        if state is OperationState.DONE:
+            self.progress = 1.0
+        self.finished = time()
+        self.done_event.set()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "state": self.state.value,
+            "progress": self.progress,
+            "message": self.message,
+            "cancellable": self.cancellable,
+            "results": dict(self.results),
+            "started": self.started,
+            "finished": self.finished or 0,
+        }
+
+
+class OperationManager:
+
+    """
+        Run the long operations on a pool of background threads and keep track of them.
+        There is at most one running operation for each name (one for the roof,
+        one for the telescope...): starting it again returns the running one.
+        The finished operations are kept, up to history, to let the clients read their outcome
+    """
+
+    def __init__(self, max_workers: int = 4, history: int = 50):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="operation")
+        self.history = history
+        self.lock = threading.Lock()
+        self.__operations__: OrderedDict[str, Operation] = OrderedDict()
+        self.__running__: dict[str, Operation] = {}
+
+    def start(self, name: str, target: Callable[[Operation], None], on_cancel: Callable[[], None] | None = None) -> Operation:
+        with self.lock:
+            operation = self.__running__.get(name)
+            if operation and operation.running:
+                logger.info("Operation %s already running: %s", name, operation.id)
+                return operation
+            operation = Operation(name, on_cancel)
+            self.__running__[name] = operation
+            self.__operations__[operation.id] = operation
+            while len(self.__operations__) > self.history:
+                oldest = next(iter(self.__operations__.values()))
+                if oldest.running:
+                    break
+                self.__operations__.popitem(last=False)
+        logger.info("Starting operation %s %s", name, operation.id)
+        self.executor.submit(self.__run__, operation, target)
+        return operation
+
+    def get(self, operation_id: str) -> Operation | None:
+        return self.__operations__.get(operation_id)
+
+    def running(self, name: str) -> Operation | None:
+        operation = self.__running__.get(name)
+        return operation if operation and operation.running else None
+
+    def list(self) -> list[Operation]:
+        with self.lock:
+            return list(self.__operations__.values())
+
+    def cancel(self, operation_id: str) -> bool:
+        operation = self.get(operation_id)
+        return operation.cancel() if operation else False
+
+    def __run__(self, operation: Operation, target: Callable[[Operation], None]) -> None:
+        try:
+            target(operation)
+        except Exception as err:
+            logger.exception("Operation %s %s failed", operation.name, operation.id)
+            operation.finish(OperationState.FAILED, str(err))
+        else:
+            operation.finish(OperationState.CANCELLED if operation.cancelled else OperationState.DONE, operation.message)
+        logger.info("Operation %s %s finished: %s", operation.name, operation.id, operation.state.value)
+
+
+OPERATIONS = OperationManager()
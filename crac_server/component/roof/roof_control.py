@@ -3,6 +3,7 @@ import threading
 from gpiozero import OutputDevice, DigitalInputDevice
 
 from crac_server.config import Config
+from crac_server.metrics import METRICS
 from crac_protobuf.roof_pb2 import RoofStatus
 
 
@@ -19,20 +20,22 @@ class RoofControl():
     def open(self):
         with lock:
             self.motor.on()
-            self.roof_open_switch.wait_for_active()
+            with METRICS.timer("crac_gpio_wait_seconds", device="roof", switch="open"):
+                self.roof_open_switch.wait_for_active()
 
     def close(self):
         with lock:
             self.motor.off()
-            self.roof_closed_switch.wait_for_active()
+            with METRICS.timer("crac_gpio_wait_seconds", device="roof", switch="closed"):
+                self.roof_closed_switch.wait_for_active()
 
     def get_status(self) -> RoofStatus:
         is_roof_closed = self.roof_closed_switch.is_active
-        logger.debug(f'roof closed switch is {is_roof_closed}')
+        logger.debug('roof closed switch is %s', is_roof_closed)
         is_roof_open = self.roof_open_switch.is_active
-        logger.debug(f'roof opened switch is {is_roof_open}')
+        logger.debug('roof opened switch is %s', is_roof_open)
         is_switched_on = self.motor.value
-        logger.debug(f'roof motor switch is {is_switched_on}')
+        logger.debug('roof motor switch is %s', is_switched_on)
 
         if is_roof_closed and is_roof_open:
             status = RoofStatus.ROOF_ERROR
@@ -45,5 +48,5 @@ class RoofControl():
         else:
             status = RoofStatus.ROOF_CLOSING
 
-        logger.debug(f'roof status is {status}')
+        logger.debug('roof status is %s', status)
         return status
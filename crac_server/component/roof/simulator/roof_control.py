@@ -1,34 +1,30 @@
-from crac_protobuf.roof_pb2 import RoofStatus
+from crac_server.component.clock import CLOCK, Clock
 from crac_server.component.roof.roof_control import RoofControl
-from threading import Thread
-from time import sleep
+
+
+# simulated seconds of a travel of the roof
+TRAVEL_TIME = 10
+
 
 class MockRoofControl(RoofControl):
 
-    def __init__(self):
+    def __init__(self, clock: Clock = CLOCK):
         super().__init__()
+        self.clock = clock
         self.roof_open_switch.pin.drive_high()
         self.roof_closed_switch.pin.drive_low()
 
     def open(self):
         self.roof_open_switch.pin.drive_high()
         self.roof_closed_switch.pin.drive_high()
-        t = Thread(target=self.__wait_for_open__, args=(self.roof_open_switch.pin,))
-        t.start()
+        self.clock.call_later(TRAVEL_TIME, self.roof_open_switch.pin.drive_low)
         super().open()
-        t.join()
 
     def close(self):
         self.roof_open_switch.pin.drive_high()
         self.roof_closed_switch.pin.drive_high()
-        t = Thread(target=self.__wait_for_open__, args=(self.roof_closed_switch.pin,))
-        t.start()
+        self.clock.call_later(TRAVEL_TIME, self.roof_closed_switch.pin.drive_low)
         super().close()
-        t.join()
-
-    def __wait_for_open__(self, pin):
-        sleep(10)
-        pin.drive_low()
 
 
 ROOF = MockRoofControl()
\ No newline at end of file
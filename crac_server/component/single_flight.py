@@ -0,0 +1,111 @@
+import logging
+import threading
+from time import monotonic
+from typing import Any, Callable, Hashable
+
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+
+    """ A read in progress, or completed at timestamp """
+
+    __slots__ = ("done", "value", "error", "timestamp")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: BaseException | None = None
+        self.timestamp = 0.0
+
+
+class SingleFlight:
+
+    """
+        Coalesce the concurrent calls of the same read:
+        the first caller does the read, the ones that arrive while it's in progress
+        wait for it and share its result, the ones that arrive later reuse it
+        for freshness seconds. The errors are shared with the waiting callers
+        but never reused
+    """
+
+    def __init__(self, freshness: float = 0):
+        self.freshness = freshness
+        self.lock = threading.Lock()
+        self.__flights__: dict[Hashable, Flight] = {}
+
+    def do(self, key: Hashable, read: Callable[[], Any]) -> Any:
+        with self.lock:
+            flight = self.__flights__.get(key)
+            leader = flight is None or (
+                flight.done.is_set() and monotonic() - flight.timestamp > self.freshness
+            )
+            if leader:
+                flight = Flight()
+                self.__flights__[key] = flight
+        if leader:
+            try:
+                flight.value = read()
+            except BaseException as err:
+                flight.error = err
+                with self.lock:
+                    if self.__flights__.get(key) is flight:
+                        del self.__flights__[key]
+            finally:
+                flight.timestamp = monotonic()
+                flight.done.set()
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def invalidate(self, owner: Hashable) -> None:
+
+        """ Forget the reads of owner, the next calls read again """
+
+        with self.lock:
+            for key in [key for key in self.__flights__ if key[0] == owner]:
+                del self.__flights__[key]
+
+
+class Coalesced:
+
+    """
+        Proxy of a device whose reads (the methods without arguments named in reads)
+        go through a SingleFlight. The methods named in pure only compute
+        from their arguments and are called as they are. Every other method call is a command:
+        it forgets the cached reads of the device, so a client never gets back
+        a state older than its own command.
+        The results are shared between the callers and must not be modified
+    """
+
+    def __init__(self, device, reads: tuple[str, ...], flight: SingleFlight, pure: tuple[str, ...] = ()):
+        self.__device__ = device
+        self.__reads__ = frozenset(reads)
+        self.__pure__ = frozenset(pure)
+        self.__flight__ = flight
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.__device__, name)
+        if not callable(attribute) or name in self.__pure__:
+            return attribute
+        owner = id(self.__device__)
+        if name in self.__reads__:
+            def read(*args, **kwargs):
+                if args or kwargs:
+                    return attribute(*args, **kwargs)
+                return self.__flight__.do((owner, name), attribute)
+        else:
+            def read(*args, **kwargs):
+                try:
+                    return attribute(*args, **kwargs)
+                finally:
+                    self.__flight__.invalidate(owner)
+        read.__name__ = name
+        return read
+
+    @property
+    def device(self):
+        return self.__device__
@@ -0,0 +1,274 @@
+import logging
+import socket
+import threading
+from time import monotonic
+from typing import Callable
+import xml.etree.ElementTree as ET
+
+
+logger = logging.getLogger(__name__)
+# largest difference between a number requested and the one reported by the server
+NUMBER_TOLERANCE = 1e-4
+
+
+class IndiError(ConnectionError):
+    pass
+
+
+class Waiter:
+
+    """ A pending request waiting for the first incoming message accepted by match """
+
+    def __init__(self, match: Callable[[ET.Element], bool], exclusive: bool = False):
+        self.match = match
+        self.exclusive = exclusive
+        self.event = threading.Event()
+        self.element: ET.Element = None
+        self.error: Exception = None
+
+
+class IndiClient:
+
+    """
+        Long-lived connection to an INDI server.
+
+        A background thread reads the incoming stream and parses it incrementally:
+        INDI is an endless sequence of top level XML elements, so the stream is fed to
+        an XMLPullParser inside a synthetic <indi> root and every element closed at the
+        first level is a complete message, whatever the way it has been fragmented by TCP.
+        Each message is handed to the listeners and then to the pending waiters.
+        Commands are written on the same socket, which is opened again only after a failure.
+    """
+
+    def __init__(self, hostname: str = "localhost", port: int = 7624, timeout: float = 5):
+        self.hostname = hostname
+        self.port = port
+        self.timeout = timeout
+        self.connected = False
+        self.__socket__: socket.socket = None
+        self.__reader__: threading.Thread = None
+        self.__lock__ = threading.Lock()
+        self.__waiters__: list[Waiter] = []
+        self.__listeners__: list[Callable[[ET.Element], None]] = []
+        self.__subscriptions__: list[bytes] = []
+
+    def connect(self) -> None:
+        with self.__lock__:
+            self.__connect__()
+
+    def __connect__(self) -> None:
+        if self.connected:
+            return
+        sock = socket.create_connection((self.hostname, self.port), timeout=self.timeout)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.__socket__ = sock
+        self.connected = True
+        self.__reader__ = threading.Thread(target=self.__read_loop__, args=(sock,), name="indi-reader", daemon=True)
+        self.__reader__.start()
+        logger.info("Connected to INDI server %s:%s", self.hostname, self.port)
+        for subscription in self.__subscriptions__:
+            sock.sendall(subscription)
+
+    def disconnect(self) -> None:
+        with self.__lock__:
+            self.__close__()
+
+    def __close__(self) -> None:
+        if not self.connected:
+            return
+        self.connected = False
+        try:
+            self.__socket__.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.__socket__.close()
+        logger.info("Disconnected from INDI server %s:%s", self.hostname, self.port)
+
+    def add_listener(self, listener: Callable[[ET.Element], None]) -> None:
+        self.__listeners__.append(listener)
+
+    def subscribe(self, xml: str) -> None:
+
+        """ Register a message to be sent now, if connected, and on every new connection """
+
+        data = xml.encode("utf-8")
+        with self.__lock__:
+            self.__subscriptions__.append(data)
+            if self.connected:
+                self.__socket__.sendall(data)
+
+    def send(self, xml: str | bytes) -> None:
+
+        """ Write one or more messages, opening the connection again if it has been lost """
+
+        data = xml.encode("utf-8") if isinstance(xml, str) else xml
+        with self.__lock__:
+            self.__connect__()
+            try:
+                self.__socket__.sendall(data)
+            except OSError:
+                logger.warning("INDI connection lost while sending, reconnecting")
+                self.__close__()
+                self.__connect__()
+                self.__socket__.sendall(data)
+
+    def request(self, xml: str | bytes, match: Callable[[ET.Element], bool], timeout: float | None = None) -> ET.Element:
+
+        """ Send the messages and wait for the first incoming message accepted by match """
+
+        waiter = self.expect(match)
+        try:
+            self.send(xml)
+        except OSError:
+            self.__discard__(waiter)
+            raise
+        return self.wait(waiter, timeout)
+
+    def expect(self, match: Callable[[ET.Element], bool]) -> Waiter:
+
+        """ Register a waiter, to be done before sending the message that triggers the answer """
+
+        waiter = Waiter(match)
+        with self.__lock__:
+            self.__waiters__.append(waiter)
+        return waiter
+
+    def transaction(self, commands: list[tuple[str, str]]) -> list[Waiter]:
+
+        """
+            Send a sequence of new*Vector commands, given as (property name, xml),
+            in a single write and return the waiters for their acknowledgements,
+            the first set*Vector of the same property that answers the command (see __is_ack__).
+            Every acknowledgement is consumed by a single waiter,
+            so a property changed twice waits for two acknowledgements
+        """
+
+        waiters = [
+            Waiter(lambda element, request=ET.fromstring(xml.strip()): IndiClient.__is_ack__(element, request), exclusive=True)
+            for _, xml in commands
+        ]
+        with self.__lock__:
+            self.__waiters__.extend(waiters)
+        try:
+            self.send("".join(xml for _, xml in commands))
+        except OSError:
+            for waiter in waiters:
+                self.__discard__(waiter)
+            raise
+        return waiters
+
+    def wait_all(self, waiters: list[Waiter], timeout: float | None = None) -> list[ET.Element]:
+
+        """ Wait for all the waiters within a single deadline """
+
+        deadline = monotonic() + (self.timeout if timeout is None else timeout)
+        elements = []
+        for index, waiter in enumerate(waiters):
+            try:
+                elements.append(self.wait(waiter, max(0, deadline - monotonic())))
+            except (TimeoutError, IndiError):
+                for pending in waiters[index + 1:]:
+                    self.__discard__(pending)
+                raise
+        return elements
+
+    @staticmethod
+    def __is_ack__(element: ET.Element, request: ET.Element) -> bool:
+
+        """
+            True if element answers the request: a set*Vector of the same property
+            reporting an Alert, a Busy (e.g. the start of a slew, a server already busy
+            answers exactly like its periodic updates) or the switches or the numbers requested.
+            The periodic updates Ok of a property, already on their way when the request
+            is sent, don't answer it
+        """
+
+        name = request.get("name")
+        if not element.tag.startswith("set") or element.get("name") != name:
+            return False
+        state = (element.get("state") or "").strip()
+        if state == "Alert":
+            return True
+        values = {child.get("name"): (child.text or "").strip() for child in element}
+        requested = {child.get("name"): (child.text or "").strip() for child in request}
+        if request.tag == "newSwitchVector":
+            return state in ("Ok", "Busy") and all(values.get(switch) == value for switch, value in requested.items())
+        if state == "Busy":
+            return True
+        try:
+            return state == "Ok" and all(
+                number in values and abs(float(values[number]) - float(value)) <= NUMBER_TOLERANCE
+                for number, value in requested.items()
+            )
+        except ValueError:
+            return False
+
+    def wait(self, waiter: Waiter, timeout: float | None = None) -> ET.Element:
+        if not waiter.event.wait(self.timeout if timeout is None else timeout):
+            self.__discard__(waiter)
+            raise TimeoutError("No answer from the INDI server")
+        if waiter.error:
+            raise waiter.error
+        return waiter.element
+
+    def __discard__(self, waiter: Waiter) -> None:
+        with self.__lock__:
+            if waiter in self.__waiters__:
+                self.__waiters__.remove(waiter)
+
+    def __dispatch__(self, element: ET.Element) -> None:
+        with self.__lock__:
+            matched = []
+            consumed = False
+            for waiter in self.__waiters__:
+                if waiter.exclusive and consumed:
+                    continue
+                if waiter.match(element):
+                    matched.append(waiter)
+                    consumed = consumed or waiter.exclusive
+            for waiter in matched:
+                self.__waiters__.remove(waiter)
+        for listener in self.__listeners__:
+            try:
+                listener(element)
+            except Exception:
+                logger.exception("INDI listener failed on %s", element.tag)
+        for waiter in matched:
+            waiter.element = element
+            waiter.event.set()
+
+    def __read_loop__(self, sock: socket.socket) -> None:
+        parser = ET.XMLPullParser(events=("start", "end"))
+        parser.feed(b"<indi>")
+        root = None
+        depth = 0
+        try:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                parser.feed(data)
+                for event, element in parser.read_events():
+                    if event == "start":
+                        if root is None:
+                            root = element
+                        depth += 1
+                        continue
+                    depth -= 1
+                    if depth == 1:
+                        root.remove(element)
+                        logger.debug("INDI message received %s %s", element.tag, element.attrib.get("name"))
+                        self.__dispatch__(element)
+        except OSError as err:
+            logger.debug("INDI reader stopped: %s", err)
+        except ET.ParseError as err:
+            logger.error("Xml Malformed %s", err)
+        with self.__lock__:
+            if self.__socket__ is not sock:
+                return
+            self.__close__()
+            waiters, self.__waiters__ = self.__waiters__, []
+        for waiter in waiters:
+            waiter.error = IndiError("INDI connection closed")
+            waiter.event.set()
@@ -0,0 +1,89 @@
+import logging
+import threading
+from time import monotonic
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+import xml.etree.ElementTree as ET
+from crac_server.component.telescope.indi.client import IndiClient
+
+
+logger = logging.getLogger(__name__)
+
+
+class IndiProperty(NamedTuple):
+    device: str
+    name: str
+    state: str
+    values: Mapping[str, float | str]
+    timestamp: float
+
+
+class PropertyCache:
+
+    """
+        In-memory copy of the properties of an INDI device.
+
+        The cache subscribes to the device with getProperties on every (re)connection,
+        so the server sends all the definitions and then pushes every update
+        (set*Vector). Every property keeps the monotonic time of the last message
+        received for it, so that readers can decide when it's too old to be trusted.
+    """
+
+    def __init__(self, client: IndiClient, device: str):
+        self.client = client
+        self.device = device
+        self.lock = threading.Lock()
+        self.__properties__: dict[str, IndiProperty] = {}
+        client.add_listener(self.__update__)
+        client.subscribe(f'<getProperties device="{device}" version="1.7"/>')
+
+    def get(self, name: str, max_age: float | None = None) -> IndiProperty | None:
+
+        """ Return the property if it's known and not older than max_age seconds """
+
+        prop = self.__properties__.get(name)
+        if prop is None or not self.client.connected:
+            return None
+        if max_age is not None and monotonic() - prop.timestamp > max_age:
+            return None
+        return prop
+
+    def clear(self) -> None:
+        with self.lock:
+            self.__properties__ = {}
+
+    def __update__(self, element: ET.Element) -> None:
+        if element.get("device") != self.device:
+            return
+        name = element.get("name")
+        tag = element.tag
+        if tag == "delProperty":
+            with self.lock:
+                if name:
+                    self.__properties__.pop(name, None)
+                else:
+                    self.__properties__ = {}
+            return
+        if not (tag.endswith("Vector") and tag.startswith(("def", "set"))):
+            return
+
+        with self.lock:
+            previous = self.__properties__.get(name)
+            values = dict(previous.values) if previous and tag.startswith("set") else {}
+            for child in element:
+                values[child.get("name")] = PropertyCache.__parse_value__(child.text)
+            self.__properties__[name] = IndiProperty(
+                device=self.device,
+                name=name,
+                state=(element.get("state") or (previous.state if previous else "Idle")).strip(),
+                values=MappingProxyType(values),
+                timestamp=monotonic(),
+            )
+
+    @staticmethod
+    def __parse_value__(text: str | None) -> float | str:
+        value = (text or "").strip()
+        try:
+            return float(value)
+        except ValueError:
+            return value
@@ -0,0 +1,469 @@
+"""
+    A lightweight stand-in for indiserver with a simulated mount, to benchmark the INDI driver
+    and check its robustness without indiserver or the hardware.
+
+    The server speaks the subset of the INDI protocol used by the driver over local TCP:
+    getProperties, newSwitchVector and newNumberVector, answered with the def*Vector
+    and set*Vector messages and their state transitions (Idle, Ok, Busy, Alert).
+    Every outgoing message can be delayed by a latency and a random jitter, keeping its order,
+    and written in random fragments, as a slow or congested network would deliver it.
+
+    From the root of the repository:
+
+        python -m crac_server.component.telescope.indi.server --port 7624 --latency 0.02 --jitter 0.01 --fragment 16
+
+    or, to measure the round trip of the driver against an in-process server:
+
+        python -m crac_server.component.telescope.indi.server --bench 1000 --latency 0.002
+"""
+
+import argparse
+import logging
+import math
+import queue
+import random
+import socket
+import sys
+import threading
+from time import monotonic, perf_counter, sleep
+import xml.etree.ElementTree as ET
+
+
+logger = logging.getLogger(__name__)
+DEVICE = "Telescope Simulator"
+# hours of right ascension the sky moves in a second of time
+SIDEREAL_RATE = 1.00273790935 / 3600
+
+
+class Mount:
+
+    """
+        The simulated mount, as the INDI properties used by the driver: EQUATORIAL_EOD_COORD
+        (RA in hours, DEC in degrees), ON_COORD_SET, TELESCOPE_TRACK_STATE and TELESCOPE_PARK.
+        A new EQUATORIAL_EOD_COORD syncs the mount, or slews it at slew_rate degrees per second
+        on both axes: the coordinates are Busy until it gets there, then Ok if it's tracking
+        and Idle if it isn't, with the RA moving with the sky.
+        A parked mount refuses to move with an Alert
+    """
+
+    def __init__(self, device: str = DEVICE, ra: float = 0.0, dec: float = 0.0, slew_rate: float = 2.0):
+        self.device = device
+        self.slew_rate = slew_rate
+        self.lock = threading.Lock()
+        self.switches = {
+            "ON_COORD_SET": {"SLEW": False, "TRACK": True, "SYNC": False},
+            "TELESCOPE_TRACK_STATE": {"TRACK_ON": False, "TRACK_OFF": True},
+            "TELESCOPE_PARK": {"PARK": True, "UNPARK": False},
+        }
+        now = monotonic()
+        self.__origin__ = (ra, dec)
+        self.__target__ = (ra, dec)
+        self.__start__ = now
+        self.__arrival__ = now
+
+    @property
+    def tracking(self) -> bool:
+        return self.switches["TELESCOPE_TRACK_STATE"]["TRACK_ON"]
+
+    @property
+    def parked(self) -> bool:
+        return self.switches["TELESCOPE_PARK"]["PARK"]
+
+    def define(self, name: str | None = None) -> list[str]:
+
+        """ The def*Vector of the property name, of all of them if name is None """
+
+        with self.lock:
+            now = monotonic()
+            messages = [self.__coords__("def", now)] if name in (None, "EQUATORIAL_EOD_COORD") else []
+            messages += [
+                self.__switches__("def", switch)
+                for switch in self.switches
+                if name in (None, switch)
+            ]
+        return messages
+
+    def update(self) -> list[str]:
+
+        """ The current coordinates, pushed periodically to the clients """
+
+        with self.lock:
+            return [self.__coords__("set", monotonic())]
+
+    def apply(self, element: ET.Element) -> list[str]:
+
+        """ Execute a new*Vector and return the set*Vector messages it produces """
+
+        name = element.get("name")
+        with self.lock:
+            now = monotonic()
+            if element.tag == "newSwitchVector" and name in self.switches:
+                return self.__apply_switches__(element, name, now)
+            if element.tag == "newNumberVector" and name == "EQUATORIAL_EOD_COORD":
+                return self.__apply_coords__(element, now)
+        logger.warning("Unsupported INDI command %s %s", element.tag, name)
+        return []
+
+    def __apply_switches__(self, element: ET.Element, name: str, now: float) -> list[str]:
+        switches = self.switches[name]
+        values = {child.get("name"): (child.text or "").strip() == "On" for child in element if child.get("name") in switches}
+        on = [switch for switch, value in values.items() if value]
+        if on:
+            # OneOfMany: the last switch turned on wins
+            for switch in switches:
+                switches[switch] = switch == on[-1]
+        else:
+            switches.update(values)
+        messages = [self.__switches__("set", name)]
+        if name == "TELESCOPE_TRACK_STATE":
+            # the mount stops or starts tracking where it is
+            if now >= self.__arrival__:
+                self.__stop__(now)
+            messages.append(self.__coords__("set", now))
+        return messages
+
+    def __apply_coords__(self, element: ET.Element, now: float) -> list[str]:
+        if self.parked:
+            return [self.__coords__("set", now, state="Alert", message="The mount is parked")]
+        try:
+            values = {child.get("name"): float((child.text or "").strip()) for child in element}
+        except ValueError:
+            return [self.__coords__("set", now, state="Alert", message="Invalid coordinates")]
+        ra, dec = self.__position__(now)
+        target = (values.get("RA", self.__target__[0]), values.get("DEC", self.__target__[1]))
+        coord_set = self.switches["ON_COORD_SET"]
+        if coord_set["SYNC"]:
+            self.__origin__ = self.__target__ = target
+            self.__start__ = self.__arrival__ = now
+            return [self.__coords__("set", now, state="Ok")]
+        if coord_set["TRACK"]:
+            self.switches["TELESCOPE_TRACK_STATE"].update(TRACK_ON=True, TRACK_OFF=False)
+        distance = max(abs(target[0] - ra) * 15, abs(target[1] - dec))
+        self.__origin__ = (ra, dec)
+        self.__target__ = target
+        self.__start__ = now
+        self.__arrival__ = now + (distance / self.slew_rate if self.slew_rate > 0 else 0)
+        return [self.__coords__("set", now, state="Busy" if self.__arrival__ > now else "Ok")]
+
+    def __stop__(self, now: float) -> None:
+        self.__origin__ = self.__target__ = self.__position__(now)
+        self.__start__ = self.__arrival__ = now
+
+    def __position__(self, now: float) -> tuple[float, float]:
+        if now < self.__arrival__:
+            fraction = (now - self.__start__) / (self.__arrival__ - self.__start__)
+            return tuple(
+                origin + (target - origin) * fraction
+                for origin, target in zip(self.__origin__, self.__target__)
+            )
+        ra, dec = self.__target__
+        if not self.tracking:
+            ra = (ra + (now - self.__arrival__) * SIDEREAL_RATE) % 24
+        return ra, dec
+
+    def __state__(self, now: float) -> str:
+        if now < self.__arrival__:
+            return "Busy"
+        return "Ok" if self.tracking else "Idle"
+
+    def __coords__(self, kind: str, now: float, state: str | None = None, message: str | None = None) -> str:
+        ra, dec = self.__position__(now)
+        state = state or self.__state__(now)
+        attributes = f'device="{self.device}" name="EQUATORIAL_EOD_COORD" state="{state}" timeout="60"'
+        if message:
+            attributes += f' message="{message}"'
+        if kind == "def":
+            return (
+                f'<defNumberVector {attributes} label="Eq. Coordinates" group="Main Control" perm="rw">\n'
+                f'<defNumber name="RA" label="RA (hh:mm:ss)" format="%010.6m" min="0" max="24" step="0">\n{ra:.6f}\n</defNumber>\n'
+                f'<defNumber name="DEC" label="DEC (dd:mm:ss)" format="%010.6m" min="-90" max="90" step="0">\n{dec:.6f}\n</defNumber>\n'
+                '</defNumberVector>\n'
+            )
+        return (
+            f'<setNumberVector {attributes}>\n'
+            f'<oneNumber name="RA">\n{ra:.6f}\n</oneNumber>\n'
+            f'<oneNumber name="DEC">\n{dec:.6f}\n</oneNumber>\n'
+            '</setNumberVector>\n'
+        )
+
+    def __switches__(self, kind: str, name: str) -> str:
+        switches = "".join(
+            f'<{kind}Switch name="{switch}">\n{"On" if value else "Off"}\n</{kind}Switch>\n'
+            if kind == "def" else
+            f'<oneSwitch name="{switch}">\n{"On" if value else "Off"}\n</oneSwitch>\n'
+            for switch, value in self.switches[name].items()
+        )
+        if kind == "def":
+            return (
+                f'<defSwitchVector device="{self.device}" name="{name}" state="Ok" '
+                f'perm="rw" rule="OneOfMany" timeout="60" group="Main Control">\n{switches}</defSwitchVector>\n'
+            )
+        return f'<setSwitchVector device="{self.device}" name="{name}" state="Ok" timeout="60">\n{switches}</setSwitchVector>\n'
+
+
+class Connection:
+
+    """
+        A client of the server. The outgoing messages are written by a background thread
+        latency seconds after they are sent, plus a random jitter up to jitter seconds,
+        never before the previous ones as TCP would deliver them;
+        with fragment, every message is written in chunks of 1 to fragment bytes
+    """
+
+    def __init__(self, sock: socket.socket, latency: float, jitter: float, fragment: int, rng: random.Random):
+        self.sock = sock
+        self.latency = latency
+        self.jitter = jitter
+        self.fragment = fragment
+        self.random = rng
+        self.subscribed = False
+        self.__last_due__ = 0.0
+        self.__queue__: queue.SimpleQueue[tuple[float, bytes] | None] = queue.SimpleQueue()
+        self.__lock__ = threading.Lock()
+        self.__writer__ = threading.Thread(target=self.__write_loop__, name="indi-server-writer", daemon=True)
+        self.__writer__.start()
+
+    def send(self, messages: list[str]) -> None:
+        if not messages:
+            return
+        with self.__lock__:
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            self.__last_due__ = max(self.__last_due__, monotonic() + delay)
+            self.__queue__.put((self.__last_due__, "".join(messages).encode("utf-8")))
+
+    def close(self) -> None:
+        self.__queue__.put(None)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def __chunks__(self, data: bytes) -> list[bytes]:
+        if self.fragment <= 0:
+            return [data]
+        chunks = []
+        start = 0
+        with self.__lock__:
+            while start < len(data):
+                end = start + self.random.randint(1, self.fragment)
+                chunks.append(data[start:end])
+                start = end
+        return chunks
+
+    def __write_loop__(self) -> None:
+        while True:
+            item = self.__queue__.get()
+            if item is None:
+                return
+            due, data = item
+            wait = due - monotonic()
+            if wait > 0:
+                sleep(wait)
+            try:
+                for chunk in self.__chunks__(data):
+                    self.sock.sendall(chunk)
+            except OSError:
+                return
+
+
+class IndiServer:
+
+    """
+        Serve the mount to any number of clients on local TCP, pushing its coordinates
+        every period seconds to the clients that asked for its properties.
+        With a seed the latency, jitter and fragments are reproducible
+    """
+
+    def __init__(
+        self,
+        mount: Mount,
+        hostname: str = "127.0.0.1",
+        port: int = 7624,
+        latency: float = 0,
+        jitter: float = 0,
+        fragment: int = 0,
+        period: float = 1,
+        seed: int | None = None,
+    ):
+        self.mount = mount
+        self.hostname = hostname
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.fragment = fragment
+        self.period = period
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.__socket__: socket.socket = None
+        self.__connections__: list[Connection] = []
+        self.__stop__ = threading.Event()
+
+    def start(self) -> tuple[str, int]:
+
+        """ Listen on hostname:port (any free port if 0) and return the address """
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.hostname, self.port))
+        sock.listen()
+        self.__socket__ = sock
+        self.port = sock.getsockname()[1]
+        self.__stop__.clear()
+        threading.Thread(target=self.__accept_loop__, args=(sock,), name="indi-server", daemon=True).start()
+        if self.period > 0:
+            threading.Thread(target=self.__push_loop__, name="indi-server-push", daemon=True).start()
+        logger.info("INDI server listening on %s:%s", self.hostname, self.port)
+        return self.hostname, self.port
+
+    def serve_forever(self) -> None:
+        self.__stop__.wait()
+
+    def stop(self) -> None:
+        self.__stop__.set()
+        if self.__socket__:
+            self.__socket__.close()
+        with self.lock:
+            connections, self.__connections__ = self.__connections__, []
+        for connection in connections:
+            connection.close()
+
+    def broadcast(self, messages: list[str]) -> None:
+        with self.lock:
+            connections = [connection for connection in self.__connections__ if connection.subscribed]
+        for connection in connections:
+            connection.send(messages)
+
+    def __accept_loop__(self, sock: socket.socket) -> None:
+        while not self.__stop__.is_set():
+            try:
+                client, _ = sock.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                connection = Connection(client, self.latency, self.jitter, self.fragment, random.Random(self.random.random()))
+                self.__connections__.append(connection)
+            threading.Thread(target=self.__read_loop__, args=(connection,), name="indi-server-reader", daemon=True).start()
+
+    def __read_loop__(self, connection: Connection) -> None:
+        parser = ET.XMLPullParser(events=("start", "end"))
+        parser.feed(b"<indi>")
+        root = None
+        depth = 0
+        try:
+            while True:
+                data = connection.sock.recv(65536)
+                if not data:
+                    break
+                parser.feed(data)
+                for event, element in parser.read_events():
+                    if event == "start":
+                        if root is None:
+                            root = element
+                        depth += 1
+                        continue
+                    depth -= 1
+                    if depth == 1:
+                        root.remove(element)
+                        self.__handle__(connection, element)
+        except OSError as err:
+            logger.debug("INDI client gone: %s", err)
+        except ET.ParseError as err:
+            logger.error("Xml Malformed %s", err)
+        finally:
+            with self.lock:
+                if connection in self.__connections__:
+                    self.__connections__.remove(connection)
+            connection.close()
+
+    def __handle__(self, connection: Connection, element: ET.Element) -> None:
+        device = element.get("device")
+        if device not in (None, self.mount.device):
+            return
+        if element.tag == "getProperties":
+            connection.subscribed = True
+            connection.send(self.mount.define(element.get("name")))
+        elif element.tag.startswith("new"):
+            self.broadcast(self.mount.apply(element))
+
+    def __push_loop__(self) -> None:
+        while not self.__stop__.wait(self.period):
+            self.broadcast(self.mount.update())
+
+
+def percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    if not samples:
+        return "no samples"
+
+    def at(quantile: float) -> float:
+        return samples[min(len(samples) - 1, math.ceil(quantile * len(samples)) - 1)] * 1000
+
+    return f"p50 {at(0.5):.2f} ms  p95 {at(0.95):.2f} ms  p99 {at(0.99):.2f} ms  max {samples[-1] * 1000:.2f} ms"
+
+
+def bench(server: IndiServer, rounds: int) -> None:
+
+    """ Time the calls of the driver against the server, asking the server every time """
+
+    from crac_protobuf.telescope_pb2 import EquatorialCoords, TelescopeSpeed
+    from crac_server.component.telescope.indi.telescope import Telescope
+
+    telescope = Telescope(hostname=server.hostname, port=server.port, timeout=5, max_staleness=0)
+    telescope.open_connection()
+    calls = {
+        "get_eq_coords": telescope.get_eq_coords,
+        "get_speed": telescope.get_speed,
+        "set_speed": lambda: telescope.set_speed(TelescopeSpeed.SPEED_TRACKING),
+        "move": lambda: telescope.move(EquatorialCoords(ra=server.random.uniform(0, 24), dec=server.random.uniform(-10, 80))),
+    }
+    for name, call in calls.items():
+        samples = []
+        for _ in range(rounds):
+            start = perf_counter()
+            call()
+            samples.append(perf_counter() - start)
+        print(f"{name:14} {rounds} calls  {percentiles(samples)}")
+    telescope.disconnect()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve a simulated mount over the INDI protocol")
+    parser.add_argument("--hostname", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7624, help="0 for any free port")
+    parser.add_argument("--device", default=DEVICE)
+    parser.add_argument("--latency", type=float, default=0, help="seconds before every message is written")
+    parser.add_argument("--jitter", type=float, default=0, help="random seconds added to the latency, up to this")
+    parser.add_argument("--fragment", type=int, default=0, help="write every message in chunks of up to this many bytes")
+    parser.add_argument("--period", type=float, default=1, help="seconds between two pushes of the coordinates, 0 never")
+    parser.add_argument("--slew-rate", type=float, default=2, help="degrees per second of the slews")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--bench", type=int, metavar="ROUNDS", help="time ROUNDS calls of the driver against an in-process server")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    server = IndiServer(
+        Mount(args.device, slew_rate=args.slew_rate),
+        hostname=args.hostname,
+        port=0 if args.bench else args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        fragment=args.fragment,
+        period=args.period,
+        seed=args.seed,
+    )
+    server.start()
+    try:
+        if args.bench:
+            bench(server, args.bench)
+        else:
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,84 +1,143 @@
 import logging
 from crac_server import config
+from crac_server.component.telescope.indi.client import IndiClient, IndiError
+from crac_server.component.telescope.indi.properties import IndiProperty, PropertyCache
 from crac_server.component.telescope.telescope import Telescope as BaseTelescope
+from crac_server.metrics import METRICS
 from crac_protobuf.telescope_pb2 import (
     AltazimutalCoords,
     EquatorialCoords,
     TelescopeSpeed,
 )
 from datetime import datetime
-import socket
-import threading 
-from time import sleep
+import threading
 import xml.etree.ElementTree as ET
 
 logger = logging.getLogger(__name__)
 lock = threading.Lock()
+DEVICE = "Telescope Simulator"
 
 
 class Telescope(BaseTelescope):
-    def __init__(self, hostname="localhost", port=7624):
+    def __init__(self, hostname="localhost", port=7624, timeout=5, max_staleness=5):
         self.sync_time = None
         self.sync_status = False
-        self.connected = False
-        self.hostname = hostname
-        self.port = port
-    
+        self.max_staleness = max_staleness
+        self.client = IndiClient(hostname=hostname, port=port, timeout=timeout)
+        self.properties = PropertyCache(self.client, DEVICE)
+
+    @property
+    def connected(self) -> bool:
+        return self.client.connected
+
     def open_connection(self) -> None:
+        self.client.connect()
 
-        if not self.connected:
-            self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.s.connect((self.hostname, self.port))
-            self.connected = True
-
-    def __call_indi__(self, script: str) -> bytes:
-        with lock:
-            self.open_connection()
-            self.s.sendall(script.encode('utf-8'))
-            data = self.s.recv(30000)
-            self.disconnect()
-            logger.debug(data)
-        try:
-            return ET.fromstring(data)
-        except ET.ParseError as err:
-            logger.error(f"Xml Malformed {err}")
+    def __call_indi__(self, script: str, name: str | None = None) -> ET.Element | None:
 
+        """
+            Write the script on the persistent connection.
+            If name is given, wait for the definition of that property and return it
+        """
+
+        logger.debug(script)
+        if name is None:
+            with lock:
+                self.client.send(script)
+            return None
+        with METRICS.timer("crac_driver_duration_seconds", driver="indi", operation=name):
+            with lock:
+                waiter = self.client.expect(lambda element: element.tag.startswith("def") and element.get("name") == name)
+                self.client.send(script)
+            return self.client.wait(waiter)
 
     def disconnect(self) -> bool:
         """ Disconnect the server from the Telescope"""
-        if self.connected:
-            self.s.close()
-            self.connected = False
+        self.client.disconnect()
+        self.properties.clear()
+        return True
+
+    def __property__(self, name: str) -> IndiProperty:
 
-    def sync(self):
-        """ 
-            Register the telescope in park position
-            Calculate the corrisponding equatorial coordinate
         """
-        self.sync_time = datetime.utcnow()
-        self.__call_indi__(
+            Read the property from the cache kept up to date by the server pushes,
+            asking for it explicitly only if it's missing or older than max_staleness.
+            Raise TimeoutError if the server doesn't define it in time
+            and IndiError (a ConnectionError) if the server can't be reached
+        """
+
+        prop = self.properties.get(name, self.max_staleness)
+        if prop is None:
+            try:
+                self.__call_indi__(
+                    f"""
+                    <getProperties device="{DEVICE}" version="1.7" name="{name}"/>
+                    """,
+                    name=name
+                )
+            except TimeoutError as err:
+                raise TimeoutError(f"INDI property {name} not defined by the server") from err
+            except OSError as err:
+                raise IndiError(f"INDI property {name} not read: {err}") from err
+            prop = self.properties.get(name)
+            if prop is None:
+                raise IndiError(f"INDI property {name} not read")
+        return prop
+
+    def __transaction__(self, commands: list[tuple[str, str]]) -> None:
+
+        """
+            Send all the commands in a single write and wait,
+            with a single deadline, for the acknowledgement of each of them
+        """
+
+        try:
+            with METRICS.timer("crac_driver_duration_seconds", driver="indi", operation="+".join(name for name, _ in commands)):
+                with lock:
+                    waiters = self.client.transaction(commands)
+                acks = self.client.wait_all(waiters)
+        except TimeoutError:
+            logger.warning("Telescope server did not acknowledge all the commands %s", [name for name, _ in commands])
+            return
+        for ack in acks:
+            if ack.get("state") == "Alert":
+                logger.error("Telescope server rejected %s: %s", ack.get("name"), ack.get("message"))
+
+    def __unpark_command__(self) -> tuple[str, str]:
+        return (
+            "TELESCOPE_PARK",
+            f"""
+                <newSwitchVector device="{DEVICE}" name="TELESCOPE_PARK">
+                    <oneSwitch name="UNPARK">
+                        On
+                    </oneSwitch>
+                </newSwitchVector>
             """
-                <newSwitchVector device="Telescope Simulator" name="ON_COORD_SET">
+        )
+
+    def __coord_set_command__(self, slew: bool, track: bool, sync: bool) -> tuple[str, str]:
+        return (
+            "ON_COORD_SET",
+            f"""
+                <newSwitchVector device="{DEVICE}" name="ON_COORD_SET">
                     <oneSwitch name="SLEW">
-                        Off
+                        {"On" if slew else "Off"}
                     </oneSwitch>
                     <oneSwitch name="TRACK">
-                        Off
+                        {"On" if track else "Off"}
                     </oneSwitch>
                     <oneSwitch name="SYNC">
-                        On
+                        {"On" if sync else "Off"}
                     </oneSwitch>
                 </newSwitchVector>
             """
         )
-        aa_coords = AltazimutalCoords(
-            alt=config.Config.getFloat("park_alt", "telescope"),
-            az=config.Config.getFloat("park_az", "telescope")
-        )
-        eq_coords = self.__altaz2radec(aa_coords)
-        self.__call_indi__(
+
+    def __eq_coords_command__(self, eq_coords: EquatorialCoords) -> tuple[str, str]:
+        return (
+            "EQUATORIAL_EOD_COORD",
             f"""
-                <newNumberVector device="Telescope Simulator" name="EQUATORIAL_EOD_COORD">
+                <newNumberVector device="{DEVICE}" name="EQUATORIAL_EOD_COORD">
                     <oneNumber name="DEC">
                       {eq_coords.dec}
                     </oneNumber>
@@ -88,119 +147,81 @@ class Telescope(BaseTelescope):
                 </newNumberVector>
             """
         )
-        self.__call_indi__(
-            """
-                <newSwitchVector device="Telescope Simulator" name="ON_COORD_SET">
-                    <oneSwitch name="SLEW">
-                        Off
-                    </oneSwitch>
-                    <oneSwitch name="TRACK">
-                        On
-                    </oneSwitch>
-                    <oneSwitch name="SYNC">
-                        Off
-                    </oneSwitch>
-                </newSwitchVector>
-            """
-        )
-        self.sync_status = True
 
-    def move(self, aa_coords: AltazimutalCoords | EquatorialCoords, speed=TelescopeSpeed.SPEED_TRACKING):
-        self.__call_indi__(
-            """
-                <newSwitchVector device="Telescope Simulator" name="TELESCOPE_PARK">
-                    <oneSwitch name="UNPARK">
+    def __track_state_command__(self, track: bool) -> tuple[str, str]:
+        return (
+            "TELESCOPE_TRACK_STATE",
+            f"""
+                <newSwitchVector device="{DEVICE}" name="TELESCOPE_TRACK_STATE">
+                    <oneSwitch name="{"TRACK_ON" if track else "TRACK_OFF"}">
                         On
                     </oneSwitch>
                 </newSwitchVector>
             """
         )
+
+    def __speed_commands__(self, speed: TelescopeSpeed) -> list[tuple[str, str]]:
+        if speed is TelescopeSpeed.SPEED_NOT_TRACKING:
+            return [self.__track_state_command__(track=False)]
+        return [
+            self.__track_state_command__(track=True),
+            self.__coord_set_command__(
+                slew=speed == TelescopeSpeed.SPEED_SLEWING,
+                track=speed == TelescopeSpeed.SPEED_TRACKING,
+                sync=False
+            ),
+        ]
+
+    def __move_commands__(self, aa_coords: AltazimutalCoords | EquatorialCoords, speed: TelescopeSpeed) -> list[tuple[str, str]]:
         eq_coords = self.__altaz2radec(aa_coords) if isinstance(aa_coords, (AltazimutalCoords)) else aa_coords
         logger.debug(aa_coords)
         logger.debug(eq_coords)
-        logger.debug(self.__radec2altaz(eq_coords))
-        self.set_speed(speed)
-        self.__call_indi__(
-            f"""
-                <newNumberVector device="Telescope Simulator" name="EQUATORIAL_EOD_COORD">
-                    <oneNumber name="DEC">
-                      {eq_coords.dec}
-                    </oneNumber>
-                    <oneNumber name="RA">
-                      {eq_coords.ra}
-                    </oneNumber>
-                </newNumberVector>
-            """
+        return [
+            self.__unpark_command__(),
+            *self.__speed_commands__(speed),
+            self.__eq_coords_command__(eq_coords),
+        ]
+
+    def sync(self):
+        """ 
+            Register the telescope in park position
+            Calculate the corrisponding equatorial coordinate
+        """
+        self.sync_time = datetime.utcnow()
+        aa_coords = AltazimutalCoords(
+            alt=config.Config.getFloat("park_alt", "telescope"),
+            az=config.Config.getFloat("park_az", "telescope")
+        )
+        eq_coords = self.__altaz2radec(aa_coords)
+        self.__transaction__(
+            [
+                self.__coord_set_command__(slew=False, track=False, sync=True),
+                self.__eq_coords_command__(eq_coords),
+                self.__coord_set_command__(slew=False, track=True, sync=False),
+            ]
         )
-    
+        self.sync_status = True
+
+    def move(self, aa_coords: AltazimutalCoords | EquatorialCoords, speed=TelescopeSpeed.SPEED_TRACKING):
+        self.__transaction__(self.__move_commands__(aa_coords, speed))
+
     def set_speed(self, speed: TelescopeSpeed):
-        if speed is TelescopeSpeed.SPEED_NOT_TRACKING:
-            self.__call_indi__(
-                """
-                    <newSwitchVector device="Telescope Simulator" name="TELESCOPE_TRACK_STATE">
-                        <oneSwitch name="TRACK_OFF">
-                            On
-                        </oneSwitch>
-                    </newSwitchVector>
-                """
-            )
-        else:
-            self.__call_indi__(
-                """
-                    <newSwitchVector device="Telescope Simulator" name="TELESCOPE_TRACK_STATE">
-                        <oneSwitch name="TRACK_ON">
-                            On
-                        </oneSwitch>
-                    </newSwitchVector>
-                """
-            )
-            self.__call_indi__(
-                f"""
-                    <newSwitchVector device="Telescope Simulator" name="ON_COORD_SET">
-                        <oneSwitch name="SLEW">
-                            {"On" if speed == TelescopeSpeed.SPEED_SLEWING else "Off"}
-                        </oneSwitch>
-                        <oneSwitch name="TRACK">
-                            {"On" if speed == TelescopeSpeed.SPEED_TRACKING else "Off"}
-                        </oneSwitch>
-                        <oneSwitch name="SYNC">
-                            Off
-                        </oneSwitch>
-                    </newSwitchVector>
-                """
-            )
+        self.__transaction__(self.__speed_commands__(speed))
 
     def get_aa_coords(self):
         eq_coords = self.get_eq_coords()
         aa_coords = self.__radec2altaz(eq_coords)
-        logger.debug(f"Coordinate altazimutali {aa_coords}")
-        logger.debug(f"Riconversione in coordinate equatoriali {self.__altaz2radec(aa_coords)}")
+        logger.debug("Coordinate altazimutali %s", aa_coords)
         return aa_coords
 
     def get_eq_coords(self):
-        root = self.__call_indi__(
-            """
-            <getProperties device="Telescope Simulator" version="1.7" name="EQUATORIAL_EOD_COORD"/>
-            """
-        )
-
-        for coords in root.findall("defNumber"):
-            if coords.attrib["name"] == "RA":
-                ra = round(float(coords.text), 2)
-            elif coords.attrib["name"] == "DEC":
-                dec = round(float(coords.text), 2)
-
-        eq_coords = EquatorialCoords(ra=ra, dec=dec)
-        logger.debug(f"Coordinate equatoriali {eq_coords}")
+        coords = self.__property__("EQUATORIAL_EOD_COORD").values
+        eq_coords = EquatorialCoords(ra=round(coords["RA"], 2), dec=round(coords["DEC"], 2))
+        logger.debug("Coordinate equatoriali %s", eq_coords)
         return eq_coords
 
     def get_speed(self):
-        root = self.__call_indi__(
-            """
-            <getProperties device="Telescope Simulator" version="1.7" name="EQUATORIAL_EOD_COORD"/>
-            """
-        )
-        state = root.attrib["state"].strip()
+        state = self.__property__("EQUATORIAL_EOD_COORD").state
 
         match state:
             case "Ok":
@@ -213,48 +234,39 @@ class Telescope(BaseTelescope):
                 return TelescopeSpeed.SPEED_ERROR
 
     def park(self, speed=TelescopeSpeed.SPEED_NOT_TRACKING):
-        self.move(
-            aa_coords=AltazimutalCoords(
-                alt=config.Config.getFloat("park_alt", "telescope"),
-                az=config.Config.getFloat("park_az", "telescope")
-            ),
-            speed=speed
+        aa_coords = AltazimutalCoords(
+            alt=config.Config.getFloat("park_alt", "telescope"),
+            az=config.Config.getFloat("park_az", "telescope")
         )
-        self.__call_indi__(
-            """
-            <newSwitchVector device="Telescope Simulator" name="TELESCOPE_TRACK_STATE">
-                <oneSwitch name="TRACK_OFF">
-                    On
-                </oneSwitch>
-            </newSwitchVector>
-            """
+        self.__transaction__(
+            [
+                *self.__move_commands__(aa_coords, speed),
+                self.__track_state_command__(track=False),
+            ]
         )
 
     def flat(self, speed=TelescopeSpeed.SPEED_NOT_TRACKING):
-        self.move(
-            aa_coords=AltazimutalCoords(
-                alt=config.Config.getFloat("flat_alt", "telescope"),
-                az=config.Config.getFloat("flat_az", "telescope")
-            ),
-            speed=speed
+        aa_coords = AltazimutalCoords(
+            alt=config.Config.getFloat("flat_alt", "telescope"),
+            az=config.Config.getFloat("flat_az", "telescope")
         )
-        self.__call_indi__(
-            """
-            <newSwitchVector device="Telescope Simulator" name="TELESCOPE_TRACK_STATE">
-                <oneSwitch name="TRACK_OFF">
-                    On
-                </oneSwitch>
-            </newSwitchVector>
-            """
+        self.__transaction__(
+            [
+                *self.__move_commands__(aa_coords, speed),
+                self.__track_state_command__(track=False),
+            ]
         )
 
-TELESCOPE = Telescope(hostname=config.Config.getValue('hostname', 'telescope'), port=config.Config.getInt('port', 'telescope'))
+TELESCOPE = Telescope(
+    hostname=config.Config.getValue('hostname', 'telescope'),
+    port=config.Config.getInt('port', 'telescope'),
+    timeout=config.Config.getFloat('timeout', 'telescope'),
+    max_staleness=config.Config.getFloat('max_staleness', 'telescope')
+)
 
 
 if __name__ == '__main__':
-    t = Telescope()
-    t.port = 7624
-    t.hostname = "localhost"
+    t = Telescope(hostname="localhost", port=7624)
     # #t.park()
     # # sleep(5)
     # # t.flat()
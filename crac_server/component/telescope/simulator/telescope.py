@@ -5,121 +5,193 @@ from crac_protobuf.telescope_pb2 import (
     TelescopeSpeed,
 )
 from crac_server import config
+from crac_server.component.clock import CLOCK, Clock
 from crac_server.component.telescope.telescope import Telescope as BaseTelescope
 from crac_server.config import Config
+import atexit
 import datetime
 import logging
+import math
 import os
-from time import sleep
+import threading
+import time
 
 
 logger = logging.getLogger(__name__)
+TELESCOPE_PATH = os.path.join(os.path.dirname(__file__), 'telescope.ini')
+# the (tr, sl) flags of telescope.ini for every speed
+FLAGS = {
+    TelescopeSpeed.SPEED_NOT_TRACKING: (1, 1),
+    TelescopeSpeed.SPEED_TRACKING: (0, 1),
+    TelescopeSpeed.SPEED_SLEWING: (1, 0),
+}
 
 
 class Telescope(BaseTelescope):
-    def __init__(self):
+
+    """
+        A telescope held in memory: a move slews both axes towards the target
+        at slew_rate degrees per second of the simulator clock, reporting SPEED_SLEWING
+        until the slowest axis gets there and the requested speed afterwards.
+        The position is computed from the clock when it's read, without any I/O.
+        With a persist_interval the state is also written to telescope.ini in background,
+        at most once every persist_interval seconds and only if it changed,
+        and it's read back at startup
+    """
+
+    def __init__(self, clock: Clock = CLOCK, slew_rate: float = 2.0, persist_interval: float = 0, path: str = TELESCOPE_PATH):
         super().__init__()
+        self.clock = clock
+        self.slew_rate = slew_rate
+        self.path = path
+        self.lock = threading.Lock()
+        self.__origin__ = (0.0, 0.0)
+        self.__target__ = (0.0, 0.0)
+        self.__start__ = 0.0
+        self.__arrival__ = 0.0
+        self.__speed__ = TelescopeSpeed.SPEED_TRACKING
+        self.__written__ = None
+        self.__writing__ = threading.Lock()
+        self.persist_interval = persist_interval
+        if persist_interval > 0:
+            self.__load__()
+            threading.Thread(target=self.__persist__, args=(persist_interval,), name="telescope-ini", daemon=True).start()
+            atexit.register(self.flush)
 
     def disconnect(self) -> bool:
+        if self.persist_interval > 0:
+            self.flush()
         return True
-    
+
     def sync(self):
-        """ 
+        """
             Register the telescope in park position
             Calculate the corrisponding equatorial coordinate
         """
         self.sync_time = datetime.datetime.utcnow()
-        aa_coords = AltazimutalCoords(
-            alt=Config.getFloat("park_alt", "telescope"),
-            az=Config.getFloat("park_az", "telescope")
-        )
-        telescope_config = ConfigParser()
-        telescope_config["coords"] = {'alt': str(aa_coords.alt), 'az': str(aa_coords.az), 'tr': 1, 'sl': 1, 'error': 0}
-        telescope_path = os.path.join(os.path.dirname(__file__), 'telescope.ini')
-        with open(telescope_path, 'w') as telescope_file:
-            telescope_config.write(telescope_file)
+        park = (Config.getFloat("park_alt", "telescope"), Config.getFloat("park_az", "telescope"))
+        with self.lock:
+            now = self.clock.now()
+            self.__origin__ = self.__target__ = park
+            self.__start__ = self.__arrival__ = now
+            self.__speed__ = TelescopeSpeed.SPEED_NOT_TRACKING
         self.sync_status = True
 
-    def park(self):
-        self.move(
-            aa_coords=AltazimutalCoords(
+    def park(self, speed=TelescopeSpeed.SPEED_NOT_TRACKING):
+        self.__goto__(
+            AltazimutalCoords(
                 alt=config.Config.getFloat("park_alt", "telescope"),
                 az=config.Config.getFloat("park_az", "telescope")
             ),
-            speed=TelescopeSpeed.SPEED_SLEWING
+            speed
         )
-        sleep(10)
-        super().park()
-    
-    def flat(self):
-        self.move(
-            aa_coords=AltazimutalCoords(
+
+    def flat(self, speed=TelescopeSpeed.SPEED_NOT_TRACKING):
+        self.__goto__(
+            AltazimutalCoords(
                 alt=config.Config.getFloat("flat_alt", "telescope"),
                 az=config.Config.getFloat("flat_az", "telescope")
             ),
-            speed=TelescopeSpeed.SPEED_SLEWING
+            speed
         )
-        sleep(10)
-        super().flat()
 
     def set_speed(self, speed: TelescopeSpeed):
-        if speed == TelescopeSpeed.SPEED_TRACKING:
-            sl = 1
-            tr = 0
-        elif speed == TelescopeSpeed.SPEED_SLEWING:
-            sl = 0
-            tr = 1
-        else:
-            sl = 1
-            tr = 1
-        aa_coords = self.get_aa_coords()
-        telescope_config = ConfigParser()
-        telescope_config["coords"] = {'alt': str(aa_coords.alt), 'az': str(aa_coords.az), 'tr': str(tr), 'sl': str(sl), 'error': 0}
-        telescope_path = os.path.join(os.path.dirname(__file__), 'telescope.ini')
-        with open(telescope_path, 'w') as telescope_file:
-            telescope_config.write(telescope_file)
-        logger.debug(f"Telescope coords: {aa_coords}")
+        """ The speed of the telescope, at the end of the slew if it's slewing """
+        with self.lock:
+            self.__speed__ = speed
+        logger.debug("Telescope speed: %s", speed)
 
     def move(self, aa_coords: AltazimutalCoords, speed: TelescopeSpeed):
-        if speed == TelescopeSpeed.SPEED_TRACKING:
-            sl = 1
-            tr = 0
-        elif speed == TelescopeSpeed.SPEED_SLEWING:
-            sl = 0
-            tr = 1
-        else:
-            sl = 1
-            tr = 1
-        telescope_config = ConfigParser()
-        telescope_config["coords"] = {'alt': str(aa_coords.alt), 'az': str(aa_coords.az), 'tr': str(tr), 'sl': str(sl), 'error': 0}
-        telescope_path = os.path.join(os.path.dirname(__file__), 'telescope.ini')
-        with open(telescope_path, 'w') as telescope_file:
-            telescope_config.write(telescope_file)
+        self.__slew__(aa_coords, speed)
 
     def get_aa_coords(self) -> AltazimutalCoords:
-        telescope_path = os.path.join(os.path.dirname(__file__), 'telescope.ini')
-        telescope_config = ConfigParser()
-        telescope_config.read(telescope_path)
-        alt = telescope_config.get("coords", "alt", fallback=0)
-        az = telescope_config.get("coords", "az", fallback=0)
-        return AltazimutalCoords(alt=float(alt), az=float(az))
+        with self.lock:
+            alt, az = self.__position__(self.clock.now())
+        return AltazimutalCoords(alt=alt, az=az)
 
     def get_eq_coords(self) -> EquatorialCoords:
         aa_coords = self.get_aa_coords()
         return self.__altaz2radec(aa_coords)
 
     def get_speed(self) -> TelescopeSpeed:
-        telescope_path = os.path.join(os.path.dirname(__file__), 'telescope.ini')
+        with self.lock:
+            if self.clock.now() < self.__arrival__:
+                return TelescopeSpeed.SPEED_SLEWING
+            return self.__speed__
+
+    def flush(self) -> None:
+
+        """ Write the state to telescope.ini, if it changed since the last write """
+
+        with self.lock:
+            alt, az = self.__position__(self.clock.now())
+            speed = TelescopeSpeed.SPEED_SLEWING if self.clock.now() < self.__arrival__ else self.__speed__
+        tr, sl = FLAGS.get(speed, FLAGS[TelescopeSpeed.SPEED_TRACKING])
+        state = (alt, az, tr, sl)
+        with self.__writing__:
+            if state == self.__written__:
+                return
+            telescope_config = ConfigParser()
+            telescope_config["coords"] = {'alt': str(alt), 'az': str(az), 'tr': str(tr), 'sl': str(sl), 'error': '0'}
+            # a reader never sees a half written file
+            temporary = f"{self.path}.tmp"
+            with open(temporary, 'w') as telescope_file:
+                telescope_config.write(telescope_file)
+            os.replace(temporary, self.path)
+            self.__written__ = state
+
+    def __slew__(self, aa_coords: AltazimutalCoords, speed: TelescopeSpeed) -> float:
+
+        """ Start slewing from the current position to aa_coords, return the seconds of the slew """
+
+        with self.lock:
+            now = self.clock.now()
+            self.__origin__ = self.__position__(now)
+            self.__target__ = (aa_coords.alt, aa_coords.az)
+            distance = max(abs(target - origin) for origin, target in zip(self.__origin__, self.__target__))
+            seconds = distance / self.slew_rate if self.slew_rate > 0 else 0.0
+            self.__start__ = now
+            self.__arrival__ = now + seconds
+            self.__speed__ = speed
+        logger.debug("Telescope slewing to %s in %s s", aa_coords, seconds)
+        return seconds
+
+    def __goto__(self, aa_coords: AltazimutalCoords, speed: TelescopeSpeed):
+        seconds = self.__slew__(aa_coords, speed)
+        if seconds > 0:
+            self.clock.sleep(seconds)
+
+    def __position__(self, now: float) -> tuple[float, float]:
+        if now >= self.__arrival__:
+            return self.__target__
+        travel = (now - self.__start__) * self.slew_rate
+        return tuple(
+            target if travel >= abs(target - origin) else origin + math.copysign(travel, target - origin)
+            for origin, target in zip(self.__origin__, self.__target__)
+        )
+
+    def __load__(self):
         telescope_config = ConfigParser()
-        telescope_config.read(telescope_path)
-        tr = telescope_config.get("coords", "tr", fallback=0)
-        sl = telescope_config.get("coords", "sl", fallback=1)
-        if tr == "1" and sl == "1":
-            return TelescopeSpeed.SPEED_NOT_TRACKING
-        elif tr == "0" and sl == "1":
-            return TelescopeSpeed.SPEED_TRACKING
-        elif tr == "1" and sl == "0":
-            return TelescopeSpeed.SPEED_SLEWING
-
-
-TELESCOPE = Telescope()
\ No newline at end of file
+        telescope_config.read(self.path)
+        alt = telescope_config.getfloat("coords", "alt", fallback=0)
+        az = telescope_config.getfloat("coords", "az", fallback=0)
+        flags = (telescope_config.getint("coords", "tr", fallback=0), telescope_config.getint("coords", "sl", fallback=1))
+        speeds = {value: speed for speed, value in FLAGS.items()}
+        self.__origin__ = self.__target__ = (alt, az)
+        self.__speed__ = speeds.get(flags, TelescopeSpeed.SPEED_TRACKING)
+        self.__written__ = (alt, az, *flags)
+
+    def __persist__(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("Error writing the state of the telescope to %s", self.path)
+
+
+TELESCOPE = Telescope(
+    CLOCK,
+    Config.getFloat("slew_rate", "simulator"),
+    Config.getFloat("persist_interval", "simulator"),
+)
@@ -1,15 +1,9 @@
 from abc import ABC, abstractmethod
-from astropy.coordinates import (
-    EarthLocation,
-    AltAz,
-    SkyCoord
-)
-from astropy.time import Time
-from astropy import units as u
 import logging
 from datetime import datetime
 from crac_server import config
-from typing import Dict
+from crac_server.component.telescope.transform import TRANSFORM
+import numpy as np
 from crac_protobuf.telescope_pb2 import (
     TelescopeStatus,
     AltazimutalCoords,
@@ -87,7 +81,7 @@ class Telescope(ABC):
 
     def get_status(self, aa_coords: AltazimutalCoords) -> TelescopeStatus:
         if not aa_coords or not aa_coords.alt or not aa_coords.az:
-            logger.error("Errore Telescopio: "+str(aa_coords))
+            logger.error("Errore Telescopio: %s", aa_coords)
             return TelescopeStatus.ERROR
         elif self.__within_park_alt_range(aa_coords.alt) and self.__within_park_az_range(aa_coords.az):
             return TelescopeStatus.PARKED
@@ -109,46 +103,37 @@ class Telescope(ABC):
             elif config.Config.getInt("azNE", "azimut") <= aa_coords.az <= config.Config.getInt("azSE", "azimut"):
                 return TelescopeStatus.EAST
 
-    def __radec2altaz(self, eq_coords: EquatorialCoords, obstime = datetime.utcnow()):
-        logger.debug("astropy ra received: %s", eq_coords.ra)
-        logger.debug("astropy dec received: %s", eq_coords.dec)
-        timestring = obstime.strftime(format="%Y-%m-%d %H:%M:%S")
-        logger.debug("astropy timestring: %s", timestring)
-        observing_time = Time(timestring)
-        lat = config.Config.getValue("lat", "geography")
-        lon = config.Config.getValue("lon", "geography")
-        height = config.Config.getInt("height", "geography")
-        observing_location = EarthLocation(lat=lat, lon=lon, height=height*u.m)
-        aa = AltAz(location=observing_location, obstime=observing_time)
-        equinox = config.Config.getValue("equinox", "geography")
-        coord = SkyCoord(ra=str(eq_coords.ra)+"h", dec=str(eq_coords.dec)+"d", equinox=equinox, frame="fk5")
-        altaz_coords = coord.transform_to(aa)
-        aa_coords = AltazimutalCoords(alt=float(altaz_coords.alt / u.deg), az=float(altaz_coords.az / u.deg))
-        logger.debug("astropy altaz calculated: alt %s az %s", aa_coords.alt, aa_coords.az)
-        return aa_coords
-
-    def __altaz2radec(self, aa_coords: AltazimutalCoords, decimal_places: None | int = None, obstime = datetime.utcnow()):
-        logger.debug('obstime: %s', obstime)
-        timestring = obstime.strftime(format="%Y-%m-%d %H:%M:%S")
-        logger.debug("astropy timestring: %s", timestring)
-        time = Time(timestring)
-        logger.debug("astropy time: %s", time)
-        lat = config.Config.getValue("lat", "geography")
-        lon = config.Config.getValue("lon", "geography")
-        height = config.Config.getInt("height", "geography")
-        equinox = config.Config.getValue("equinox", "geography")
-        observing_location = EarthLocation(lat=lat, lon=lon, height=height*u.m)
-        aa = AltAz(location=observing_location, obstime=time)
-        alt_az = SkyCoord(alt=aa_coords.alt * u.deg, az=aa_coords.az * u.deg, frame=aa, equinox=equinox)
-        ra_dec = alt_az.transform_to('fk5')
-        ra = float((ra_dec.ra / 15) / u.deg)
-        dec = float(ra_dec.dec / u.deg)
-        logger.debug('ar park (orario decimale): %s', ra)
-        logger.debug('dec park (declinazione decimale): %s', dec)
+    def __radec2altaz(self, eq_coords: EquatorialCoords, obstime: datetime | None = None):
+        logger.debug("ra received: %s", eq_coords.ra)
+        logger.debug("dec received: %s", eq_coords.dec)
+        return TRANSFORM.radec2altaz(eq_coords, obstime)
+
+    def __altaz2radec(self, aa_coords: AltazimutalCoords, decimal_places: None | int = None, obstime: datetime | None = None):
+        eq_coords = TRANSFORM.altaz2radec(aa_coords, obstime)
+        logger.debug('ar (orario decimale): %s', eq_coords.ra)
+        logger.debug('dec (declinazione decimale): %s', eq_coords.dec)
         if decimal_places:
-            ra = round(ra, decimal_places)
-            dec = round(dec, decimal_places)
-        return EquatorialCoords(ra=ra, dec=dec)
+            eq_coords.ra = round(eq_coords.ra, decimal_places)
+            eq_coords.dec = round(eq_coords.dec, decimal_places)
+        return eq_coords
+
+    def radec2altaz_batch(self, ra: np.ndarray, dec: np.ndarray, obstime) -> tuple[np.ndarray, np.ndarray]:
+
+        """
+            Convert arrays of equatorial coordinates (ra in hours, dec in degrees)
+            observed at the given times to arrays of (alt, az) in degrees
+        """
+
+        return TRANSFORM.radec2altaz_batch(ra, dec, obstime)
+
+    def altaz2radec_batch(self, alt: np.ndarray, az: np.ndarray, obstime) -> tuple[np.ndarray, np.ndarray]:
+
+        """
+            Convert arrays of horizontal coordinates (in degrees)
+            observed at the given times to arrays of (ra, dec), ra in hours and dec in degrees
+        """
+
+        return TRANSFORM.altaz2radec_batch(alt, az, obstime)
 
     def is_below_curtains_area(self, alt: float) -> bool:
         return alt <= config.Config.getFloat("max_secure_alt", "telescope")
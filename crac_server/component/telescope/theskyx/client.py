@@ -0,0 +1,121 @@
+import logging
+import os
+import re
+import socket
+import string
+import threading
+from crac_server.metrics import METRICS
+
+
+logger = logging.getLogger(__name__)
+
+
+class ScriptTemplate:
+
+    """
+        A TheSkyX javascript read from disk once.
+        A parametric script is split at load time in literal chunks and fields
+        (with the str.format syntax, so {{ and }} stand for literal braces),
+        rendering it only joins the chunks with the values.
+        A script without parameters is sent as it is.
+    """
+
+    def __init__(self, path: str, parametric: bool = True):
+        with open(path, 'r') as script:
+            text = script.read()
+        self.path = path
+        self.parametric = parametric
+        self.raw = text.encode('utf-8')
+        self.parts = [
+            (literal, field, spec)
+            for literal, field, spec, _ in string.Formatter().parse(text)
+        ] if parametric else []
+
+    @staticmethod
+    def load(name: str, parametric: bool = True):
+        return ScriptTemplate(os.path.join(os.path.dirname(__file__), name), parametric)
+
+    def render(self, **kwargs) -> bytes:
+        if not self.parametric:
+            return self.raw
+        chunks = []
+        for literal, field, spec in self.parts:
+            chunks.append(literal)
+            if field is not None:
+                chunks.append(format(kwargs[field], spec or ""))
+        return "".join(chunks).encode('utf-8')
+
+
+class TheSkyXClient:
+
+    """
+        Persistent connection to the TheSkyX TCP server.
+        A reply is "<output>|<message>. Error = <code>.":
+        it's read until the | terminator and the status message that follows it,
+        regardless of how many segments it arrives in.
+        If the connection has been lost, it's opened again and the script is sent once more.
+    """
+
+    REPLY_END = re.compile(rb"\|.*?Error = \d+\.", re.S)
+
+    def __init__(self, hostname: str, port: int = 3040, timeout: float = 5):
+        self.hostname = hostname
+        self.port = port
+        self.timeout = timeout
+        self.connected = False
+        self.lock = threading.Lock()
+        self.__socket__: socket.socket = None
+
+    def open_connection(self) -> None:
+        if not self.connected:
+            self.__socket__ = socket.create_connection((self.hostname, self.port), timeout=self.timeout)
+            self.__socket__.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connected = True
+
+    def close_connection(self) -> None:
+        if self.connected:
+            self.__socket__.close()
+            self.connected = False
+
+    def call(self, script: bytes) -> bytes:
+        with METRICS.timer("crac_driver_duration_seconds", driver="theskyx", operation="call"), self.lock:
+            reused = self.connected
+            try:
+                return self.__send_and_read__(script)
+            except ConnectionError:
+                self.close_connection()
+                if not reused:
+                    raise
+            logger.info("Connessione con The Sky chiusa, la riapro")
+            try:
+                return self.__send_and_read__(script)
+            except OSError:
+                self.close_connection()
+                raise
+
+    def __send_and_read__(self, script: bytes) -> bytes:
+        self.open_connection()
+        try:
+            self.__socket__.sendall(script)
+        except OSError as err:
+            raise ConnectionError(err) from err
+        return self.__read_reply__()
+
+    def __read_reply__(self) -> bytes:
+        data = b""
+        while not self.REPLY_END.search(data):
+            try:
+                chunk = self.__socket__.recv(4096)
+            except socket.timeout:
+                if b"|" in data:
+                    break
+                self.close_connection()
+                raise TimeoutError("No answer from TheSkyX")
+            if not chunk:
+                self.close_connection()
+                if b"|" in data:
+                    break
+                raise ConnectionError("TheSkyX closed the connection")
+            data += chunk
+        logger.debug("Data received from js: %s", data)
+        return data
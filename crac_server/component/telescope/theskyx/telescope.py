@@ -1,133 +1,215 @@
 from datetime import datetime
-import threading
 from component.telescope.telescope import Telescope as BaseTelescope
-from crac_protobuf.telescope_pb2 import TelescopeStatus
+from crac_protobuf.telescope_pb2 import (
+    AltazimutalCoords,
+    EquatorialCoords,
+    TelescopeSpeed,
+    TelescopeStatus,
+)
 from crac_server import config
+from crac_server.component.telescope.theskyx.client import ScriptTemplate, TheSkyXClient
 import logging
 import json
-import os
 import re
-import socket
-from typing import Dict
+import threading
+from time import monotonic
+from typing import NamedTuple
 
 
 logger = logging.getLogger(__name__)
-lock = threading.Lock()
+GET_ALT_AZ = ScriptTemplate.load('get_alt_az.js', parametric=False)
+SET_MOVE_TRACK = ScriptTemplate.load('set_move_track.js')
+SYNC_TELE = ScriptTemplate.load('sync_tele.js')
+DISCONNECT_TELE = ScriptTemplate.load('disconnect_tele.js', parametric=False)
+
+
+class Coords(NamedTuple):
+
+    """ Immutable snapshot of the telescope read from TheSkyX """
+
+    alt: float
+    az: float
+    tr: int
+    sl: int
+    error: int
+    timestamp: float
 
 
 class Telescope(BaseTelescope):
 
-    def __init__(self):
+    """
+        Driver for TheSkyX.
+        A background thread polls get_alt_az.js every poll_interval seconds
+        and replaces self.coords with a new immutable snapshot,
+        so that the reads never wait for TheSkyX.
+        The poller starts with the first read and stops on disconnect
+    """
+
+    def __init__(self, hostname: str = "localhost", port: int = 3040, timeout: float = 5, poll_interval: float = 1):
         super().__init__()
-        self.hostname = config.Config.getValue("theskyx_ip", "server")
-        self.port = 3040
-        self.script = os.path.join(os.path.dirname(__file__), 'get_alt_az.js')
-        self.script_move_track = os.path.join(os.path.dirname(__file__), 'set_move_track.js')
-        self.script_sync_tele = os.path.join(os.path.dirname(__file__), 'sync_tele.js')
-        self.script_disconnect_tele = os.path.join(os.path.dirname(__file__), 'disconnect_tele.js')
+        self.client = TheSkyXClient(hostname, port, timeout)
+        self.script = GET_ALT_AZ
+        self.script_move_track = SET_MOVE_TRACK
+        self.script_sync_tele = SYNC_TELE
+        self.script_disconnect_tele = DISCONNECT_TELE
         self.connected = False
-
-    
-    def disconnect(self) -> None:
-        self.__call_thesky__(script=self.script_disconnect_tele)
+        self.status = None
+        self.coords: Coords | None = None
+        self.poll_interval = poll_interval
+        self.__poller__: threading.Thread = None
+        self.__stop_polling__ = threading.Event()
+        self.__poller_lock__ = threading.Lock()
+
+    def disconnect(self) -> bool:
+        self.stop_polling()
+        try:
+            self.__call_thesky__(script=self.script_disconnect_tele)
+        except (ConnectionError, TimeoutError):
+            logger.warning("TheSkyX non raggiungibile durante la disconnessione")
+        self.close_connection()
+        self.coords = None
         return True
 
-    def sync(self, **kwargs) -> Dict[str, float]:
+    def sync(self):
         logger.info("sincronizzo il telescopio")
-        alt_deg = config.Config.getFloat("park_alt", "telescope")
-        az_deg = config.Config.getFloat("park_az", "telescope")
+        aa_coords = AltazimutalCoords(
+            alt=config.Config.getFloat("park_alt", "telescope"),
+            az=config.Config.getFloat("park_az", "telescope")
+        )
         self.sync_time = datetime.utcnow()
-        eq_coords = self.altaz2radec(self.sync_time, alt=alt_deg, az=az_deg)
+        eq_coords = self.__altaz2radec(aa_coords, obstime=self.sync_time)
         try:
             data = self.__call_thesky__(script=self.script_sync_tele, ra=eq_coords.ra, dec=eq_coords.dec)
             logger.info("data per il sync: %s", data)
-        except (ConnectionError, TimeoutError, json.decoder.JSONDecodeError):
+        except (ConnectionError, TimeoutError):
             self.__disconnection__()
             self.sync_status = False
         else:
-            self.__parse_result__(data.decode("utf-8"))
-            logger.debug("sincronizzo il telescopio a queste coordinate %s", kwargs)
-            self.sync_status = True
+            error = self.__is_error__(data.decode("utf-8"))
+            if error:
+                logger.error("Errore %s nel sync del telescopio", error)
+            self.sync_status = not error
+            self.read()
+
+    def move(self, aa_coords: AltazimutalCoords | EquatorialCoords, speed: TelescopeSpeed = TelescopeSpeed.SPEED_TRACKING):
+        aa_coords = self.__radec2altaz(aa_coords) if isinstance(aa_coords, EquatorialCoords) else aa_coords
+        self.move_tele(alt=aa_coords.alt, az=aa_coords.az, tr=1 if speed == TelescopeSpeed.SPEED_TRACKING else 0)
+
+    def set_speed(self, speed: TelescopeSpeed):
+        self.move_tele(alt=None, az=None, tr=1 if speed == TelescopeSpeed.SPEED_TRACKING else 0)
+
+    def get_aa_coords(self) -> AltazimutalCoords:
+        coords = self.__snapshot__()
+        if coords is None:
+            return AltazimutalCoords()
+        return AltazimutalCoords(alt=coords.alt, az=coords.az)
+
+    def get_eq_coords(self) -> EquatorialCoords:
+        return self.__altaz2radec(self.get_aa_coords())
+
+    def get_speed(self) -> TelescopeSpeed:
+        coords = self.__snapshot__()
+        if coords is None or coords.error:
+            return TelescopeSpeed.SPEED_ERROR
+        elif not coords.sl:
+            return TelescopeSpeed.SPEED_SLEWING
+        elif coords.tr:
+            return TelescopeSpeed.SPEED_TRACKING
+        else:
+            return TelescopeSpeed.SPEED_NOT_TRACKING
 
     def open_connection(self) -> None:
-        if not self.connected:
-            self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.s.connect((self.hostname, self.port))
-            self.connected = True
+        self.client.open_connection()
+        self.connected = self.client.connected
+
+    def start_polling(self) -> None:
+        with self.__poller_lock__:
+            if self.__poller__ and self.__poller__.is_alive():
+                return
+            self.__stop_polling__ = threading.Event()
+            self.__poller__ = threading.Thread(target=self.__poll__, args=(self.__stop_polling__,), name="theskyx-poller", daemon=True)
+            self.__poller__.start()
+
+    def stop_polling(self) -> None:
+        with self.__poller_lock__:
+            self.__stop_polling__.set()
+            self.__poller__ = None
+
+    def __poll__(self, stop: threading.Event):
+        while not stop.wait(self.poll_interval):
+            self.read()
+
+    def __snapshot__(self) -> Coords | None:
+        if self.__poller__ is None:
+            self.read()
+            self.start_polling()
+        return self.coords
 
-    def update_coords(self) -> Dict[str, int]:
-        logger.info("Leggo le coordinate")
+    def update_coords(self) -> Coords:
         data = self.__call_thesky__(self.script)
-        logger.info("data per il update_coords: %s", data)
         logger.debug("Coordinate e status letti: %s", data)
-
-        self.__parse_result__(data.decode("utf-8"))
+        self.coords = self.__parse_result__(data.decode("utf-8"))
         return self.coords
 
-    def move_tele(self, **kwargs) -> Dict[str, int]:
+    def move_tele(self, **kwargs) -> None:
         logger.info("muovo il telescopio")
         try:
             data = self.__call_thesky__(script=self.script_move_track, **kwargs)
             logger.info("data per il move_tele: %s", data)
-        except (ConnectionError, TimeoutError, json.decoder.JSONDecodeError):
+        except (ConnectionError, TimeoutError):
             self.__disconnection__()
         else:
-            logger.debug("Parking %s", data)
-            self.coords["error"] = self.__is_error__(data.decode("utf-8"))
-            logger.info("data error per il move_tele: %s", self.coords["error"])
-            self.update_coords()
-            self.__update_status__()
-            self.coords
+            error = self.__is_error__(data.decode("utf-8"))
+            if error:
+                logger.error("Errore %s nel movimento del telescopio", error)
+            self.read()
 
     def read(self):
         try:
             self.update_coords()
         except (ConnectionError, TimeoutError, json.decoder.JSONDecodeError):
-            self.__disconnection__()
+            if self.status is not TelescopeStatus.LOST:
+                self.__disconnection__()
         else:
-            self.__update_status__()
+            self.status = None
 
     def close_connection(self) -> None:
-        if self.connected:
-            self.s.close()
-            self.connected = False
+        self.client.close_connection()
+        self.connected = False
 
     def __disconnection__(self):
         logger.exception("Connessione con The Sky persa: ")
         self.status = TelescopeStatus.LOST
-        self.connected = False
-        self.disconnect()
-
-    def __call_thesky__(self, script: str, **kwargs) -> bytes:
-        with lock:
-            self.open_connection()
-            with open(script, 'r') as p:
-                file = p.read()
-                if kwargs:
-                    if kwargs.get("az") is None:
-                        kwargs["az"] = ""
-                    if kwargs.get("alt") is None:
-                        kwargs["alt"] = ""
-                    file = file.format(**kwargs)
-                self.s.sendall(file.encode('utf-8'))
-                data = self.s.recv(1024)
-                logger.debug("Data received from js: %s", data)
-           self.close_connection()
+        self.coords = None
+        self.close_connection()
+
+    def __call_thesky__(self, script: ScriptTemplate, **kwargs) -> bytes:
+        if kwargs:
+            if kwargs.get("az") is None:
+                kwargs["az"] = ""
+            if kwargs.get("alt") is None:
+                kwargs["alt"] = ""
+        data = self.client.call(script.render(**kwargs))
+        self.connected = self.client.connected
         return data
 
-    def __parse_result__(self, data: str):
-
-        self.coords["error"] = self.__is_error__(data)
-
-        if not self.coords["error"]:
-            jsonStringEnd = data.find("|")
-            jsonString = data[:jsonStringEnd]
-            coords = json.loads(jsonString)
-            self.coords["alt"] = round(coords["alt"], 2)
-            self.coords["az"] = round(coords["az"], 2)
-            self.coords["tr"] = coords["tr"]
-            self.coords["sl"] = coords["sl"]
-        logger.debug("Coords Telescopio: %s", str(self.coords))
+    def __parse_result__(self, data: str) -> Coords:
+        error = self.__is_error__(data)
+        if error:
+            logger.error("Errore %s nella lettura delle coordinate", error)
+            return Coords(alt=0, az=0, tr=0, sl=1, error=error, timestamp=monotonic())
+
+        coords = json.loads(data[:data.find("|")])
+        snapshot = Coords(
+            alt=round(coords["alt"], 2),
+            az=round(coords["az"], 2),
+            tr=int(coords["tr"]),
+            sl=int(coords["sl"]),
+            error=0,
+            timestamp=monotonic(),
+        )
+        logger.debug("Coords Telescopio: %s", snapshot)
+        return snapshot
 
     def __is_error__(self, input_str, search_reg="Error = ([1-9][^\\d]|\\d{2,})") -> int:
         r = re.search(search_reg, input_str)
@@ -137,3 +219,11 @@ class Telescope(BaseTelescope):
             if r2:
                 error_code = int(r2.group(0))
         return error_code
+
+
+TELESCOPE = Telescope(
+    hostname=config.Config.getValue('hostname', 'telescope'),
+    port=config.Config.getInt('port', 'telescope'),
+    timeout=config.Config.getFloat('timeout', 'telescope'),
+    poll_interval=config.Config.getFloat('poll_interval', 'telescope')
+)
@@ -0,0 +1,202 @@
+from astropy.coordinates import (
+    AltAz,
+    EarthLocation,
+    FK5,
+    SkyCoord,
+)
+from astropy.time import Time
+from astropy import units as u
+from crac_protobuf.telescope_pb2 import (
+    AltazimutalCoords,
+    EquatorialCoords,
+)
+from crac_server.config import Config
+from crac_server.metrics import METRICS
+from datetime import datetime, timezone
+from functools import lru_cache
+import logging
+import math
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Earth rotation rate in radians per SI second (sidereal)
+EARTH_ROTATION_RATE = 7.2921150e-5
+
+
+class TransformEngine:
+
+    """
+        Convert between the equatorial (FK5 at the configured equinox)
+        and the horizontal coordinates of the observatory.
+
+        The site location and the FK5 frame are built once.
+        The exact path runs the full astropy transformation
+        with an AltAz frame cached per second of observation time.
+        The fast path fits, once per time bucket, the rotation matrix
+        that best reproduces the astropy transformation on a set of reference
+        directions, and then only adds the Earth rotation elapsed since the
+        beginning of the bucket: a conversion costs a 3x3 matrix product.
+
+        Accuracy of the fast path compared to the exact one:
+        the annual aberration (up to ~20.5 arcsec) is not a rigid rotation,
+        so the fitted matrix leaves a residual of at most ~25 arcsec on the sky;
+        the Earth rotation is applied around the pole of the catalog equinox
+        instead of the true pole of date, which adds less than 1 arcsec for each
+        minute of bucket length.
+        With the default bucket of 300 seconds the error stays below 30 arcsec
+        (0.01 degrees), smaller than the rounding applied to the coordinates
+        sent to the clients.
+    """
+
+    def __init__(self, lat: str, lon: str, height: int, equinox: str, bucket: int = 300, fast: bool = True):
+        self.location = EarthLocation(lat=lat, lon=lon, height=height*u.m)
+        self.fk5 = FK5(equinox=equinox)
+        self.bucket = bucket
+        self.fast = fast
+        self.__reference_directions__ = TransformEngine.__fibonacci_sphere__(32)
+
+    @staticmethod
+    def from_config():
+        return TransformEngine(
+            lat=Config.getValue("lat", "geography"),
+            lon=Config.getValue("lon", "geography"),
+            height=Config.getInt("height", "geography"),
+            equinox=Config.getValue("equinox", "geography"),
+            bucket=Config.getInt("transform_bucket", "geography"),
+            fast=Config.getValue("transform", "geography") == "fast",
+        )
+
+    def radec2altaz(self, eq_coords: EquatorialCoords, obstime: datetime | None = None) -> AltazimutalCoords:
+        with METRICS.timer("crac_driver_duration_seconds", driver="transform", operation="radec2altaz"):
+            obstime = obstime or datetime.utcnow()
+            if self.fast:
+                rotation = self.__rotation_at__(obstime)
+                alt, az = TransformEngine.__to_spherical__(rotation @ TransformEngine.__to_cartesian__(eq_coords.ra * 15, eq_coords.dec))
+            else:
+                coord = SkyCoord(ra=eq_coords.ra * u.hourangle, dec=eq_coords.dec * u.deg, frame=self.fk5)
+                altaz_coords = coord.transform_to(self.altaz_frame(obstime))
+                alt, az = float(altaz_coords.alt / u.deg), float(altaz_coords.az / u.deg)
+            logger.debug("altaz calculated: alt %s az %s", alt, az)
+            return AltazimutalCoords(alt=alt, az=az)
+
+    def altaz2radec(self, aa_coords: AltazimutalCoords, obstime: datetime | None = None) -> EquatorialCoords:
+        with METRICS.timer("crac_driver_duration_seconds", driver="transform", operation="altaz2radec"):
+            obstime = obstime or datetime.utcnow()
+            if self.fast:
+                rotation = self.__rotation_at__(obstime)
+                dec, ra = TransformEngine.__to_spherical__(rotation.T @ TransformEngine.__to_cartesian__(aa_coords.az, aa_coords.alt))
+            else:
+                alt_az = SkyCoord(alt=aa_coords.alt * u.deg, az=aa_coords.az * u.deg, frame=self.altaz_frame(obstime))
+                ra_dec = alt_az.transform_to(self.fk5)
+                ra, dec = float(ra_dec.ra / u.deg), float(ra_dec.dec / u.deg)
+            logger.debug("radec calculated: ra %s dec %s", ra / 15, dec)
+            return EquatorialCoords(ra=ra / 15, dec=dec)
+
+    def radec2altaz_batch(self, ra: np.ndarray, dec: np.ndarray, obstime) -> tuple[np.ndarray, np.ndarray]:
+
+        """
+            Vectorized conversion of many points with a single astropy transformation.
+            ra is in hours, dec in degrees, obstime is anything accepted by astropy Time
+            (an array of datetime, datetime64 or iso strings, UTC) and is broadcast against the coordinates.
+            The cost grows with the number of distinct observation times, so for a grid
+            pass the times as a column, e.g. times[:, None], to get an array of shape (times, points).
+            Return the arrays (alt, az) in degrees
+        """
+
+        coord = SkyCoord(ra=np.asarray(ra) * u.hourangle, dec=np.asarray(dec) * u.deg, frame=self.fk5)
+        altaz_coords = coord.transform_to(AltAz(location=self.location, obstime=Time(obstime, scale="utc")))
+        return altaz_coords.alt.deg, altaz_coords.az.deg
+
+    def altaz2radec_batch(self, alt: np.ndarray, az: np.ndarray, obstime) -> tuple[np.ndarray, np.ndarray]:
+
+        """
+            Vectorized conversion of many points with a single astropy transformation.
+            alt and az are in degrees, obstime is broadcast as in radec2altaz_batch.
+            Return the arrays (ra, dec), ra in hours and dec in degrees
+        """
+
+        frame = AltAz(location=self.location, obstime=Time(obstime, scale="utc"))
+        alt_az = SkyCoord(alt=np.asarray(alt) * u.deg, az=np.asarray(az) * u.deg, frame=frame)
+        ra_dec = alt_az.transform_to(self.fk5)
+        return ra_dec.ra.hourangle, ra_dec.dec.deg
+
+    def altaz_frame(self, obstime: datetime) -> AltAz:
+        return self.__altaz_frame_at_second__(math.floor(TransformEngine.__timestamp__(obstime)))
+
+    @lru_cache(maxsize=16)
+    def __altaz_frame_at_second__(self, second: int) -> AltAz:
+        return AltAz(location=self.location, obstime=Time(second, format="unix"))
+
+    def __rotation_at__(self, obstime: datetime) -> np.ndarray:
+        timestamp = TransformEngine.__timestamp__(obstime)
+        bucket = math.floor(timestamp / self.bucket)
+        elapsed = timestamp - bucket * self.bucket
+        return self.__bucket_rotation__(bucket) @ TransformEngine.__rotation_z__(-EARTH_ROTATION_RATE * elapsed)
+
+    @lru_cache(maxsize=4)
+    def __bucket_rotation__(self, bucket: int) -> np.ndarray:
+
+        """
+            Orthogonal matrix that best maps (least squares)
+            the FK5 reference directions onto their exact AltAz positions
+            at the beginning of the bucket.
+            The AltAz cartesian axes (north, east, up) are left-handed,
+            so the matrix is an improper rotation and the determinant is not forced
+        """
+
+        source = self.__reference_directions__
+        coord = SkyCoord(
+            ra=np.degrees(np.arctan2(source[:, 1], source[:, 0])) * u.deg,
+            dec=np.degrees(np.arcsin(source[:, 2])) * u.deg,
+            frame=self.fk5
+        )
+        altaz_coords = coord.transform_to(self.__altaz_frame_at_second__(bucket * self.bucket))
+        target = np.stack(
+            [
+                np.cos(altaz_coords.alt.rad) * np.cos(altaz_coords.az.rad),
+                np.cos(altaz_coords.alt.rad) * np.sin(altaz_coords.az.rad),
+                np.sin(altaz_coords.alt.rad),
+            ],
+            axis=1
+        )
+        u_matrix, _, vt_matrix = np.linalg.svd(target.T @ source)
+        logger.debug("computed fast transform rotation for bucket %s", bucket)
+        return u_matrix @ vt_matrix
+
+    @staticmethod
+    def __rotation_z__(angle: float) -> np.ndarray:
+        cos, sin = math.cos(angle), math.sin(angle)
+        return np.array(((cos, -sin, 0.0), (sin, cos, 0.0), (0.0, 0.0, 1.0)))
+
+    @staticmethod
+    def __to_cartesian__(lon: float, lat: float) -> np.ndarray:
+        lon, lat = math.radians(lon), math.radians(lat)
+        return np.array((math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)))
+
+    @staticmethod
+    def __to_spherical__(vector: np.ndarray) -> tuple[float, float]:
+
+        """ Return (lat, lon) in degrees, with lon in [0, 360) """
+
+        x, y, z = vector
+        lat = math.degrees(math.atan2(z, math.hypot(x, y)))
+        lon = math.degrees(math.atan2(y, x)) % 360
+        return lat, lon
+
+    @staticmethod
+    def __fibonacci_sphere__(n: int) -> np.ndarray:
+        i = np.arange(n) + 0.5
+        lat = np.arcsin(1 - 2 * i / n)
+        lon = np.pi * (1 + 5 ** 0.5) * i
+        return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+
+    @staticmethod
+    def __timestamp__(obstime: datetime) -> float:
+        if obstime.tzinfo is None:
+            obstime = obstime.replace(tzinfo=timezone.utc)
+        return obstime.timestamp()
+
+
+TRANSFORM = TransformEngine.from_config()
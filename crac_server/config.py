@@ -1,41 +1,119 @@
 import configparser
+import logging
 import os
-#from base.singleton import Singleton
+import threading
+from types import MappingProxyType
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigSnapshot:
+
+    """
+        Immutable view of config.ini taken at a given moment,
+        with the environment overrides already applied
+        and the values already converted to int and float where possible
+    """
+
+    def __init__(self, path: str):
+        parser = configparser.ConfigParser()
+        if not parser.read(path):
+            logger.warning("Config file %s not found", path)
+
+        values = {}
+        ints = {}
+        floats = {}
+        for section in parser.sections():
+            section_values = {}
+            for key, value in parser.items(section):
+                env_value = Config.__check_environ__(key, section=section)
+                section_values[key] = env_value if env_value else value
+            values[section] = MappingProxyType(section_values)
+            ints[section] = MappingProxyType(ConfigSnapshot.__convert__(section_values, int))
+            floats[section] = MappingProxyType(ConfigSnapshot.__convert__(section_values, float))
+
+        self.path = path
+        self.values = MappingProxyType(values)
+        self.ints = MappingProxyType(ints)
+        self.floats = MappingProxyType(floats)
+
+    @staticmethod
+    def __convert__(section_values: dict[str, str], convert) -> dict:
+        converted = {}
+        for key, value in section_values.items():
+            try:
+                converted[key] = convert(value)
+            except ValueError:
+                pass
+        return converted
+
+    def get_value(self, key: str, section: str) -> str:
+        try:
+            return self.values[section][key.lower()]
+        except KeyError:
+            env_value = Config.__check_environ__(key, section=section)
+            if env_value:
+                return env_value
+            raise
+
+    def get_float(self, key: str, section: str) -> float:
+        try:
+            return self.floats[section][key.lower()]
+        except KeyError:
+            return float(self.get_value(key, section))
+
+    def get_int(self, key: str, section: str) -> int:
+        try:
+            return self.ints[section][key.lower()]
+        except KeyError:
+            return int(self.get_value(key, section))
 
 
 class Config:
 
-    def __init__(self):
-        self.configparser = configparser.ConfigParser()
-        configpath = os.path.join(os.path.dirname(__file__), 'config.ini')
-        self.configparser.read(configpath)
+    """
+        Access point to the configuration.
+        config.ini is parsed once and kept in memory as a ConfigSnapshot,
+        call reload() to read it again from disk
+    """
+
+    path = os.path.join(os.path.dirname(__file__), 'config.ini')
+    snapshot: ConfigSnapshot = None
+    __reload_lock__ = threading.Lock()
 
     @staticmethod
     def getValue(key, section='automazione'):
-        config = Config()
-        env_value = Config.__check_environ__(key, section=section)
-        if env_value:
-            return env_value
-        return config.configparser[section][key]
+        return Config.snapshot.get_value(key, section)
 
     @staticmethod
     def getFloat(key, section='automazione'):
-        config = Config()
-        env_value = Config.__check_environ__(key, section=section)
-        if env_value:
-            return float(env_value)
-        return config.configparser[section].getfloat(key)
+        return Config.snapshot.get_float(key, section)
 
     @staticmethod
     def getInt(key, section='automazione'):
-        config = Config()
-        env_value = Config.__check_environ__(key, section=section)
-        if env_value:
-            return int(env_value)
-        return config.configparser[section].getint(key)
+        return Config.snapshot.get_int(key, section)
+
+    @staticmethod
+    def reload() -> ConfigSnapshot:
+
+        """
+            Parse config.ini and the environment again
+            and replace the current snapshot in a single assignment,
+            so that readers see either the old or the new configuration, never a mix
+        """
+
+        with Config.__reload_lock__:
+            snapshot = ConfigSnapshot(Config.path)
+            Config.snapshot = snapshot
+        logger.info("Configuration loaded from %s", snapshot.path)
+        return snapshot
 
     @staticmethod
     def __check_environ__(key: str, section='automazione'):
         env_key = section.upper() + '_' + key.upper()
         env_value = os.environ.get(env_key)
         return env_value
+
+
+Config.reload()
@@ -0,0 +1,151 @@
+import atexit
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+from crac_server.metrics import METRICS
+
+
+class JsonFormatter(logging.Formatter):
+
+    """ One JSON object per record, the extra attributes of the record included """
+
+    RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "file": record.filename,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in JsonFormatter.RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+
+    """
+        Keep only one of every n records below WARNING of the sampled loggers
+        (and of their children), e.g. {"crac_server.component.curtains.curtains": 50}
+        for the records of every encoder edge. Warnings and errors are always kept
+    """
+
+    def __init__(self, rates: dict[str, int]):
+        super().__init__()
+        self.rates = {name: rate for name, rate in rates.items() if rate > 1}
+        self.__samplers__: dict[str, tuple[itertools.count, int] | None] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        if record.name not in self.__samplers__:
+            rate = self.__rate__(record.name)
+            self.__samplers__[record.name] = (itertools.count(), rate) if rate else None
+        sampler = self.__samplers__[record.name]
+        return sampler is None or next(sampler[0]) % sampler[1] == 0
+
+    def __rate__(self, name: str) -> int | None:
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return None
+
+    @staticmethod
+    def parse(rates: str) -> dict[str, int]:
+
+        """ "logger:n, logger:n" to {logger: n} """
+
+        parsed = {}
+        for item in rates.split(","):
+            if item.strip():
+                name, _, rate = item.strip().rpartition(":")
+                parsed[name] = int(rate)
+        return parsed
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+
+    """
+        Put the record in the queue without blocking, dropping it when the queue is full.
+        The message is rendered from msg and args by the thread that logs, as the args
+        (requests, snapshots...) may change before the listener gets to them;
+        the formatting and the writing are left to the listener thread
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            METRICS.counter("crac_log_dropped_total").inc()
+
+
+class Listener(logging.handlers.QueueListener):
+
+    """
+        QueueListener that can be stopped more than once (by the shutdown and at exit)
+        and reports on stop the records dropped by the handler
+    """
+
+    def __init__(self, log_queue: queue.Queue, *handlers, queue_handler: DroppingQueueHandler, **kwargs):
+        super().__init__(log_queue, *handlers, **kwargs)
+        self.queue_handler = queue_handler
+
+    def enqueue_sentinel(self) -> None:
+        # waits for room in a full queue, the listener is still draining it
+        self.queue.put(self._sentinel)
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        super().stop()
+        if self.queue_handler.dropped:
+            record = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                "%s log records dropped, the queue was full", (self.queue_handler.dropped,), None
+            )
+            self.handle(record)
+
+
+def start(sampling: str = "", size: int = 10000) -> Listener:
+
+    """
+        Move the handlers configured on the root logger (by logging.conf) behind a queue:
+        the loggers only enqueue the records and a single listener thread formats and writes them.
+        When the queue is full the new records are dropped rather than blocking the caller
+    """
+
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    for handler in handlers:
+        root.removeHandler(handler)
+    log_queue = queue.Queue(size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(SamplingFilter.parse(sampling)))
+    root.addHandler(queue_handler)
+    listener = Listener(log_queue, *handlers, queue_handler=queue_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+
+logger = logging.getLogger(__name__)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name: str, labels: str):
+        yield f"{name}{{{labels}}}", self.value
+
+
+class Histogram:
+
+    """ Counts of the observations in each bucket (by upper bound), with their sum """
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, name: str, labels: str):
+        separator = "," if labels else ""
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels}{separator}le="{bound}"}}', cumulative
+        cumulative += counts[-1]
+        yield f'{name}_bucket{{{labels}{separator}le="+Inf"}}', cumulative
+        yield f"{name}_sum{{{labels}}}", total
+        yield f"{name}_count{{{labels}}}", cumulative
+
+
+class Registry:
+
+    """
+        The metrics of the server, rendered in the Prometheus text format.
+        A metric is identified by its name and labels, it's created the first time it's used
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.__help__: dict[str, tuple[str, str]] = {}
+        self.__metrics__: dict[tuple[str, tuple], Counter | Histogram] = {}
+
+    def describe(self, name: str, kind: str, description: str) -> None:
+        self.__help__[name] = (kind, description)
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self.__metric__(name, labels, Counter)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self.__metric__(name, labels, Histogram)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+
+        """ Observe in the histogram name the seconds spent in the with block """
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name, **labels).observe(perf_counter() - start)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = sorted(self.__metrics__.items(), key=lambda item: item[0])
+        lines = []
+        described = set()
+        for (name, labels), metric in metrics:
+            if name not in described and name in self.__help__:
+                kind, description = self.__help__[name]
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+            rendered = ",".join(f'{key}="{value}"' for key, value in labels)
+            for sample, value in metric.samples(name, rendered):
+                lines.append(f"{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+
+        """ Write the metrics to path, replacing it atomically """
+
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as out:
+            out.write(self.render())
+        os.replace(tmp, path)
+        logger.info("Metrics written to %s", path)
+
+    def __metric__(self, name: str, labels: dict, kind: type):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.__metrics__.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.__metrics__.setdefault(key, kind())
+        return metric
+
+
+class MetricsServer:
+
+    """ Serve the metrics at http://address:port/metrics from a background thread """
+
+    def __init__(self, registry: Registry, address: str, port: int):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        self.httpd = ThreadingHTTPServer((address, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def start(self) -> None:
+        self.thread.start()
+        logger.info("Metrics served on port %s", self.port)
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+METRICS = Registry()
+METRICS.describe("crac_rpc_requests_total", "counter", "RPCs received, by method")
+METRICS.describe("crac_rpc_errors_total", "counter", "RPCs ended with an error, by method")
+METRICS.describe("crac_rpc_duration_seconds", "histogram", "Duration of the RPCs, by method")
+METRICS.describe("crac_driver_duration_seconds", "histogram", "Round trip of the telescope drivers and duration of the coordinate transforms")
+METRICS.describe("crac_gpio_wait_seconds", "histogram", "Time spent waiting for a limit switch")
+METRICS.describe("crac_log_dropped_total", "counter", "Log records dropped because the log queue was full")
@@ -0,0 +1,39 @@
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+
+class AsyncServicer:
+
+    """
+        Expose the unary methods of a synchronous servicer as coroutines for grpc.aio.
+        Every call runs in the executor of its servicer, so the blocking device I/O
+        never runs on the event loop and a long movement (roof, park, calibration)
+        only takes a thread of the pool of its own service:
+        the RPCs of the other services keep being answered meanwhile
+    """
+
+    def __init__(self, servicer, executor: Executor):
+        self.servicer = servicer
+        self.executor = executor
+
+    @staticmethod
+    def offload(servicer, max_workers: int):
+        return AsyncServicer(
+            servicer,
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=type(servicer).__name__)
+        )
+
+    def __getattr__(self, name):
+        method = getattr(self.servicer, name)
+        if not callable(method):
+            return method
+
+        async def call(request, context):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, method, request, context)
+
+        call.__name__ = name
+        return call
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
@@ -1,29 +1,27 @@
-import importlib
 import logging
 from crac_protobuf.button_pb2 import (
     ButtonAction,
     ButtonType,
     ButtonResponse,
-    ButtonsResponse,
 )
 from crac_protobuf.button_pb2_grpc import ButtonServicer
 from crac_protobuf.telescope_pb2 import TelescopeSpeed
-from crac_server.component.button_control import (
+from crac_server.service.devices import (
+    TELESCOPE,
     TELE_SWITCH,
     CCD_SWITCH,
     FLAT_LIGHT,
     DOME_LIGHT,
 )
-from crac_server.config import Config
+from crac_server.service.sampler import SAMPLER
 
 
 logger = logging.getLogger(__name__)
-TELESCOPE = importlib.import_module(f"component.telescope.{Config.getValue('driver', 'telescope')}.telescope").TELESCOPE
 
 
 class ButtonService(ButtonServicer):
     def SetAction(self, request, context):
-        logger.info("Request " + str(request))
+        logger.info("Request %s", request)
         if request.type == ButtonType.TELE_SWITCH:
             buttonControl = TELE_SWITCH
         elif request.type == ButtonType.CCD_SWITCH:
@@ -44,15 +42,10 @@ class ButtonService(ButtonServicer):
                 TELESCOPE.disconnect()
             buttonControl.off()
 
-        status = buttonControl.get_status()
-        logger.info("Response " + str(status))
+        status = SAMPLER.refresh().button(request.type)
+        logger.info("Response %s", status)
 
         return ButtonResponse(status=status, type=request.type)
 
     def GetStatus(self, request, context):
-        tele_switch_button = ButtonResponse(type=ButtonType.TELE_SWITCH, status=TELE_SWITCH.get_status())
-        ccd_switch_button = ButtonResponse(type=ButtonType.CCD_SWITCH, status=CCD_SWITCH.get_status())
-        flat_ligth_button = ButtonResponse(type=ButtonType.FLAT_LIGHT, status=FLAT_LIGHT.get_status())
-        dome_light_button = ButtonResponse(type=ButtonType.DOME_LIGHT, status=DOME_LIGHT.get_status())
-
-        return ButtonsResponse(buttons=(tele_switch_button, ccd_switch_button, flat_ligth_button, dome_light_button))
\ No newline at end of file
+        return SAMPLER.latest().buttons_response()
\ No newline at end of file
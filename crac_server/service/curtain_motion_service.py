@@ -0,0 +1,55 @@
+import logging
+from google.protobuf.empty_pb2 import Empty
+from google.protobuf.struct_pb2 import Struct
+from crac_server.service.devices import CURTAIN_EAST, CURTAIN_WEST
+from crac_server.service.operation_service import to_struct
+import grpc
+
+
+logger = logging.getLogger(__name__)
+SERVICE_NAME = "crac_server.CurtainMotion"
+CURTAINS = {"east": CURTAIN_EAST, "west": CURTAIN_WEST}
+
+
+class CurtainMotionService:
+
+    """
+        Movement of the curtains from the journal of their encoders.
+        GetMotion (Empty request) returns, for "east" and "west", steps, target, velocity
+        (steps per second), eta (seconds to the target, 0 when not moving, -1 when not yet known)
+        and stalled: a client can wait eta seconds before polling the curtains again.
+        GetJournal (Struct with "orientation", "east" or "west", and optionally "points", 100 by default)
+        returns the "edges" of the encoder as [unix time, steps, direction], downsampled to points
+    """
+
+    def GetMotion(self, request, context):
+        return to_struct({name: curtain.motion() for name, curtain in CURTAINS.items()})
+
+    def GetJournal(self, request, context):
+        orientation = request.fields["orientation"].string_value if "orientation" in request.fields else ""
+        curtain = CURTAINS.get(orientation)
+        if curtain is None:
+            logger.warning("Curtain %s not found", orientation)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(f"Curtain {orientation} not found, use east or west")
+            return Struct()
+        points = int(request.fields["points"].number_value) if "points" in request.fields else 100
+        device = curtain.device
+        edges = [[device.to_unix(timestamp), steps, direction] for timestamp, steps, direction in device.journal.downsample(points)]
+        return to_struct({"orientation": orientation, "edges": edges})
+
+
+def add_CurtainMotionServicer_to_server(servicer: CurtainMotionService, server):
+    rpc_method_handlers = {
+        method: grpc.unary_unary_rpc_method_handler(
+            getattr(servicer, method),
+            request_deserializer=request.FromString,
+            response_serializer=Struct.SerializeToString,
+        )
+        for method, request in (
+            ("GetMotion", Empty),
+            ("GetJournal", Struct),
+        )
+    }
+    generic_handler = grpc.method_handlers_generic_handler(SERVICE_NAME, rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
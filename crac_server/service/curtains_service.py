@@ -1,5 +1,5 @@
-import importlib
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from crac_protobuf.curtains_pb2 import (
     CurtainsAction,
     CurtainsResponse,
@@ -7,27 +7,26 @@ from crac_protobuf.curtains_pb2 import (
     CurtainEntryResponse,
     CurtainStatus,
 )
-from crac_protobuf.telescope_pb2 import (
-    TelescopeStatus,
-    TelescopeSpeed,
-)
 from crac_protobuf.curtains_pb2_grpc import CurtainServicer
 from crac_protobuf.roof_pb2 import RoofStatus
-from crac_server.component.curtains.factory_curtain import (
+from crac_server.component.operation import OPERATIONS, Operation, OperationState
+from crac_server.config import Config
+from crac_server.service.devices import (
+    ROOF,
     CURTAIN_EAST,
     CURTAIN_WEST,
 )
-from crac_server.component.roof.simulator.roof_control import ROOF
-from crac_server.config import Config
+from crac_server.service.operation_service import send_operation
+from crac_server.service.sampler import SAMPLER
+from crac_server.service.tracking import TRACKER
 
 
 logger = logging.getLogger(__name__)
-TELESCOPE = importlib.import_module(f"component.telescope.{Config.getValue('driver', 'telescope')}.telescope").TELESCOPE
 
 
 class CurtainsService(CurtainServicer):
     def SetAction(self, request, context):
-        logger.info("Request " + str(request))
+        logger.info("Request %s", request)
         
         curtain_east_entry = CurtainEntryResponse(orientation=CurtainOrientation.CURTAIN_EAST)
         curtain_west_entry = CurtainEntryResponse(orientation=CurtainOrientation.CURTAIN_WEST)
@@ -47,71 +46,55 @@ class CurtainsService(CurtainServicer):
             CURTAIN_EAST.enable()
             CURTAIN_WEST.enable()
         elif request.action is CurtainsAction.CALIBRATE_CURTAINS:
-            CURTAIN_EAST.manual_reset()
-            CURTAIN_WEST.manual_reset()
+            send_operation(context, OPERATIONS.start("curtains", self.__calibrate__, self.__abort_calibration__))
 
-        if TELESCOPE.get_speed() in [TelescopeSpeed.SPEED_TRACKING, TelescopeSpeed.SPEED_NOT_TRACKING]:
-            steps = self.__calculate_curtains_steps()
-            CURTAIN_EAST.move(steps["east"])
-            CURTAIN_WEST.move(steps["west"])
+        snapshot = SAMPLER.latest() if request.action is CurtainsAction.CHECK_CURTAIN else SAMPLER.refresh()
+        if TRACKER.follow(snapshot):
+            snapshot = SAMPLER.refresh()
 
-        curtain_east_entry.status = CURTAIN_EAST.get_status()
-        curtain_west_entry.status = CURTAIN_WEST.get_status()
-        curtain_east_entry.steps = CURTAIN_EAST.steps()
-        curtain_west_entry.steps = CURTAIN_WEST.steps()
+        curtain_east_entry.status = snapshot.curtain_east
+        curtain_west_entry.status = snapshot.curtain_west
+        curtain_east_entry.steps = snapshot.curtain_east_steps
+        curtain_west_entry.steps = snapshot.curtain_west_steps
         logger.debug("actual east curtain steps %s", curtain_east_entry.steps)
         logger.debug("actual west curtain steps %s", curtain_west_entry.steps)
         
         return CurtainsResponse(curtains=(curtain_east_entry, curtain_west_entry))
 
-    def __calculate_curtains_steps(self):
+    def __calibrate__(self, operation: Operation):
 
         """
-            Change the height of the curtains
-            to based on the given Coordinates
+            Calibrate both the curtains at the same time, each one within calibration_timeout seconds.
+            The outcome of each curtain is in the results of the operation,
+            the operation fails if any of them fails or is skipped (disabled or moving).
+            The tracker leaves the curtains alone while the operation runs
         """
 
-        aa_coords = TELESCOPE.get_aa_coords()
-        status = TELESCOPE.get_status(aa_coords)
-        steps = {}
-        logger.debug("Telescope status %s", status)
-        n_step_corsa = Config.getInt('n_step_corsa', "encoder_step")
-        # TODO verify tele height:
-        # if less than east_min_height e ovest_min_height
-        if status in [TelescopeStatus.LOST, TelescopeStatus.ERROR]:
-            steps["west"] = None
-            steps["east"] = None
-
-        if TELESCOPE.is_below_curtains_area(aa_coords.alt):
-            #   keep both curtains to 0
-            steps["west"] = 0
-            steps["east"] = 0
-
-            #   else if higher to east_max_height e ovest_max_height
-        elif TELESCOPE.is_above_curtains_area(aa_coords.alt, Config.getInt("max_est", "tende"), Config.getInt("max_west", "tende")) or not TELESCOPE.is_within_curtains_area(aa_coords):
-            #   move both curtains max open
-            steps["west"] = n_step_corsa
-            steps["east"] = n_step_corsa
-
-            #   else if higher to ovest_min_height and Az tele to west
-        elif status == TelescopeStatus.WEST:
-            logger.debug("inside west status")
-            #   move curtain east max open
-            steps["east"] = n_step_corsa
-            #   move curtain west to f(Alt telescope - x)
-            increm_w = (Config.getInt("max_west", "tende") - Config.getInt("park_west", "tende")) / n_step_corsa
-            steps["west"] = round((aa_coords.alt - Config.getInt("park_west", "tende"))/increm_w)
-
-            #   else if higher to ovest_min_height and Az tele to est
-        elif status == TelescopeStatus.EAST:
-            logger.debug("inside east status")
-            #   move curtian west max open
-            steps["west"] = n_step_corsa
-            #   if inferior to est_min_height
-            #   move curtain east to f(Alt tele - x)
-            increm_e = (Config.getInt("max_est", "tende") - Config.getInt("park_est", "tende")) / n_step_corsa
-            steps["east"] = round((aa_coords.alt - Config.getInt("park_est", "tende")) / increm_e)
-
-        logger.debug("calculatd curtain steps %s", steps)
+        timeout = Config.getFloat("calibration_timeout", "tende") or None
+        curtains = {"east": CURTAIN_EAST, "west": CURTAIN_WEST}
+        with ThreadPoolExecutor(max_workers=len(curtains), thread_name_prefix="calibration") as executor:
+            futures = {executor.submit(curtain.manual_reset, timeout): name for name, curtain in curtains.items()}
+            for done, future in enumerate(as_completed(futures), 1):
+                name = futures[future]
+                try:
+                    reset = future.result()
+                    if reset is None:
+                        logger.error("Calibration of the %s curtain skipped: disabled or moving", name)
+                        operation.results[name] = {
+                            "state": OperationState.FAILED.value,
+                            "message": "skipped, the curtain is disabled or moving",
+                        }
+                    else:
+                        state = OperationState.DONE if reset else OperationState.CANCELLED
+                        operation.results[name] = {"state": state.value, "message": ""}
+                except Exception as err:
+                    logger.error("Calibration of the %s curtain failed: %s", name, err)
+                    operation.results[name] = {"state": OperationState.FAILED.value, "message": str(err)}
+                operation.progress = done / len(futures)
+        failed = [name for name, result in operation.results.items() if result["state"] == OperationState.FAILED.value]
+        if failed:
+            raise RuntimeError(f"Calibration failed: {', '.join(failed)}")
 
-        return steps
\ No newline at end of file
+    def __abort_calibration__(self):
+        CURTAIN_EAST.abort_reset()
+        CURTAIN_WEST.abort_reset()
@@ -0,0 +1,27 @@
+"""
+    The devices used by the services.
+    Their status reads are coalesced: the clients polling together
+    share one hardware read, which is reused for read_freshness seconds
+"""
+
+import importlib
+from crac_server.component import button_control, single_flight
+from crac_server.component.curtains import factory_curtain
+from crac_server.component.roof.simulator import roof_control
+from crac_server.config import Config
+
+
+FLIGHT = single_flight.SingleFlight(Config.getFloat("read_freshness", "server"))
+TELESCOPE = single_flight.Coalesced(
+    importlib.import_module(f"component.telescope.{Config.getValue('driver', 'telescope')}.telescope").TELESCOPE,
+    ("get_aa_coords", "get_eq_coords", "get_speed"),
+    FLIGHT,
+    ("get_status", "is_below_curtains_area", "is_above_curtains_area", "is_within_curtains_area"),
+)
+ROOF = single_flight.Coalesced(roof_control.ROOF, ("get_status",), FLIGHT)
+CURTAIN_EAST = single_flight.Coalesced(factory_curtain.CURTAIN_EAST, ("get_status", "steps", "motion"), FLIGHT)
+CURTAIN_WEST = single_flight.Coalesced(factory_curtain.CURTAIN_WEST, ("get_status", "steps", "motion"), FLIGHT)
+TELE_SWITCH = single_flight.Coalesced(button_control.TELE_SWITCH, ("get_status",), FLIGHT)
+CCD_SWITCH = single_flight.Coalesced(button_control.CCD_SWITCH, ("get_status",), FLIGHT)
+FLAT_LIGHT = single_flight.Coalesced(button_control.FLAT_LIGHT, ("get_status",), FLIGHT)
+DOME_LIGHT = single_flight.Coalesced(button_control.DOME_LIGHT, ("get_status",), FLIGHT)
@@ -0,0 +1,114 @@
+import asyncio
+from time import perf_counter
+from crac_server.metrics import METRICS
+import grpc
+
+
+def is_error(context) -> bool:
+    code = context.code()
+    return code is not None and code != grpc.StatusCode.OK and code != grpc.StatusCode.OK.value[0]
+
+
+class Call:
+
+    """ Metrics of an RPC: count at start, duration and outcome at the end """
+
+    def __init__(self, method: str):
+        self.method = method
+        self.start = perf_counter()
+        METRICS.counter("crac_rpc_requests_total", method=method).inc()
+
+    def end(self, failed: bool) -> None:
+        METRICS.histogram("crac_rpc_duration_seconds", method=self.method).observe(perf_counter() - self.start)
+        if failed:
+            METRICS.counter("crac_rpc_errors_total", method=self.method).inc()
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+
+    """
+        Count the calls and the errors (exceptions or a status code other than OK)
+        of every method and observe their duration.
+        The duration of a stream is the time until the last message
+    """
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = handler_call_details.method
+        if handler.unary_unary:
+            return handler._replace(unary_unary=self.__unary__(method, handler.unary_unary))
+        if handler.unary_stream:
+            return handler._replace(unary_stream=self.__stream__(method, handler.unary_stream))
+        return handler
+
+    def __unary__(self, method, behavior):
+        def call(request, context):
+            metrics = Call(method)
+            failed = True
+            try:
+                response = behavior(request, context)
+                failed = is_error(context)
+                return response
+            finally:
+                metrics.end(failed)
+        return call
+
+    def __stream__(self, method, behavior):
+        def call(request, context):
+            metrics = Call(method)
+            failed = True
+            try:
+                yield from behavior(request, context)
+                failed = is_error(context)
+            except GeneratorExit:
+                # the client went away, it's the normal end of a watch
+                failed = False
+                raise
+            finally:
+                metrics.end(failed)
+        return call
+
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+
+    """ MetricsInterceptor for the grpc.aio server """
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = handler_call_details.method
+        if handler.unary_unary:
+            return handler._replace(unary_unary=self.__unary__(method, handler.unary_unary))
+        if handler.unary_stream:
+            return handler._replace(unary_stream=self.__stream__(method, handler.unary_stream))
+        return handler
+
+    def __unary__(self, method, behavior):
+        async def call(request, context):
+            metrics = Call(method)
+            failed = True
+            try:
+                response = await behavior(request, context)
+                failed = is_error(context)
+                return response
+            finally:
+                metrics.end(failed)
+        return call
+
+    def __stream__(self, method, behavior):
+        async def call(request, context):
+            metrics = Call(method)
+            failed = True
+            try:
+                async for response in behavior(request, context):
+                    yield response
+                failed = is_error(context)
+            except (GeneratorExit, asyncio.CancelledError):
+                failed = False
+                raise
+            finally:
+                metrics.end(failed)
+        return call
@@ -0,0 +1,80 @@
+import logging
+from google.protobuf.empty_pb2 import Empty
+from google.protobuf.struct_pb2 import Struct
+from crac_server.component.operation import OPERATIONS, Operation
+import grpc
+
+
+logger = logging.getLogger(__name__)
+SERVICE_NAME = "crac_server.Operation"
+OPERATION_ID = "operation-id"
+
+
+def send_operation(context, operation: Operation | None) -> None:
+
+    """
+        The SetAction responses have no room for the operation,
+        its id is sent to the client in the "operation-id" trailing metadata
+    """
+
+    if operation is not None:
+        context.set_trailing_metadata(((OPERATION_ID, operation.id),))
+
+
+def to_struct(values: dict) -> Struct:
+    struct = Struct()
+    struct.update(values)
+    return struct
+
+
+class OperationService:
+
+    """
+        Progress and cancellation of the long operations started by the SetAction RPCs
+        (roof open/close, park, flat and curtains calibration).
+        The request is a Struct with the "id" of the operation,
+        the response is a Struct with its id, name, state, progress (from 0 to 1),
+        message, cancellable, started and finished (unix time, 0 while running)
+    """
+
+    def GetOperation(self, request, context):
+        operation = self.__operation__(request, context)
+        return to_struct(operation.to_dict()) if operation else Struct()
+
+    def CancelOperation(self, request, context):
+        operation = self.__operation__(request, context)
+        if not operation:
+            return Struct()
+        if not operation.cancel():
+            context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+            context.set_details(f"Operation {operation.id} can't be cancelled")
+        return to_struct(operation.to_dict())
+
+    def ListOperations(self, request, context):
+        return to_struct({"operations": [operation.to_dict() for operation in OPERATIONS.list()]})
+
+    def __operation__(self, request, context) -> Operation | None:
+        operation_id = request.fields["id"].string_value if "id" in request.fields else ""
+        operation = OPERATIONS.get(operation_id)
+        if operation is None:
+            logger.warning("Operation %s not found", operation_id)
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details(f"Operation {operation_id} not found")
+        return operation
+
+
+def add_OperationServicer_to_server(servicer: OperationService, server):
+    rpc_method_handlers = {
+        method: grpc.unary_unary_rpc_method_handler(
+            getattr(servicer, method),
+            request_deserializer=request.FromString,
+            response_serializer=Struct.SerializeToString,
+        )
+        for method, request in (
+            ("GetOperation", Struct),
+            ("CancelOperation", Struct),
+            ("ListOperations", Empty),
+        )
+    }
+    generic_handler = grpc.method_handlers_generic_handler(SERVICE_NAME, rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
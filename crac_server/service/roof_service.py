@@ -7,8 +7,14 @@ from crac_protobuf.roof_pb2 import (
 from crac_protobuf.roof_pb2_grpc import (
     RoofServicer,
 )
-from crac_server.component.curtains.factory_curtain import CURTAIN_EAST, CURTAIN_WEST
-from crac_server.component.roof.simulator.roof_control import ROOF
+from crac_server.component.operation import OPERATIONS
+from crac_server.service.devices import (
+    ROOF,
+    CURTAIN_EAST,
+    CURTAIN_WEST,
+)
+from crac_server.service.operation_service import send_operation
+from crac_server.service.sampler import SAMPLER
 
 
 logger = logging.getLogger(__name__)
@@ -16,16 +22,20 @@ logger = logging.getLogger(__name__)
 
 class RoofService(RoofServicer):
     def SetAction(self, request, context):
-        logger.info("Request " + str(request))
+        logger.info("Request %s", request)
+        operation = None
         if request.action is RoofAction.OPEN:
-            ROOF.open()
+            operation = OPERATIONS.start("roof-open", lambda _: ROOF.open())
         elif (
                 request.action is RoofAction.CLOSE and
                 CURTAIN_EAST.get_status() is CurtainStatus.CURTAIN_DISABLED and
                 CURTAIN_WEST.get_status() is CurtainStatus.CURTAIN_DISABLED
             ):
-            ROOF.close()
-        status = ROOF.get_status()
-        logger.info("Response " + str(status))
+            # a close sent while the roof is opening is its own operation,
+            # queued by the roof behind the opening as the movements can't overlap
+            operation = OPERATIONS.start("roof-close", lambda _: ROOF.close())
+        send_operation(context, operation)
+        status = (SAMPLER.refresh() if operation else SAMPLER.latest()).roof
+        logger.info("Response %s", status)
 
         return RoofResponse(status=status)
@@ -0,0 +1,235 @@
+import logging
+import threading
+from time import monotonic, time
+from typing import NamedTuple
+from crac_protobuf.button_pb2 import (
+    ButtonResponse,
+    ButtonStatus,
+    ButtonType,
+    ButtonsResponse,
+)
+from crac_protobuf.curtains_pb2 import (
+    CurtainEntryResponse,
+    CurtainOrientation,
+    CurtainsResponse,
+)
+from crac_protobuf.roof_pb2 import RoofResponse
+from crac_protobuf.telescope_pb2 import (
+    AltazimutalCoords,
+    TelescopeResponse,
+    TelescopeSpeed,
+    TelescopeStatus,
+)
+from crac_server.component.clock import Clock
+from crac_server.config import Config
+from crac_server.service.devices import (
+    TELESCOPE,
+    ROOF,
+    CURTAIN_EAST,
+    CURTAIN_WEST,
+    TELE_SWITCH,
+    CCD_SWITCH,
+    FLAT_LIGHT,
+    DOME_LIGHT,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot(NamedTuple):
+
+    """ Immutable state of all the devices, read in the same tick """
+
+    tick: int
+    timestamp: float
+    # monotonic() of the read, for the age of the snapshot
+    sampled: float
+    roof: int
+    roof_motor: bool
+    roof_open_switch: bool
+    roof_closed_switch: bool
+    curtain_east: int
+    curtain_east_steps: int
+    curtain_west: int
+    curtain_west_steps: int
+    telescope: int
+    alt: float
+    az: float
+    speed: int
+    sync: bool
+    tele_switch: int
+    ccd_switch: int
+    flat_light: int
+    dome_light: int
+
+    def aa_coords(self) -> AltazimutalCoords:
+        return AltazimutalCoords(alt=self.alt, az=self.az)
+
+    def button(self, button_type: ButtonType) -> int:
+        return {
+            ButtonType.TELE_SWITCH: self.tele_switch,
+            ButtonType.CCD_SWITCH: self.ccd_switch,
+            ButtonType.FLAT_LIGHT: self.flat_light,
+            ButtonType.DOME_LIGHT: self.dome_light,
+        }[button_type]
+
+    def roof_response(self) -> RoofResponse:
+        return RoofResponse(status=self.roof)
+
+    def curtains_response(self) -> CurtainsResponse:
+        return CurtainsResponse(
+            curtains=(
+                CurtainEntryResponse(
+                    orientation=CurtainOrientation.CURTAIN_EAST,
+                    status=self.curtain_east,
+                    steps=self.curtain_east_steps
+                ),
+                CurtainEntryResponse(
+                    orientation=CurtainOrientation.CURTAIN_WEST,
+                    status=self.curtain_west,
+                    steps=self.curtain_west_steps
+                ),
+            )
+        )
+
+    def telescope_response(self) -> TelescopeResponse:
+        if self.tele_switch is ButtonStatus.OFF:
+            return TelescopeResponse(status=TelescopeStatus.LOST, speed=TelescopeSpeed.SPEED_ERROR, sync=False)
+        return TelescopeResponse(status=self.telescope, aa_coords=self.aa_coords(), speed=self.speed, sync=self.sync)
+
+    def buttons_response(self) -> ButtonsResponse:
+        return ButtonsResponse(
+            buttons=(
+                ButtonResponse(type=ButtonType.TELE_SWITCH, status=self.tele_switch),
+                ButtonResponse(type=ButtonType.CCD_SWITCH, status=self.ccd_switch),
+                ButtonResponse(type=ButtonType.FLAT_LIGHT, status=self.flat_light),
+                ButtonResponse(type=ButtonType.DOME_LIGHT, status=self.dome_light),
+            )
+        )
+
+
+class Sampler:
+
+    """
+        Read all the devices every interval seconds (at a fixed rate, a slow tick
+        doesn't shift the following ones) and publish a new Snapshot.
+        The readers only take the reference to the latest snapshot: they don't wait
+        for the drivers and never take the locks of the devices.
+        refresh() publishes a new snapshot at once, to be called after a command.
+        When the sampler isn't running, or its snapshot is older than max_age seconds
+        (e.g. the reads keep failing), latest() reads the devices on demand.
+        A telescope that can't be read is reported as ERROR, the other devices are still read.
+        In a simulation, drive() samples on the ticks of the simulator clock instead
+    """
+
+    def __init__(self, interval: float = 0.5, max_age: float = 5.0):
+        self.interval = interval
+        self.max_age = max_age
+        self.snapshot: Snapshot | None = None
+        self.tick = 0
+        self.lock = threading.Lock()
+        self.__thread__: threading.Thread = None
+        self.__stop__ = threading.Event()
+        self.__driven__ = False
+
+    @property
+    def running(self) -> bool:
+        return self.__driven__ or (self.__thread__ is not None and self.__thread__.is_alive())
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.__stop__ = threading.Event()
+        self.__thread__ = threading.Thread(target=self.__run__, args=(self.__stop__,), name="sampler", daemon=True)
+        self.__thread__.start()
+        logger.info("Sampler started, interval %s", self.interval)
+
+    def stop(self) -> None:
+        self.__stop__.set()
+        self.__thread__ = None
+        self.__driven__ = False
+
+    def drive(self, clock: Clock) -> None:
+        if self.running:
+            return
+        self.__driven__ = True
+        self.__tick__(clock)
+
+    def __tick__(self, clock: Clock):
+        if self.__driven__:
+            self.refresh()
+            clock.call_later(self.interval, self.__tick__, clock)
+
+    def latest(self) -> Snapshot:
+        snapshot = self.snapshot
+        if snapshot is None or not self.running or monotonic() - snapshot.sampled > self.max_age:
+            snapshot = self.refresh()
+        return snapshot
+
+    def refresh(self) -> Snapshot:
+        with self.lock:
+            self.tick += 1
+            tick = self.tick
+        snapshot = self.sample(tick)
+        with self.lock:
+            # a slower read started before this one must not replace it
+            if self.snapshot is None or snapshot.tick > self.snapshot.tick:
+                self.snapshot = snapshot
+        return snapshot
+
+    def sample(self, tick: int) -> Snapshot:
+        tele_switch = TELE_SWITCH.get_status()
+        if tele_switch is ButtonStatus.ON:
+            try:
+                aa_coords = TELESCOPE.get_aa_coords()
+                telescope = TELESCOPE.get_status(aa_coords)
+                speed = TELESCOPE.get_speed()
+            except Exception as err:
+                logger.error("Error reading the telescope: %s", err)
+                aa_coords = AltazimutalCoords()
+                telescope = TelescopeStatus.ERROR
+                speed = TelescopeSpeed.SPEED_ERROR
+        else:
+            aa_coords = AltazimutalCoords()
+            telescope = TelescopeStatus.LOST
+            speed = TelescopeSpeed.SPEED_ERROR
+        return Snapshot(
+            tick=tick,
+            timestamp=time(),
+            sampled=monotonic(),
+            roof=ROOF.get_status(),
+            roof_motor=bool(ROOF.motor.value),
+            roof_open_switch=ROOF.roof_open_switch.is_active,
+            roof_closed_switch=ROOF.roof_closed_switch.is_active,
+            curtain_east=CURTAIN_EAST.get_status(),
+            curtain_east_steps=CURTAIN_EAST.steps(),
+            curtain_west=CURTAIN_WEST.get_status(),
+            curtain_west_steps=CURTAIN_WEST.steps(),
+            telescope=telescope,
+            alt=aa_coords.alt,
+            az=aa_coords.az,
+            speed=speed,
+            sync=TELESCOPE.sync_status,
+            tele_switch=tele_switch,
+            ccd_switch=CCD_SWITCH.get_status(),
+            flat_light=FLAT_LIGHT.get_status(),
+            dome_light=DOME_LIGHT.get_status(),
+        )
+
+    def __run__(self, stop: threading.Event):
+        deadline = monotonic()
+        while not stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Error sampling the devices")
+            deadline += self.interval
+            now = monotonic()
+            if deadline < now:
+                logger.debug("Sampling late of %.3f s", now - deadline)
+                deadline = now
+            stop.wait(deadline - now)
+
+
+SAMPLER = Sampler(Config.getFloat("sample_interval", "server"), Config.getFloat("sample_max_age", "server"))
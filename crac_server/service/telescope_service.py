@@ -1,4 +1,3 @@
-import importlib
 import logging
 from crac_protobuf.button_pb2 import ButtonStatus
 from crac_protobuf.telescope_pb2 import (
@@ -10,17 +9,23 @@ from crac_protobuf.telescope_pb2 import (
 from crac_protobuf.telescope_pb2_grpc import (
     TelescopeServicer,
 )
-from crac_server.component.button_control import DOME_LIGHT, FLAT_LIGHT, TELE_SWITCH
-from crac_server.config import Config
+from crac_server.component.operation import OPERATIONS
+from crac_server.service.devices import (
+    TELESCOPE,
+    TELE_SWITCH,
+    DOME_LIGHT,
+)
+from crac_server.service.operation_service import send_operation
+from crac_server.service.sampler import SAMPLER
 
 
 logger = logging.getLogger(__name__)
-TELESCOPE = importlib.import_module(f"component.telescope.{Config.getValue('driver', 'telescope')}.telescope").TELESCOPE
 
 
 class TelescopeService(TelescopeServicer):
     def SetAction(self, request, context):
-        logger.info("Request " + str(request))
+        logger.info("Request %s", request)
+        command = True
         if (
                 TELE_SWITCH.get_status() is ButtonStatus.OFF and
                 request.action is not TelescopeAction.SYNC
@@ -37,28 +42,35 @@ class TelescopeService(TelescopeServicer):
                 request.action is TelescopeAction.PARK_POSITION and 
                 TELE_SWITCH.get_status() is ButtonStatus.ON
         ):
-            TELESCOPE.park()
+            send_operation(context, OPERATIONS.start("telescope", lambda _: TELESCOPE.park()))
         elif (
                 request.action is TelescopeAction.FLAT_POSITION and
                 TELE_SWITCH.get_status() is ButtonStatus.ON
         ):
-            TELESCOPE.flat()
+            send_operation(context, OPERATIONS.start("telescope", lambda _: TELESCOPE.flat()))
+        else:
+            command = False
 
-        aa_coords = TELESCOPE.get_aa_coords()
-        status = TELESCOPE.get_status(aa_coords)
-        sync = TELESCOPE.sync_status
+        snapshot = SAMPLER.refresh() if command else SAMPLER.latest()
+        aa_coords = snapshot.aa_coords()
+        status = snapshot.telescope
+        sync = snapshot.sync
         if (
-                status is TelescopeStatus.PARKED or 
                 (
-                    status is TelescopeStatus.FLATTER and 
-                    FLAT_LIGHT.get_status() is ButtonStatus.OFF
-                )
+                    status is TelescopeStatus.PARKED or 
+                    (
+                        status is TelescopeStatus.FLATTER and 
+                        snapshot.flat_light is ButtonStatus.OFF
+                    )
+                ) and
+                snapshot.speed is not TelescopeSpeed.SPEED_NOT_TRACKING
             ):
             TELESCOPE.set_speed(TelescopeSpeed.SPEED_NOT_TRACKING)
-        speed = TELESCOPE.get_speed()
+            snapshot = SAMPLER.refresh()
+        speed = snapshot.speed
 
         response = TelescopeResponse(status=status, aa_coords=aa_coords, speed=speed, sync=sync)
-        logger.info("Response " + str(response))
+        logger.info("Response %s", response)
 
         if request.autolight:
             if speed is TelescopeSpeed.SPEED_SLEWING:
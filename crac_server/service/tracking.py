@@ -0,0 +1,139 @@
+import logging
+import threading
+from time import monotonic
+from crac_protobuf.curtains_pb2 import CurtainStatus
+from crac_protobuf.telescope_pb2 import (
+    TelescopeStatus,
+    TelescopeSpeed,
+)
+from crac_server.component.clock import Clock
+from crac_server.component.operation import OPERATIONS
+from crac_server.component.curtains.geometry import GEOMETRY
+from crac_server.config import Config
+from crac_server.service.devices import (
+    CURTAIN_EAST,
+    CURTAIN_WEST,
+)
+from crac_server.service.sampler import SAMPLER, Sampler, Snapshot
+
+
+logger = logging.getLogger(__name__)
+
+
+def curtains_steps(snapshot: Snapshot) -> tuple[int | None, int | None]:
+
+    """ The (east, west) steps of the curtains for the telescope of the snapshot """
+
+    if snapshot.telescope in [TelescopeStatus.LOST, TelescopeStatus.ERROR]:
+        return None, None
+    return GEOMETRY.steps(snapshot.alt, snapshot.az)
+
+
+class CurtainTracker:
+
+    """
+        Keep the curtains on the telescope without waiting for the clients:
+        every interval seconds the targets are computed from the latest snapshot
+        and a curtain is moved only when it's more than deadband steps away from its target
+        (the ends of the travel are always reached) and it hasn't moved in the last dwell seconds,
+        so that the small movements of the telescope while tracking don't make the motors chatter.
+        In a simulation, drive() follows on the ticks of the simulator clock
+    """
+
+    def __init__(self, sampler: Sampler, interval: float = 1, deadband: int = 5, dwell: float = 3):
+        self.sampler = sampler
+        self.interval = interval
+        self.deadband = deadband
+        self.dwell = dwell
+        self.lock = threading.Lock()
+        self.__last_move__ = {"east": float("-inf"), "west": float("-inf")}
+        self.__thread__: threading.Thread = None
+        self.__stop__ = threading.Event()
+        self.__driven__ = False
+        self.__now__ = monotonic
+
+    @property
+    def running(self) -> bool:
+        return self.__driven__ or (self.__thread__ is not None and self.__thread__.is_alive())
+
+    def start(self) -> None:
+        if self.running or self.interval <= 0:
+            return
+        self.__stop__ = threading.Event()
+        self.__thread__ = threading.Thread(target=self.__run__, args=(self.__stop__,), name="tracker", daemon=True)
+        self.__thread__.start()
+        logger.info("Curtain tracking started, interval %s deadband %s dwell %s", self.interval, self.deadband, self.dwell)
+
+    def stop(self) -> None:
+        self.__stop__.set()
+        self.__thread__ = None
+        self.__driven__ = False
+        self.__now__ = monotonic
+
+    def drive(self, clock: Clock) -> None:
+        if self.running or self.interval <= 0:
+            return
+        self.__driven__ = True
+        self.__now__ = clock.now
+        clock.call_later(self.interval, self.__tick__, clock)
+
+    def __tick__(self, clock: Clock):
+        if self.__driven__:
+            if self.follow(self.sampler.latest()):
+                self.sampler.refresh()
+            clock.call_later(self.interval, self.__tick__, clock)
+
+    def follow(self, snapshot: Snapshot) -> bool:
+
+        """
+            Move the curtains towards the telescope of the snapshot, True if a curtain was moved.
+            Nothing is moved while the curtains are being calibrated
+        """
+
+        if snapshot.speed not in [TelescopeSpeed.SPEED_TRACKING, TelescopeSpeed.SPEED_NOT_TRACKING]:
+            return False
+        east, west = curtains_steps(snapshot)
+        moved = False
+        with self.lock:
+            if OPERATIONS.running("curtains"):
+                return False
+            for name, curtain, status, current, target in (
+                ("east", CURTAIN_EAST, snapshot.curtain_east, snapshot.curtain_east_steps, east),
+                ("west", CURTAIN_WEST, snapshot.curtain_west, snapshot.curtain_west_steps, west),
+            ):
+                if target is None or target == current:
+                    continue
+                # disabled or already moving
+                if not CurtainStatus.CURTAIN_STOPPED <= status <= CurtainStatus.CURTAIN_OPENED:
+                    continue
+                if abs(target - current) <= self.deadband and target not in (0, GEOMETRY.n_step_corsa):
+                    continue
+                now = self.__now__()
+                if now - self.__last_move__[name] < self.dwell:
+                    continue
+                logger.debug("Tracking: curtain %s from %s to %s", name, current, target)
+                curtain.move(target)
+                self.__last_move__[name] = now
+                moved = True
+        return moved
+
+    def __run__(self, stop: threading.Event):
+        tick = None
+        while not stop.wait(self.interval):
+            try:
+                snapshot = self.sampler.latest()
+                if snapshot.tick == tick:
+                    continue
+                tick = snapshot.tick
+                if self.follow(snapshot):
+                    self.sampler.refresh()
+            except Exception:
+                logger.exception("Error tracking the telescope with the curtains")
+
+
+TRACKER = CurtainTracker(
+    SAMPLER,
+    Config.getFloat("tracking_interval", "tende"),
+    Config.getInt("diff_steps", "encoder_step"),
+    Config.getFloat("min_dwell", "tende"),
+)
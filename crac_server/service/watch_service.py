@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from time import monotonic, sleep
+from typing import Callable
+from google.protobuf.empty_pb2 import Empty
+from google.protobuf.message import Message
+from crac_protobuf.button_pb2 import ButtonsResponse
+from crac_protobuf.curtains_pb2 import CurtainsResponse
+from crac_protobuf.roof_pb2 import RoofResponse
+from crac_protobuf.telescope_pb2 import TelescopeResponse
+from crac_server.service.sampler import SAMPLER
+import grpc
+
+
+logger = logging.getLogger(__name__)
+SERVICE_NAME = "crac_server.Watch"
+
+
+class Topic:
+
+    """
+        Latest state of a device, shared by all the subscribers.
+        A single poller thread reads the device every interval seconds while there is
+        at least one subscriber, and publishes a new version only when the state changes,
+        so the load on the hardware doesn't depend on the number of subscribers
+    """
+
+    def __init__(self, name: str, read: Callable[[], Message], interval: float):
+        self.name = name
+        self.read = read
+        self.interval = interval
+        self.value: Message = None
+        self.version = 0
+        self.subscribers = 0
+        self.condition = threading.Condition()
+        self.__poller__: threading.Thread = None
+        self.__listeners__: list[Callable[[], None]] = []
+
+    @contextmanager
+    def subscription(self):
+        with self.condition:
+            self.subscribers += 1
+            if self.__poller__ is None:
+                self.__poller__ = threading.Thread(target=self.__poll__, name=f"watch-{self.name}", daemon=True)
+                self.__poller__.start()
+        try:
+            yield self
+        finally:
+            with self.condition:
+                self.subscribers -= 1
+
+    def publish(self, value: Message) -> None:
+        with self.condition:
+            if value == self.value:
+                return
+            self.value = value
+            self.version += 1
+            self.condition.notify_all()
+            for listener in self.__listeners__:
+                listener()
+
+    def wait(self, version: int, timeout: float) -> tuple[int, Message | None]:
+
+        """ Wait for a version newer than the given one, return (version, None) on timeout """
+
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.version > version, timeout):
+                return version, None
+            return self.version, self.value
+
+    async def wait_async(self, version: int, timeout: float) -> tuple[int, Message | None]:
+
+        """ Same as wait, for the event loop: no thread is kept busy while waiting """
+
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake():
+            loop.call_soon_threadsafe(event.set)
+
+        with self.condition:
+            if self.version > version:
+                return self.version, self.value
+            self.__listeners__.append(wake)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return version, None
+        finally:
+            with self.condition:
+                self.__listeners__.remove(wake)
+        with self.condition:
+            return self.version, self.value
+
+    def __poll__(self):
+        while True:
+            with self.condition:
+                if not self.subscribers:
+                    self.__poller__ = None
+                    self.value = None
+                    return
+            try:
+                self.publish(self.read())
+            except Exception:
+                logger.exception("Error reading %s", self.name)
+            sleep(self.interval)
+
+
+def read_roof() -> RoofResponse:
+    return SAMPLER.latest().roof_response()
+
+
+def read_curtains() -> CurtainsResponse:
+    return SAMPLER.latest().curtains_response()
+
+
+def read_telescope() -> TelescopeResponse:
+    response = SAMPLER.latest().telescope_response()
+    response.aa_coords.alt = round(response.aa_coords.alt, 2)
+    response.aa_coords.az = round(response.aa_coords.az, 2)
+    return response
+
+
+def read_buttons() -> ButtonsResponse:
+    return SAMPLER.latest().buttons_response()
+
+
+class WatchService:
+
+    """
+        Server streaming RPCs that push the state of a device every time it changes.
+        The request is empty, a client can limit the rate of the updates
+        sending the minimum number of seconds between two messages
+        in the "min-interval" metadata.
+        The responses are the same messages returned by the SetAction/GetStatus
+        of the corresponding service.
+        On the sync server every open stream holds a thread of the pool, so at most max_streams
+        are served at the same time (0 for no limit) and the others are rejected with
+        RESOURCE_EXHAUSTED, leaving threads to the other RPCs: the Watch is meant for the aio server
+    """
+
+    def __init__(self, interval: float = 0.5, max_streams: int = 0):
+        self.max_streams = max_streams
+        self.streams = 0
+        self.lock = threading.Lock()
+        self.roof = Topic("roof", read_roof, interval)
+        self.curtains = Topic("curtains", read_curtains, interval)
+        self.telescope = Topic("telescope", read_telescope, interval)
+        self.buttons = Topic("buttons", read_buttons, interval)
+
+    def WatchRoof(self, request, context):
+        return self.__watch__(self.roof, context)
+
+    def WatchCurtains(self, request, context):
+        return self.__watch__(self.curtains, context)
+
+    def WatchTelescope(self, request, context):
+        return self.__watch__(self.telescope, context)
+
+    def WatchButtons(self, request, context):
+        return self.__watch__(self.buttons, context)
+
+    def __watch__(self, topic: Topic, context):
+        with self.lock:
+            rejected = self.max_streams and self.streams >= self.max_streams
+            if not rejected:
+                self.streams += 1
+        if rejected:
+            logger.warning("Subscriber to %s rejected, %s streams already open", topic.name, self.max_streams)
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, f"Too many Watch streams, at most {self.max_streams}")
+        try:
+            yield from self.__stream__(topic, context)
+        finally:
+            with self.lock:
+                self.streams -= 1
+
+    def __stream__(self, topic: Topic, context):
+        min_interval = WatchService.min_interval(context)
+        logger.info("New subscriber to %s, min interval %s", topic.name, min_interval)
+        with topic.subscription():
+            version = 0
+            last_sent = 0
+            while context.is_active():
+                version, value = topic.wait(version, timeout=1)
+                if value is None:
+                    continue
+                remaining = last_sent + min_interval - monotonic()
+                if remaining > 0:
+                    sleep(remaining)
+                    version, value = topic.version, topic.value
+                last_sent = monotonic()
+                yield value
+        logger.info("Subscriber to %s gone", topic.name)
+
+    @staticmethod
+    def min_interval(context) -> float:
+        for key, value in context.invocation_metadata():
+            if key == "min-interval":
+                try:
+                    return max(0, float(value))
+                except ValueError:
+                    logger.warning("Invalid min-interval %s", value)
+        return 0
+
+
+class AsyncWatchService(WatchService):
+
+    """ WatchService for the grpc.aio server: the streams are async generators """
+
+    async def WatchRoof(self, request, context):
+        async for value in self.__watch_async__(self.roof, context):
+            yield value
+
+    async def WatchCurtains(self, request, context):
+        async for value in self.__watch_async__(self.curtains, context):
+            yield value
+
+    async def WatchTelescope(self, request, context):
+        async for value in self.__watch_async__(self.telescope, context):
+            yield value
+
+    async def WatchButtons(self, request, context):
+        async for value in self.__watch_async__(self.buttons, context):
+            yield value
+
+    async def __watch_async__(self, topic: Topic, context):
+        min_interval = WatchService.min_interval(context)
+        logger.info("New subscriber to %s, min interval %s", topic.name, min_interval)
+        with topic.subscription():
+            version = 0
+            last_sent = 0
+            while not context.done():
+                version, value = await topic.wait_async(version, timeout=1)
+                if value is None:
+                    continue
+                remaining = last_sent + min_interval - monotonic()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                    version, value = topic.version, topic.value
+                last_sent = monotonic()
+                yield value
+        logger.info("Subscriber to %s gone", topic.name)
+
+
+def add_WatchServicer_to_server(servicer: WatchService, server):
+    rpc_method_handlers = {
+        method: grpc.unary_stream_rpc_method_handler(
+            getattr(servicer, method),
+            request_deserializer=Empty.FromString,
+            response_serializer=response.SerializeToString,
+        )
+        for method, response in (
+            ("WatchRoof", RoofResponse),
+            ("WatchCurtains", CurtainsResponse),
+            ("WatchTelescope", TelescopeResponse),
+            ("WatchButtons", ButtonsResponse),
+        )
+    }
+    generic_handler = grpc.method_handlers_generic_handler(SERVICE_NAME, rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
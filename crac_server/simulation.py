@@ -0,0 +1,337 @@
+"""
+    Discrete-event simulation of the whole observatory, to measure the latency
+    and check the behaviour of the services under load, faster than real time.
+
+    The server runs in process, on a local port, with the simulators of roof, curtains
+    and telescope on the virtual clock: one event queue schedules the encoder steps,
+    the limit switches, the slews of the telescope, the sampler, the curtain tracker,
+    the commands of the night script and the polls of the virtual clients.
+    The events of an instant run in order and the RPCs they issue are awaited
+    before the time moves on, so a run with the same script and seed is reproducible.
+
+    From the crac_server directory:
+
+        python simulation.py simulation_night.txt --clients 1000 --poll 1
+
+    A night script has one command per line, "seconds device arguments":
+
+        0     button TELE_SWITCH TURN_ON
+        10    roof OPEN
+        30    expect roof ROOF_OPENED
+        60    slew 45 100
+        200   expect curtain_east_steps 225 5
+"""
+
+import os
+os.environ.setdefault("SIMULATOR_CLOCK_SPEED", "0")
+os.environ.setdefault("TELESCOPE_DRIVER", "simulator")
+os.environ.setdefault("SIMULATOR_PERSIST_INTERVAL", "0")
+# a read reused for read_freshness seconds of wall clock would last for minutes of simulated time
+os.environ.setdefault("SERVER_READ_FRESHNESS", "0")
+
+
+import argparse
+import logging
+import random
+import sys
+import threading
+from concurrent import futures
+from time import perf_counter
+from typing import NamedTuple
+import app
+from google.protobuf.empty_pb2 import Empty
+from crac_protobuf.button_pb2 import ButtonAction, ButtonRequest, ButtonStatus, ButtonType
+from crac_protobuf.button_pb2_grpc import ButtonStub
+from crac_protobuf.curtains_pb2 import CurtainsAction, CurtainsRequest, CurtainStatus
+from crac_protobuf.curtains_pb2_grpc import CurtainStub
+from crac_protobuf.roof_pb2 import RoofAction, RoofRequest, RoofStatus
+from crac_protobuf.roof_pb2_grpc import RoofStub
+from crac_protobuf.telescope_pb2 import (
+    AltazimutalCoords,
+    TelescopeAction,
+    TelescopeRequest,
+    TelescopeSpeed,
+    TelescopeStatus,
+)
+from crac_protobuf.telescope_pb2_grpc import TelescopeStub
+from crac_server.component.clock import CLOCK, VirtualClock
+from crac_server.component.operation import OPERATIONS
+from crac_server.config import Config
+from crac_server.service.devices import TELESCOPE
+from crac_server.service.interceptor import MetricsInterceptor
+from crac_server.service.operation_service import OPERATION_ID
+from crac_server.service.sampler import SAMPLER
+from crac_server.service.tracking import TRACKER
+import grpc
+
+
+logger = logging.getLogger("crac_server.simulation")
+# the statuses an expect command compares, by field of the snapshot
+STATUSES = {
+    "roof": RoofStatus,
+    "curtain_east": CurtainStatus,
+    "curtain_west": CurtainStatus,
+    "telescope": TelescopeStatus,
+    "speed": TelescopeSpeed,
+    "tele_switch": ButtonStatus,
+    "ccd_switch": ButtonStatus,
+    "flat_light": ButtonStatus,
+    "dome_light": ButtonStatus,
+}
+
+
+class Command(NamedTuple):
+    time: float
+    device: str
+    args: tuple[str, ...]
+    line: int
+
+    @staticmethod
+    def parse(path: str) -> list["Command"]:
+        commands = []
+        with open(path) as script:
+            for number, line in enumerate(script, 1):
+                fields = line.split("#")[0].split()
+                if fields:
+                    commands.append(Command(float(fields[0]), fields[1], tuple(fields[2:]), number))
+        return sorted(commands, key=lambda command: (command.time, command.line))
+
+
+class Latency:
+
+    """ Wall clock seconds of the RPCs, by method """
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def add(self, method: str, seconds: float, failed: bool) -> None:
+        with self.lock:
+            self.samples.setdefault(method, []).append(seconds)
+            if failed:
+                self.errors[method] = self.errors.get(method, 0) + 1
+
+    def report(self) -> list[str]:
+        lines = [f"{'method':<22}{'calls':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for method, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            percentile = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+            lines.append(
+                f"{method:<22}{len(samples):>9}{self.errors.get(method, 0):>8}"
+                f"{percentile(0.5):>10.2f}{percentile(0.95):>10.2f}{percentile(0.99):>10.2f}{samples[-1] * 1000:>10.2f}"
+            )
+        return lines
+
+
+class Simulation:
+
+    """
+        Replay a night script against the services, with clients virtual clients
+        polling one of the status RPCs every poll seconds. The first poll of each client
+        falls on a multiple of tick, so that many clients call at the same instant
+    """
+
+    def __init__(
+        self,
+        clock: VirtualClock,
+        commands: list[Command],
+        clients: int = 100,
+        poll: float = 1.0,
+        tick: float = 0.1,
+        concurrency: int = 64,
+        slew_rate: float | None = None,
+        seed: int = 0,
+    ):
+        self.clock = clock
+        self.commands = commands
+        self.clients = clients
+        self.poll = poll
+        self.tick = tick
+        if slew_rate is not None:
+            TELESCOPE.device.slew_rate = slew_rate
+        self.random = random.Random(seed)
+        self.latency = Latency()
+        self.failures: list[str] = []
+        self.pool = futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="client")
+        self.__calls__: list[futures.Future] = []
+        self.__running__ = False
+
+        self.server = grpc.server(
+            futures.ThreadPoolExecutor(max_workers=Config.getInt("max_workers", "server")),
+            interceptors=(MetricsInterceptor(),),
+            **app.server_settings()
+        )
+        app.add_servicers(self.server)
+        port = self.server.add_insecure_port("127.0.0.1:0")
+        self.channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+        self.roof = RoofStub(self.channel)
+        self.curtains = CurtainStub(self.channel)
+        self.telescope = TelescopeStub(self.channel)
+        self.buttons = ButtonStub(self.channel)
+        self.polls = (
+            ("Roof/SetAction", self.roof.SetAction, RoofRequest(action=RoofAction.CHECK_ROOF)),
+            ("Curtain/SetAction", self.curtains.SetAction, CurtainsRequest(action=CurtainsAction.CHECK_CURTAIN)),
+            ("Telescope/SetAction", self.telescope.SetAction, TelescopeRequest(action=TelescopeAction.CHECK_TELESCOPE)),
+            ("Button/GetStatus", self.buttons.GetStatus, Empty()),
+        )
+
+    def run(self, duration: float | None = None) -> bool:
+
+        """ Run until duration seconds of simulated time (the last command by default), True if nothing failed """
+
+        end = duration if duration is not None else max((command.time for command in self.commands), default=0)
+        self.server.start()
+        SAMPLER.drive(self.clock)
+        TRACKER.drive(self.clock)
+        for command in self.commands:
+            self.clock.call_later(command.time - self.clock.now(), self.__command__, command)
+        for client in range(self.clients):
+            phase = round(self.random.uniform(0, self.poll) / self.tick) * self.tick
+            self.clock.call_later(phase, self.__poll__, client)
+        start = perf_counter()
+        self.__running__ = True
+        try:
+            while True:
+                deadline = self.clock.next_deadline()
+                if deadline is None or deadline > end:
+                    break
+                while self.clock.next_deadline() == deadline:
+                    self.clock.step()
+                self.__flush__()
+            self.clock.advance(end - self.clock.now())
+        finally:
+            self.__running__ = False
+            SAMPLER.stop()
+            TRACKER.stop()
+            # let the operations still waiting for the simulators (e.g. a slew) finish
+            while self.clock.step():
+                pass
+            self.server.stop(None)
+            self.pool.shutdown()
+        elapsed = perf_counter() - start
+        calls = sum(len(samples) for samples in self.latency.samples.values())
+        print(f"{end:.0f} s simulated in {elapsed:.2f} s, {calls} calls ({calls / max(elapsed, 1e-9):.0f}/s)")
+        print("\n".join(self.latency.report()))
+        for failure in self.failures:
+            print(f"FAILED {failure}")
+        return not self.failures and not self.latency.errors
+
+    def __poll__(self, client: int):
+        if not self.__running__:
+            return
+        method, rpc, request = self.random.choice(self.polls)
+        self.__calls__.append(self.pool.submit(self.__request__, method, rpc, request))
+        self.clock.call_later(self.poll, self.__poll__, client)
+
+    def __request__(self, method: str, rpc, request):
+        start = perf_counter()
+        try:
+            rpc(request)
+        except grpc.RpcError as err:
+            logger.error("%s failed: %s", method, err)
+            self.latency.add(method, perf_counter() - start, True)
+        else:
+            self.latency.add(method, perf_counter() - start, False)
+
+    def __flush__(self):
+
+        """ Wait for the RPCs of the clients issued at this instant """
+
+        calls, self.__calls__ = self.__calls__, []
+        futures.wait(calls)
+
+    def __command__(self, command: Command):
+        if not self.__running__:
+            return
+        logger.info("%.1f s, line %s: %s %s", self.clock.now(), command.line, command.device, " ".join(command.args))
+        try:
+            if command.device == "expect":
+                self.__expect__(command, *command.args)
+            elif command.device == "slew":
+                self.__slew__(float(command.args[0]), float(command.args[1]))
+            elif command.device == "roof":
+                self.__set_action__("Roof/SetAction", self.roof.SetAction, RoofRequest(action=RoofAction.Value(command.args[0])))
+            elif command.device == "curtains":
+                self.__set_action__("Curtain/SetAction", self.curtains.SetAction, CurtainsRequest(action=CurtainsAction.Value(command.args[0])))
+            elif command.device == "telescope":
+                self.__set_action__("Telescope/SetAction", self.telescope.SetAction, TelescopeRequest(action=TelescopeAction.Value(command.args[0])))
+            elif command.device == "button":
+                request = ButtonRequest(type=ButtonType.Value(command.args[0]), action=ButtonAction.Value(command.args[1]))
+                self.__set_action__("Button/SetAction", self.buttons.SetAction, request)
+            else:
+                raise ValueError(f"unknown device {command.device}")
+        except (ValueError, IndexError) as err:
+            self.failures.append(f"line {command.line}: {err}")
+
+    def __set_action__(self, method: str, rpc, request):
+
+        """
+            Call a command and, when it starts an operation, let the operation reach
+            the point where it waits for the simulated hardware before the time moves on
+        """
+
+        scheduled = self.clock.scheduled
+        start = perf_counter()
+        try:
+            _, call = rpc.with_call(request)
+        except grpc.RpcError as err:
+            self.latency.add(method, perf_counter() - start, True)
+            self.failures.append(f"{method} {request}: {err}")
+            return
+        self.latency.add(method, perf_counter() - start, False)
+        operation_id = dict(call.trailing_metadata() or ()).get(OPERATION_ID)
+        operation = OPERATIONS.get(operation_id) if operation_id else None
+        deadline = perf_counter() + 1
+        while operation and perf_counter() < deadline:
+            if operation.wait(0.001) or self.clock.wait_scheduled(scheduled, 0.001):
+                break
+
+    def __slew__(self, alt: float, az: float):
+
+        """ Slew the telescope to alt, az on the clock of the simulator, then track """
+
+        TELESCOPE.move(AltazimutalCoords(alt=alt, az=az), TelescopeSpeed.SPEED_TRACKING)
+
+    def __expect__(self, command: Command, field: str, expected: str, tolerance: str = "0"):
+        snapshot = SAMPLER.refresh()
+        actual = getattr(snapshot, field)
+        if field in STATUSES:
+            value = STATUSES[field].Value(expected)
+            passed = actual == value
+            shown = STATUSES[field].Name(actual)
+        else:
+            passed = abs(actual - float(expected)) <= float(tolerance)
+            shown = actual
+        if not passed:
+            self.failures.append(f"line {command.line} at {self.clock.now():.1f} s: {field} is {shown}, expected {expected}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay a night of commands against a simulated observatory")
+    parser.add_argument("script", help="night script, one 'seconds device arguments' command per line")
+    parser.add_argument("--clients", type=int, default=100, help="virtual clients polling the status")
+    parser.add_argument("--poll", type=float, default=1.0, help="seconds between two polls of a client")
+    parser.add_argument("--tick", type=float, default=0.1, help="resolution of the poll instants, in seconds")
+    parser.add_argument("--concurrency", type=int, default=64, help="RPCs in flight at the same instant")
+    parser.add_argument("--slew-rate", type=float, help="slew speed of the telescope, degrees per second (slew_rate of [simulator] by default)")
+    parser.add_argument("--duration", type=float, help="simulated seconds, the last command by default")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if not isinstance(CLOCK, VirtualClock):
+        parser.error("the simulation needs the virtual clock, set SIMULATOR_CLOCK_SPEED=0")
+    simulation = Simulation(
+        CLOCK,
+        Command.parse(args.script),
+        clients=args.clients,
+        poll=args.poll,
+        tick=args.tick,
+        concurrency=args.concurrency,
+        slew_rate=args.slew_rate,
+        seed=args.seed,
+    )
+    return 0 if simulation.run(args.duration) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import os
+
+# the services import the devices as crac_server/app.py does, on the mock pins and the simulators
+os.environ.setdefault("GPIOZERO_PIN_FACTORY", "mock")
+os.environ.setdefault("TELESCOPE_DRIVER", "simulator")
@@ -0,0 +1,66 @@
+import threading
+from crac_server.component.clock import VirtualClock
+
+
+def test_step_runs_the_next_callback_at_its_deadline():
+    clock = VirtualClock()
+    calls = []
+    clock.call_later(2, lambda: calls.append(("b", clock.now())))
+    clock.call_later(1, lambda: calls.append(("a", clock.now())))
+    assert clock.step()
+    assert calls == [("a", 1)]
+    assert clock.step()
+    assert calls == [("a", 1), ("b", 2)]
+    assert not clock.step()
+    assert clock.now() == 2
+
+
+def test_advance_runs_only_the_callbacks_due():
+    clock = VirtualClock()
+    calls = []
+    for delay in (3, 1, 2, 10):
+        clock.call_later(delay, calls.append, delay)
+    clock.advance(5)
+    assert calls == [1, 2, 3]
+    assert clock.now() == 5
+    assert clock.pending == 1
+    assert clock.next_deadline() == 10
+
+
+def test_callbacks_scheduled_while_advancing_run_in_order():
+    clock = VirtualClock()
+    calls = []
+
+    def tick(count):
+        calls.append(clock.now())
+        if count:
+            clock.call_later(0.5, tick, count - 1)
+
+    clock.call_later(0.5, tick, 3)
+    clock.advance(10)
+    assert calls == [0.5, 1.0, 1.5, 2.0]
+    assert clock.now() == 10
+
+
+def test_sleep_wakes_up_when_the_time_is_reached():
+    clock = VirtualClock()
+    since = clock.scheduled
+    woken = threading.Event()
+
+    def sleeper():
+        clock.sleep(30)
+        woken.set()
+
+    thread = threading.Thread(target=sleeper)
+    thread.start()
+    assert clock.wait_scheduled(since, 5)
+    clock.advance(29)
+    assert not woken.is_set()
+    clock.advance(1)
+    assert woken.wait(5)
+    thread.join()
+
+
+def test_to_unix_counts_the_simulated_seconds():
+    clock = VirtualClock()
+    assert clock.to_unix(60) - clock.to_unix(0) == 60
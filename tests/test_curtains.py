@@ -0,0 +1,104 @@
+import pytest
+from gpiozero import Device
+from gpiozero.pins.mock import MockFactory
+from crac_protobuf.curtains_pb2 import CurtainStatus
+from crac_server.component.curtains.curtains import Curtain
+
+
+# seconds between two edges of the encoder
+EDGE_INTERVAL = 0.2
+
+
+class TimedCurtain(Curtain):
+
+    """ A curtain on mock pins, whose encoder edges are timed by the test """
+
+    def __init__(self, stop_latency: float):
+        self.time = 0.0
+        super().__init__(
+            {"a": 5, "b": 6, "max_steps": 360},
+            {"pin": 8, "pull_up": True},
+            {"pin": 7, "pull_up": True},
+            {"forward": 2, "backward": 3, "enable": 4, "pwm": False},
+        )
+        self.__stop_latency__ = stop_latency
+
+    def __now__(self) -> float:
+        return self.time
+
+    def edges(self, to: int) -> int | None:
+
+        """ Move the encoder one step at a time towards to, return the steps at which the motor stopped """
+
+        direction = 1 if to > self.steps() else -1
+        for steps in range(self.steps() + direction, to + direction, direction):
+            self.time += EDGE_INTERVAL
+            self.rotary_encoder.steps = steps
+            self.__check_and_stop__()
+            if not self.motor.value:
+                return steps
+        return None
+
+
+@pytest.fixture
+def curtain():
+    Device.pin_factory = MockFactory()
+    curtain = TimedCurtain(stop_latency=1.0)
+    curtain.enable()
+    yield curtain
+    curtain.__remove_event_detect__()
+    Device.pin_factory.reset()
+
+
+def start_at(curtain: TimedCurtain, steps: int):
+    curtain.rotary_encoder.steps = steps
+    assert curtain.get_status() is CurtainStatus.CURTAIN_STOPPED
+
+
+def test_intermediate_target_stops_ahead_by_the_latency(curtain):
+    start_at(curtain, 100)
+    curtain.move(200)
+    # 1 s of latency at 5 steps per second
+    assert curtain.edges(200) == 195
+    assert curtain.target is None
+
+
+def test_intermediate_target_while_closing(curtain):
+    start_at(curtain, 200)
+    curtain.move(100)
+    assert curtain.edges(100) == 105
+
+
+def test_without_latency_stops_on_the_target(curtain):
+    curtain.__stop_latency__ = 0
+    start_at(curtain, 100)
+    curtain.move(200)
+    assert curtain.edges(200) == 200
+
+
+def test_open_up_runs_until_the_limit_switch(curtain):
+    start_at(curtain, 300)
+    curtain.open_up()
+    assert curtain.edges(349) is None
+    assert curtain.get_status() is CurtainStatus.CURTAIN_OPENING
+    curtain.curtain_open.pin.drive_low()
+    assert curtain.get_status() is CurtainStatus.CURTAIN_OPENED
+    assert curtain.steps() == 350
+    assert curtain.target is None
+
+
+def test_disable_runs_until_the_limit_switch(curtain):
+    start_at(curtain, 50)
+    curtain.disable()
+    assert curtain.edges(1) is None
+    assert curtain.get_status() is CurtainStatus.CURTAIN_DISABLING
+    curtain.curtain_closed.pin.drive_low()
+    assert curtain.get_status() is CurtainStatus.CURTAIN_DISABLED
+    assert curtain.steps() == 0
+
+
+def test_security_step_stops_without_the_limit_switch(curtain):
+    start_at(curtain, 340)
+    curtain.open_up()
+    # the switch never comes
+    assert curtain.edges(360) == 360
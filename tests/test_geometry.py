@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from crac_server.component.curtains.geometry import CurtainGeometry, Profile
+
+
+N_STEP_CORSA = 350
+
+
+def geometry(profile_est: Profile | None = None, profile_west: Profile | None = None) -> CurtainGeometry:
+    ramp = Profile([(0, 0), (70, N_STEP_CORSA)])
+    return CurtainGeometry(N_STEP_CORSA, 10, 70, 70, 20, 160, 190, 340, profile_est or ramp, profile_west or ramp)
+
+
+def old_ramp(alt: float, park: float = 0, max_alt: float = 70) -> int:
+    # the linear ramp computed on every request before the prebuilt geometry
+    increment = (max_alt - park) / N_STEP_CORSA
+    return round((alt - park) / increment)
+
+
+@pytest.mark.parametrize("alt", np.arange(10.25, 70, 0.25))
+def test_steps_match_the_old_ramp(alt):
+    curtains = geometry()
+    assert curtains.steps(alt, 90) == (old_ramp(alt), N_STEP_CORSA)
+    assert curtains.steps(alt, 270) == (N_STEP_CORSA, old_ramp(alt))
+
+
+def test_steps_outside_the_curtains_area():
+    curtains = geometry()
+    assert curtains.steps(5, 90) == (0, 0)
+    assert curtains.steps(10, 270) == (0, 0)
+    assert curtains.steps(75, 90) == (N_STEP_CORSA, N_STEP_CORSA)
+    # north and south, out of the azimuth of both the curtains
+    assert curtains.steps(40, 0) == (N_STEP_CORSA, N_STEP_CORSA)
+    assert curtains.steps(40, 180) == (N_STEP_CORSA, N_STEP_CORSA)
+
+
+def test_steps_many_match_steps():
+    curtains = geometry(profile_est=Profile([(0, 0), (30, 160), (70, 350)]))
+    alt, az = np.meshgrid(np.arange(0, 90, 2.5), np.arange(0, 360, 10))
+    east, west = curtains.steps_many(alt.ravel(), az.ravel())
+    expected = [curtains.steps(a, z) for a, z in zip(alt.ravel(), az.ravel())]
+    assert list(zip(east.tolist(), west.tolist())) == expected
+
+
+def test_profile_interpolates_between_the_knots():
+    profile = Profile([(0, 0), (30, 160), (70, 350)])
+    assert profile.at(15) == 80
+    assert profile.at(50) == 255
+    assert profile.at(-5) == 0
+    assert profile.at(80) == 350
+    assert profile.at_many(np.array([15, 50])).tolist() == [80, 255]
+
+
+def test_profile_parse():
+    assert Profile.parse("0:0, 30:160,70:350") == [(0, 0), (30, 160), (70, 350)]
+    assert Profile.parse("") == []
+
+
+@pytest.mark.parametrize("knots", [[(0, 0)], [(0, 0), (30, 160), (20, 350)]])
+def test_profile_rejects_invalid_knots(knots):
+    with pytest.raises(ValueError):
+        Profile(knots)
@@ -0,0 +1,60 @@
+from time import sleep
+import pytest
+from crac_protobuf.telescope_pb2 import EquatorialCoords, TelescopeSpeed
+from crac_server.component.telescope.indi.server import IndiServer, Mount
+from crac_server.component.telescope.indi.telescope import DEVICE, Telescope
+
+
+@pytest.fixture
+def mount():
+    mount = Mount(slew_rate=20)
+    mount.switches["TELESCOPE_PARK"].update(PARK=False, UNPARK=True)
+    return mount
+
+
+@pytest.fixture
+def telescope(mount):
+    # a slow network that delivers the messages late and in pieces
+    server = IndiServer(mount, "127.0.0.1", 0, latency=0.005, jitter=0.01, fragment=8, period=0.05, seed=1)
+    _, port = server.start()
+    telescope = Telescope(hostname="127.0.0.1", port=port, timeout=5, max_staleness=0)
+    telescope.open_connection()
+    yield telescope
+    telescope.disconnect()
+    server.stop()
+
+
+def send(telescope: Telescope, xml: str):
+    return telescope.client.wait_all(telescope.client.transaction([("EQUATORIAL_EOD_COORD", xml)]))[0]
+
+
+def test_sync(telescope, mount):
+    telescope.sync()
+    assert telescope.sync_status
+    eq_coords = telescope.get_eq_coords()
+    ra, dec = mount.__target__
+    assert eq_coords.ra == pytest.approx(ra, abs=0.01)
+    assert eq_coords.dec == pytest.approx(dec, abs=0.01)
+
+
+def test_move_is_busy_until_the_mount_gets_there(telescope):
+    telescope.move(EquatorialCoords(ra=1, dec=10))
+    assert telescope.get_speed() is TelescopeSpeed.SPEED_SLEWING
+    # 15 degrees at 20 degrees per second
+    sleep(1)
+    assert telescope.get_speed() is TelescopeSpeed.SPEED_TRACKING
+    eq_coords = telescope.get_eq_coords()
+    assert (eq_coords.ra, eq_coords.dec) == (1, 10)
+
+
+def test_parked_mount_refuses_to_move(telescope, mount):
+    mount.switches["TELESCOPE_PARK"].update(PARK=True, UNPARK=False)
+    ack = send(telescope, f'<newNumberVector device="{DEVICE}" name="EQUATORIAL_EOD_COORD"><oneNumber name="RA">1</oneNumber></newNumberVector>')
+    assert ack.get("state") == "Alert"
+
+
+def test_invalid_coordinates_are_refused(telescope):
+    ack = send(telescope, f'<newNumberVector device="{DEVICE}" name="EQUATORIAL_EOD_COORD"><oneNumber name="RA">one</oneNumber></newNumberVector>')
+    assert ack.get("state") == "Alert"
+    # the connection is still served
+    assert telescope.get_speed() is not TelescopeSpeed.SPEED_ERROR
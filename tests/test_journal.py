@@ -0,0 +1,57 @@
+import pytest
+from crac_server.component.curtains.journal import EncoderJournal
+
+
+def move(journal: EncoderJournal, start: float, steps: int, count: int, rate: float, direction: int = 1) -> float:
+    for edge in range(1, count + 1):
+        journal.record(start + edge / rate, steps + direction * edge)
+    return start + count / rate
+
+
+def test_velocity_of_a_steady_movement():
+    journal = EncoderJournal(64)
+    end = move(journal, 0, 0, 20, 5)
+    assert journal.velocity(end) == pytest.approx(5)
+    assert journal.velocity(end + 2) == 0
+
+
+def test_velocity_ignores_the_previous_movement():
+    journal = EncoderJournal(64)
+    end = move(journal, 0, 0, 50, 5)
+    start = end + 190
+    journal.record(start + 0.2, 51)
+    # a single edge after a pause is not a velocity, not 1 step over minutes
+    assert journal.velocity(start + 0.2) == 0
+    assert journal.velocity(start + 0.2, start=(start, 50)) == pytest.approx(5)
+
+
+def test_velocity_after_a_movement_in_the_other_direction():
+    journal = EncoderJournal(64)
+    end = move(journal, 0, 100, 50, 5, direction=-1)
+    start = end + 30
+    move(journal, start, 50, 3, 5)
+    assert journal.velocity(start + 0.6, start=(start, 50)) == pytest.approx(5)
+    assert journal.velocity(start + 0.6) == pytest.approx(5)
+
+
+def test_velocity_window_counts_the_start():
+    journal = EncoderJournal(64)
+    move(journal, 10, 0, 20, 5)
+    assert journal.velocity(14, window=4, start=(10, 0)) == pytest.approx(5)
+
+
+def test_ring_keeps_the_last_edges():
+    journal = EncoderJournal(4)
+    move(journal, 0, 0, 10, 1)
+    assert len(journal) == 4
+    assert [steps for _, steps, _ in journal.entries()] == [7, 8, 9, 10]
+    assert journal.last() == (10.0, 10, 1)
+
+
+def test_downsample_keeps_the_last_edge():
+    journal = EncoderJournal(100)
+    move(journal, 0, 0, 100, 1)
+    points = journal.downsample(10)
+    assert len(points) == 10
+    assert points[-1] == journal.last()
+    assert journal.downsample(0) == journal.entries()
@@ -0,0 +1,36 @@
+from crac_protobuf.button_pb2 import ButtonStatus
+from crac_protobuf.telescope_pb2 import TelescopeSpeed, TelescopeStatus
+from crac_server.service import sampler
+
+
+class Switch:
+
+    def get_status(self):
+        return ButtonStatus.ON
+
+
+class BrokenTelescope:
+
+    sync_status = False
+
+    def get_aa_coords(self):
+        raise TimeoutError("No answer from the INDI server")
+
+
+def test_a_telescope_error_doesnt_stop_the_other_reads(monkeypatch):
+    monkeypatch.setattr(sampler, "TELE_SWITCH", Switch())
+    monkeypatch.setattr(sampler, "TELESCOPE", BrokenTelescope())
+    snapshot = sampler.Sampler().refresh()
+    assert snapshot.telescope is TelescopeStatus.ERROR
+    assert snapshot.speed is TelescopeSpeed.SPEED_ERROR
+    assert snapshot.roof == sampler.ROOF.get_status()
+    assert snapshot.curtain_east_steps == sampler.CURTAIN_EAST.steps()
+
+
+def test_latest_reads_again_a_snapshot_too_old(monkeypatch):
+    devices = sampler.Sampler(max_age=60)
+    monkeypatch.setattr(devices, "__driven__", True)
+    first = devices.latest()
+    assert devices.latest() is first
+    devices.max_age = 0
+    assert devices.latest().tick > first.tick
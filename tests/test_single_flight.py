@@ -0,0 +1,88 @@
+import threading
+import pytest
+from crac_server.component.single_flight import Coalesced, SingleFlight
+
+
+class Device:
+
+    def __init__(self):
+        self.reads = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def get_status(self):
+        self.release.wait(5)
+        self.reads += 1
+        return self.reads
+
+    def get_speed(self, scale):
+        return scale * 2
+
+    def stop(self):
+        pass
+
+
+def test_concurrent_reads_share_one_read():
+    device = Device()
+    device.release.clear()
+    flight = SingleFlight(freshness=60)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do(("device", "get_status"), device.get_status)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    device.release.set()
+    for thread in threads:
+        thread.join()
+    assert device.reads == 1
+    assert results == [1] * 8
+
+
+def test_read_is_reused_for_freshness_seconds():
+    device = Device()
+    fresh = SingleFlight(freshness=60)
+    assert fresh.do(("device", "get_status"), device.get_status) == 1
+    assert fresh.do(("device", "get_status"), device.get_status) == 1
+    stale = SingleFlight(freshness=0)
+    assert stale.do(("device", "get_status"), device.get_status) == 2
+    assert stale.do(("device", "get_status"), device.get_status) == 3
+
+
+def test_errors_are_not_reused():
+    flight = SingleFlight(freshness=60)
+    calls = []
+
+    def read():
+        calls.append(None)
+        if len(calls) == 1:
+            raise OSError("read failed")
+        return len(calls)
+
+    with pytest.raises(OSError):
+        flight.do(("device", "get_status"), read)
+    assert flight.do(("device", "get_status"), read) == 2
+
+
+def test_invalidate_forgets_the_reads_of_the_owner():
+    device = Device()
+    flight = SingleFlight(freshness=60)
+    flight.do(("device", "get_status"), device.get_status)
+    flight.do(("other", "get_status"), lambda: "other")
+    flight.invalidate("device")
+    assert flight.do(("device", "get_status"), device.get_status) == 2
+    assert flight.do(("other", "get_status"), lambda: "new") == "other"
+
+
+def test_coalesced_commands_invalidate_the_reads():
+    device = Device()
+    proxy = Coalesced(device, ("get_status",), SingleFlight(freshness=60), ("get_speed",))
+    assert proxy.get_status() == 1
+    assert proxy.get_status() == 1
+    # a pure method computes from its arguments, the cached reads are still valid
+    assert proxy.get_speed(3) == 6
+    assert proxy.get_status() == 1
+    proxy.stop()
+    assert proxy.get_status() == 2
+    assert proxy.device is device
@@ -0,0 +1,151 @@
+import threading
+import pytest
+from crac_protobuf.button_pb2 import ButtonStatus
+from crac_protobuf.curtains_pb2 import CurtainStatus
+from crac_protobuf.roof_pb2 import RoofStatus
+from crac_protobuf.telescope_pb2 import TelescopeSpeed, TelescopeStatus
+from crac_server.component.clock import VirtualClock
+from crac_server.component.operation import OperationManager
+from crac_server.service import tracking
+from crac_server.service.sampler import Snapshot
+
+
+def snapshot(
+    alt: float = 40,
+    az: float = 90,
+    east: int = 0,
+    west: int = 0,
+    speed: int = TelescopeSpeed.SPEED_TRACKING,
+    status: int = CurtainStatus.CURTAIN_STOPPED,
+) -> Snapshot:
+    return Snapshot(
+        tick=0,
+        timestamp=0,
+        sampled=0,
+        roof=RoofStatus.ROOF_OPENED,
+        roof_motor=False,
+        roof_open_switch=True,
+        roof_closed_switch=False,
+        curtain_east=status,
+        curtain_east_steps=east,
+        curtain_west=status,
+        curtain_west_steps=west,
+        telescope=TelescopeStatus.EAST,
+        alt=alt,
+        az=az,
+        speed=speed,
+        sync=True,
+        tele_switch=ButtonStatus.ON,
+        ccd_switch=ButtonStatus.OFF,
+        flat_light=ButtonStatus.OFF,
+        dome_light=ButtonStatus.OFF,
+    )
+
+
+class Sampler:
+
+    def __init__(self):
+        self.snapshot = snapshot()
+        self.refreshes = 0
+
+    def latest(self) -> Snapshot:
+        return self.snapshot
+
+    def refresh(self) -> Snapshot:
+        self.refreshes += 1
+        return self.snapshot
+
+
+class Curtain:
+
+    def __init__(self):
+        self.moves = []
+
+    def move(self, steps: int):
+        self.moves.append(steps)
+
+
+@pytest.fixture
+def curtains(monkeypatch):
+    east, west = Curtain(), Curtain()
+    monkeypatch.setattr(tracking, "CURTAIN_EAST", east)
+    monkeypatch.setattr(tracking, "CURTAIN_WEST", west)
+    monkeypatch.setattr(tracking, "OPERATIONS", OperationManager(max_workers=1))
+    return east, west
+
+
+@pytest.fixture
+def tracker():
+    clock = VirtualClock()
+    tracker = tracking.CurtainTracker(Sampler(), interval=1, deadband=5, dwell=3)
+    tracker.drive(clock)
+    yield tracker, clock
+    tracker.stop()
+
+
+def test_moves_the_curtain_in_front_of_the_telescope(tracker, curtains):
+    tracker, clock = tracker
+    east, west = curtains
+    tracker.sampler.snapshot = snapshot(alt=40, az=90, east=0, west=350)
+    clock.advance(1)
+    # 40 degrees of the linear ramp from 0 to 70
+    assert east.moves == [200]
+    assert west.moves == []
+    assert tracker.sampler.refreshes == 1
+
+
+def test_deadband(tracker, curtains):
+    tracker, clock = tracker
+    east, _ = curtains
+    tracker.sampler.snapshot = snapshot(east=196, west=350)
+    clock.advance(1)
+    assert east.moves == []
+    tracker.sampler.snapshot = snapshot(east=194, west=350)
+    clock.advance(1)
+    assert east.moves == [200]
+
+
+def test_the_ends_are_always_reached(tracker, curtains):
+    tracker, clock = tracker
+    east, west = curtains
+    # below max_secure_alt both the curtains close, however near they are
+    tracker.sampler.snapshot = snapshot(alt=5, east=2, west=1)
+    clock.advance(1)
+    assert east.moves == [0]
+    assert west.moves == [0]
+
+
+def test_min_dwell(tracker, curtains):
+    tracker, clock = tracker
+    east, _ = curtains
+    tracker.sampler.snapshot = snapshot(alt=40, east=0, west=350)
+    clock.advance(1)
+    tracker.sampler.snapshot = snapshot(alt=60, east=200, west=350)
+    clock.advance(2)
+    assert east.moves == [200]
+    clock.advance(1)
+    assert east.moves == [200, 300]
+
+
+def test_nothing_moves_while_slewing_or_moving(tracker, curtains):
+    tracker, clock = tracker
+    east, _ = curtains
+    tracker.sampler.snapshot = snapshot(east=0, west=350, speed=TelescopeSpeed.SPEED_SLEWING)
+    clock.advance(1)
+    tracker.sampler.snapshot = snapshot(east=0, west=350, status=CurtainStatus.CURTAIN_OPENING)
+    clock.advance(1)
+    assert east.moves == []
+
+
+def test_nothing_moves_while_calibrating(tracker, curtains):
+    tracker, clock = tracker
+    east, _ = curtains
+    calibrated = threading.Event()
+    operation = tracking.OPERATIONS.start("curtains", lambda _: calibrated.wait(5))
+    tracker.sampler.snapshot = snapshot(east=0, west=350)
+    clock.advance(1)
+    assert east.moves == []
+    calibrated.set()
+    operation.wait(5)
+    clock.advance(1)
+    assert east.moves == [200]
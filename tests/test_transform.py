@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from crac_protobuf.telescope_pb2 import AltazimutalCoords, EquatorialCoords
+from crac_server.component.telescope.transform import TransformEngine
+
+
+# the bound of the fast path stated by TransformEngine, in degrees
+MAX_ERROR = 30 / 3600
+OBSTIME = datetime(2022, 3, 21, 22, 0, 0)
+
+
+def engine(fast: bool) -> TransformEngine:
+    return TransformEngine(lat="42d13.76m", lon="+12d48.69m", height=465, equinox="J2022.1", bucket=300, fast=fast)
+
+
+def separation(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    lon1, lat1, lon2, lat2 = np.radians([lon1, lat1, lon2, lat2])
+    cos = np.sin(lat1) * np.sin(lat2) + np.cos(lat1) * np.cos(lat2) * np.cos(lon1 - lon2)
+    return float(np.degrees(np.arccos(np.clip(cos, -1, 1))))
+
+
+@pytest.fixture(scope="module")
+def engines() -> tuple[TransformEngine, TransformEngine]:
+    return engine(fast=True), engine(fast=False)
+
+
+# the start, the middle and the end of a bucket
+@pytest.mark.parametrize("seconds", [0, 150, 299])
+def test_fast_radec2altaz_within_30_arcsec(engines, seconds):
+    fast, exact = engines
+    obstime = OBSTIME + timedelta(seconds=seconds)
+    for ra in np.arange(0, 24, 3):
+        for dec in (-20, 0, 30, 60, 85):
+            eq_coords = EquatorialCoords(ra=ra, dec=dec)
+            expected = exact.radec2altaz(eq_coords, obstime)
+            got = fast.radec2altaz(eq_coords, obstime)
+            assert separation(got.az, got.alt, expected.az, expected.alt) < MAX_ERROR
+
+
+@pytest.mark.parametrize("seconds", [0, 150, 299])
+def test_fast_altaz2radec_within_30_arcsec(engines, seconds):
+    fast, exact = engines
+    obstime = OBSTIME + timedelta(seconds=seconds)
+    for alt in (5, 30, 60, 85):
+        for az in np.arange(0, 360, 45):
+            aa_coords = AltazimutalCoords(alt=alt, az=az)
+            expected = exact.altaz2radec(aa_coords, obstime)
+            got = fast.altaz2radec(aa_coords, obstime)
+            assert separation(got.ra * 15, got.dec, expected.ra * 15, expected.dec) < MAX_ERROR
+
+
+def test_batch_conversions_match_the_scalar_ones(engines):
+    _, exact = engines
+    obstime = [OBSTIME, OBSTIME + timedelta(minutes=30)]
+    ra = np.array([0.5, 6, 12.25, 18])
+    dec = np.array([-10, 20, 45, 80])
+    alt, az = exact.radec2altaz_batch(ra, dec, np.array(obstime)[:, None])
+    assert alt.shape == (2, 4)
+    for i, time in enumerate(obstime):
+        for j in range(len(ra)):
+            aa_coords = exact.radec2altaz(EquatorialCoords(ra=ra[j], dec=dec[j]), time)
+            assert separation(az[i, j], alt[i, j], aa_coords.az, aa_coords.alt) < 1 / 3600
+    back_ra, back_dec = exact.altaz2radec_batch(alt, az, np.array(obstime)[:, None])
+    for i, time in enumerate(obstime):
+        for j in range(len(ra)):
+            eq_coords = exact.altaz2radec(AltazimutalCoords(alt=alt[i, j], az=az[i, j]), time)
+            assert separation(back_ra[i, j] * 15, back_dec[i, j], eq_coords.ra * 15, eq_coords.dec) < 1 / 3600